@@ -0,0 +1,9 @@
+"""
+benchmarks - Бенчмарки производительности API друзей.
+
+Скрипты запускаются из каталога drf, например:
+    python -m benchmarks.mutual_friends --friends 10000
+
+Каждый скрипт создает отдельную тестовую базу, заполняет ее синтетическими
+данными и печатает результаты замеров.
+"""
@@ -0,0 +1,49 @@
+"""
+Микробенчмарки эндпоинтов friends для pytest-benchmark.
+
+Файл не попадает в обычный прогон тестов (python_files в pytest.ini) и запускается явно
+из каталога drf:
+    pytest benchmarks/bench_endpoints.py --benchmark-autosave
+    pytest benchmarks/bench_endpoints.py --benchmark-compare --benchmark-compare-fail=median:20%
+
+Граф создается один раз на каждый эндпоинт (benchmarks.graphs), запросы выполняются
+от имени пользователя на 99-м перцентиле числа друзей; кэш ответов отключен.
+"""
+
+import pytest
+
+from benchmarks import graphs
+from benchmarks.endpoints import ENDPOINTS, make_caller, prepare
+
+pytest.importorskip("pytest_benchmark")
+
+USERS = 1000
+ROUNDS = 50
+
+
+@pytest.fixture
+def actor(db, settings):
+    """
+    Синтетический граф с распределением степеней по степенному закону; возвращает (пользователь, токен).
+    """
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    settings.FRIENDS_RESPONSE_CACHE = {**settings.FRIENDS_RESPONSE_CACHE, "TIMEOUT": 0}
+    seeded = graphs.seed_graph(USERS, distribution="powerlaw", avg_degree=10)
+    user = User.objects.get(pk=seeded.user_at_percentile(99))
+    return user, Token.objects.get(user=user).key
+
+
+@pytest.mark.parametrize("endpoint", list(ENDPOINTS))
+def test_endpoint(benchmark, actor, endpoint):
+    user, token = actor
+    call = make_caller(endpoint, token)
+    payloads = iter(prepare(endpoint, user, ROUNDS + 1, tag=f"bench_{endpoint}_"))
+
+    def setup():
+        # Для записи каждому раунду нужны свои данные: заявку нельзя принять дважды
+        return (next(payloads),), {}
+
+    status, _, _ = benchmark.pedantic(call, setup=setup, rounds=ROUNDS, warmup_rounds=1)
+    assert status == ENDPOINTS[endpoint][2]
@@ -0,0 +1,160 @@
+import json
+import os
+import platform
+import statistics
+import time
+
+import django
+
+
+def configure_django():
+    """
+    Загружает настройки проекта и инициализирует приложения Django без создания базы.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drf.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    django.setup()
+
+
+def setup_django(test_name=None):
+    """
+    Настраивает Django и создает пустую тестовую базу с примененными миграциями.
+
+    :param test_name: Имя тестовой базы; для SQLite по умолчанию база создается в памяти,
+        а бенчмаркам с параллельной записью из нескольких потоков нужен файл.
+    :return: Имя исходной базы для teardown_django.
+    """
+    configure_django()
+
+    from django.db import connection
+
+    if test_name:
+        connection.settings_dict["TEST"]["NAME"] = test_name
+
+    return connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+
+
+def teardown_django(old_name):
+    """
+    Удаляет тестовую базу, созданную setup_django.
+    """
+    from django.db import connection
+
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat=20, warmup=2):
+    """
+    Вызывает функцию несколько раз и возвращает статистику времени выполнения в миллисекундах.
+
+    :param func: Функция без аргументов.
+    :param repeat: Количество замеряемых вызовов.
+    :param warmup: Количество предварительных вызовов без замера.
+    :return: Словарь с p50, p95, p99, min и max.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return summarize(timings)
+
+
+def summarize(timings):
+    """
+    Возвращает перцентили и крайние значения списка замеров в миллисекундах.
+    """
+    timings = sorted(timings)
+    if len(timings) == 1:
+        p50 = p95 = p99 = timings[0]
+    else:
+        quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+        p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+    return {
+        "count": len(timings),
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "min": round(timings[0], 3),
+        "max": round(timings[-1], 3),
+    }
+
+
+def print_table(rows, columns):
+    """
+    Печатает список словарей в виде выровненной таблицы.
+    """
+    widths = {column: max(len(column), *(len(str(row.get(column, ""))) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
+
+
+def save_results(path, benchmark, rows, **meta):
+    """
+    Сохраняет результаты бенчмарка в файл JSON для последующего сравнения (см. compare_results).
+
+    :param path: Путь к файлу результатов.
+    :param benchmark: Имя бенчмарка.
+    :param rows: Список строк результатов.
+    :param meta: Параметры запуска (размер графа, конкурентность и т.п.).
+    """
+    from django.conf import settings
+
+    database = None
+    if settings.configured:
+        from django.db import connection
+
+        database = connection.vendor
+    document = {
+        "benchmark": benchmark,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "database": database,
+        "meta": meta,
+        "results": rows,
+    }
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(document, output, ensure_ascii=False, indent=2)
+
+
+def compare_results(path, rows, key, metrics=("p50", "p95", "p99", "queries"), threshold=0.2):
+    """
+    Сравнивает результаты с сохраненными ранее и возвращает строки сравнения.
+
+    Метрика считается ухудшившейся, если она выросла больше чем на threshold (доля) от базового
+    значения; для количества запросов любое увеличение - ухудшение.
+
+    :param path: Файл базовых результатов, сохраненный save_results.
+    :param rows: Текущие строки результатов.
+    :param key: Поле, по которому сопоставляются строки (например, "endpoint").
+    :param metrics: Сравниваемые метрики (больше - хуже).
+    :param threshold: Допустимый относительный рост метрик времени.
+    :return: Список словарей {key, metric, baseline, current, change, regression}.
+    """
+    with open(path, encoding="utf-8") as source:
+        baseline = {row[key]: row for row in json.load(source)["results"]}
+    comparison = []
+    for row in rows:
+        base = baseline.get(row[key])
+        if base is None:
+            continue
+        for metric in metrics:
+            old, new = base.get(metric), row.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            limit = 0 if metric == "queries" else threshold
+            comparison.append(
+                {
+                    key: row[key],
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": f"{change:+.0%}" if change != float("inf") else "new",
+                    "regression": change > limit,
+                }
+            )
+    return comparison
@@ -0,0 +1,126 @@
+"""
+Бенчмарк пропускной способности записи при нескольких параллельных воркерах.
+
+Каждый поток-воркер отправляет заявки в друзья своим пользователям и принимает их
+через friends.services (транзакция с блокировками строк, счетчики UserStats,
+рекомендации). Для SQLite сравниваются настройки Django по умолчанию (журнал DELETE,
+ожидание блокировки 5 секунд) и режим из настроек проекта (WAL, synchronous=NORMAL,
+busy_timeout); для PostgreSQL (DB_ENGINE=postgres) замеряется настроенная база.
+
+Запуск из каталога drf:
+    python -m benchmarks.db_writes --workers 8 --operations 200
+    DB_ENGINE=postgres DB_HOST=... python -m benchmarks.db_writes --workers 8
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import configure_django, print_table, setup_django, summarize, teardown_django
+
+
+def seed(workers, operations):
+    """
+    Создает для каждого воркера отправителя и operations получателей заявок.
+    """
+    from django.contrib.auth.models import User
+
+    from friends import graph
+    from friends.models import UserStats
+
+    senders = User.objects.bulk_create([User(username=f"sender{w}") for w in range(workers)])
+    targets = User.objects.bulk_create(
+        [User(username=f"target{w}_{i}") for w in range(workers) for i in range(operations)], batch_size=5000
+    )
+    UserStats.recompute([user.pk for user in senders + targets])
+    return list(zip(senders, graph.chunked(targets, operations)))
+
+
+def run(mode, plan):
+    """
+    Выполняет отправку и принятие заявок во всех воркерах параллельно.
+
+    :return: Строка результатов для таблицы.
+    """
+    from django.db import OperationalError, connection
+
+    from friends import services
+
+    timings = []
+    errors = []
+    lock = threading.Lock()
+
+    def work(sender, targets):
+        for target in targets:
+            for action, args in (
+                (services.send_request, (sender, target)),
+                (services.accept_request, (target, sender)),
+            ):
+                started = time.perf_counter()
+                try:
+                    action(*args)
+                except OperationalError as error:
+                    with lock:
+                        errors.append(str(error))
+                    continue
+                with lock:
+                    timings.append((time.perf_counter() - started) * 1000)
+        connection.close()
+
+    threads = [threading.Thread(target=work, args=args) for args in plan]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latency = summarize(timings) if timings else {}
+    return {
+        "mode": mode,
+        "writes/s": round(len(timings) / elapsed, 1),
+        "ok": len(timings),
+        "errors": len(errors),
+        "p50": latency.get("p50"),
+        "p95": latency.get("p95"),
+        "p99": latency.get("p99"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8, help="Количество параллельных воркеров")
+    parser.add_argument("--operations", type=int, default=200, help="Количество пар отправка+принятие на воркер")
+    args = parser.parse_args()
+
+    configure_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.test import override_settings
+
+    if connection.vendor == "sqlite":
+        modes = (
+            ("sqlite defaults", {}, 5),
+            ("sqlite tuned", settings.FRIENDS_SQLITE_PRAGMAS, settings.DATABASES["default"]["OPTIONS"]["timeout"]),
+        )
+    else:
+        modes = ((connection.vendor, settings.FRIENDS_SQLITE_PRAGMAS, None),)
+
+    rows = []
+    for number, (mode, pragmas, timeout) in enumerate(modes):
+        if timeout is not None:
+            connection.settings_dict["OPTIONS"]["timeout"] = timeout
+        with override_settings(FRIENDS_SQLITE_PRAGMAS=pragmas):
+            # Для SQLite каждый режим получает свой файл: режим журнала WAL сохраняется в файле базы
+            test_name = f"benchmark_db_writes_{number}.sqlite3" if connection.vendor == "sqlite" else None
+            old_name = setup_django(test_name=test_name)
+            try:
+                rows.append(run(mode, seed(args.workers, args.operations)))
+            finally:
+                teardown_django(old_name)
+    print(f"workers: {args.workers}, send+accept pairs per worker: {args.operations}, latency in ms")
+    print_table(rows, ["mode", "writes/s", "ok", "errors", "p50", "p95", "p99"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Бенчмарк эндпоинтов friends внутри процесса на синтетическом графе.
+
+Граф заданного размера и распределения степеней (см. benchmarks.graphs) создается
+в отдельной тестовой базе. Каждый эндпоинт вызывается тестовым клиентом Django
+с токеном в заголовке Authorization от имени пользователя с числом друзей на перцентиле
+--actor-percentile; для каждого эндпоинта печатаются перцентили задержки, пропускная
+способность одного потока и количество SQL-запросов на запрос. Для записи (заявки, друзья)
+перед замером создаются отдельные пользователи, поэтому каждый запрос успешен.
+
+Результаты можно сохранить в JSON (--output) и сравнить с сохраненными ранее (--compare):
+ухудшение задержки больше чем на --threshold или рост числа запросов отмечается как регрессия,
+и с --fail-on-regression скрипт завершается с кодом 1.
+
+Запуск из каталога drf:
+    python -m benchmarks.endpoints --users 5000 --distribution powerlaw --output baseline.json
+    python -m benchmarks.endpoints --users 5000 --distribution powerlaw --compare baseline.json
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks import graphs
+from benchmarks.common import (
+    compare_results,
+    print_table,
+    save_results,
+    setup_django,
+    summarize,
+    teardown_django,
+)
+
+# Эндпоинт: (метод, путь, ожидаемый код ответа)
+ENDPOINTS = {
+    "register": ("post", "/register/", 201),
+    "profile": ("get", "/accounts/profile/", 200),
+    "profile_summary": ("get", "/accounts/profile/?mode=summary", 200),
+    "all_users": ("get", "/all_users/", 200),
+    "friends": ("get", "/friends/", 200),
+    "send_request": ("post", "/send_request_to/", 201),
+    "accept_request": ("post", "/accept_request_from/", 201),
+    "reject_request": ("post", "/reject_request_from/", 201),
+    "delete_friend": ("post", "/delete_friend/", 201),
+}
+
+COLUMNS = ["endpoint", "requests", "req/s", "p50", "p95", "p99", "queries", "errors"]
+
+
+def _fresh_users(tag, count):
+    """
+    Создает count новых пользователей без связей и возвращает их имена.
+    """
+    from django.contrib.auth.models import User
+
+    names = [f"{tag}{i}" for i in range(count)]
+    User.objects.bulk_create([User(username=name) for name in names])
+    return names
+
+
+def prepare(endpoint, actor, count, tag):
+    """
+    Готовит состояние базы для count запросов к эндпоинту и возвращает данные запросов.
+
+    Аргументы:
+        endpoint: Имя эндпоинта из ENDPOINTS.
+        actor: Пользователь, от имени которого выполняются запросы.
+        count: Количество запросов.
+        tag: Уникальный префикс имен создаваемых пользователей.
+
+    Возвращает:
+        Список данных тела запроса (None для GET).
+    """
+    from django.contrib.auth.models import User
+
+    from friends.models import Friendship, FriendRequest, UserStats
+
+    method = ENDPOINTS[endpoint][0]
+    if endpoint == "register":
+        return [
+            {"username": f"{tag}{i}", "email": f"{tag}{i}@example.com", "password": "Bench-pass1"} for i in range(count)
+        ]
+    if method == "get":
+        return [None] * count
+
+    names = _fresh_users(tag, count)
+    others = dict(User.objects.filter(username__in=names).values_list("username", "id"))
+    if endpoint in ("accept_request", "reject_request"):
+        FriendRequest.objects.bulk_create([FriendRequest(from_user_id=others[n], to_user=actor) for n in names])
+    elif endpoint == "delete_friend":
+        Friendship.objects.bulk_create(
+            [Friendship(user_low_id=min(actor.pk, others[n]), user_high_id=max(actor.pk, others[n])) for n in names]
+        )
+    UserStats.recount([actor.pk, *others.values()])
+    return [{"username": name} for name in names]
+
+
+def make_caller(endpoint, token):
+    """
+    Возвращает функцию call(data), выполняющую один запрос к эндпоинту с токеном пользователя.
+
+    call возвращает (код ответа, количество SQL-запросов, время в миллисекундах).
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    method, path, _ = ENDPOINTS[endpoint]
+    client = APIClient(raise_request_exception=False)
+    if endpoint != "register":
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+    send = getattr(client, method)
+
+    def call(data):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = send(path, data, format="json") if data is not None else send(path)
+            elapsed = (time.perf_counter() - started) * 1000
+        return response.status_code, len(queries), elapsed
+
+    return call
+
+
+def run_endpoint(endpoint, actor, token, requests, warmup=2):
+    """
+    Выполняет requests запросов к эндпоинту и возвращает строку результатов.
+    """
+    expected = ENDPOINTS[endpoint][2]
+    payloads = prepare(endpoint, actor, requests + warmup, tag=f"bench_{endpoint}_")
+    call = make_caller(endpoint, token)
+    for data in payloads[:warmup]:
+        call(data)
+    timings, query_counts, errors = [], [], 0
+    for data in payloads[warmup:]:
+        status, queries, elapsed = call(data)
+        errors += status != expected
+        timings.append(elapsed)
+        query_counts.append(queries)
+    latency = summarize(timings)
+    return {
+        "endpoint": endpoint,
+        "requests": len(timings),
+        "req/s": round(len(timings) / (sum(timings) / 1000), 1),
+        "p50": latency["p50"],
+        "p95": latency["p95"],
+        "p99": latency["p99"],
+        "queries": max(query_counts),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    graphs.add_arguments(parser)
+    parser.add_argument("--requests", type=int, default=100, help="Количество замеряемых запросов к эндпоинту")
+    parser.add_argument(
+        "--actor-percentile", type=float, default=99, help="Перцентиль числа друзей пользователя-актора (0-100)"
+    )
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Эндпоинты через запятую (по умолчанию - все)")
+    parser.add_argument(
+        "--response-cache", action="store_true", help="Не отключать кэш ответов (по умолчанию замеряется путь к базе)"
+    )
+    parser.add_argument("--output", help="Файл JSON для сохранения результатов")
+    parser.add_argument("--compare", help="Файл JSON с базовыми результатами для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимый относительный рост задержки")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Код выхода 1 при регрессии")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+        from rest_framework.authtoken.models import Token
+
+        seeded = graphs.seed_graph(**graphs.graph_options(args))
+        actor = User.objects.get(pk=seeded.user_at_percentile(args.actor_percentile))
+        token = Token.objects.get(user=actor).key
+        response_cache = dict(settings.FRIENDS_RESPONSE_CACHE)
+        if not args.response_cache:
+            response_cache["TIMEOUT"] = 0
+
+        rows = []
+        with override_settings(FRIENDS_RESPONSE_CACHE=response_cache):
+            for endpoint in args.endpoints.split(","):
+                rows.append(run_endpoint(endpoint, actor, token, args.requests))
+
+        meta = {
+            **graphs.graph_options(args),
+            "friendships": seeded.friendships,
+            "friend_requests": seeded.requests,
+            "actor_degree": seeded.degrees[actor.pk],
+            "requests": args.requests,
+            "response_cache": args.response_cache,
+        }
+        print(
+            f"users: {args.users} ({args.distribution}, avg degree {args.avg_degree}), "
+            f"actor degree: {meta['actor_degree']}, latency in ms, queries - max per request"
+        )
+        print_table(rows, COLUMNS)
+
+        regressions = []
+        if args.compare:
+            comparison = compare_results(args.compare, rows, key="endpoint", threshold=args.threshold)
+            regressions = [row for row in comparison if row["regression"]]
+            print(f"\ncompared with {args.compare}:")
+            print_table(comparison, ["endpoint", "metric", "baseline", "current", "change", "regression"])
+        if args.output:
+            save_results(args.output, "endpoints", rows, **meta)
+            print(f"\nresults: {args.output}")
+    finally:
+        teardown_django(old_name)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
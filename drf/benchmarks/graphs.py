@@ -0,0 +1,224 @@
+"""
+Генерация синтетических социальных графов для бенчмарков и нагрузочных тестов.
+
+Распределения степеней (числа друзей):
+    fixed - у каждого пользователя ровно avg_degree друзей (кольцевая решетка);
+    uniform - ребра между случайными парами пользователей (степени близки к avg_degree);
+    powerlaw - модель Чунг-Лу с весами из распределения Парето: большинство пользователей
+        имеют мало друзей, а немногие "хабы" - тысячи, как в настоящих социальных сетях.
+
+Кроме дружб создаются ожидающие заявки в друзья (в среднем requests_per_user исходящих
+на пользователя) между пользователями, которые не являются друзьями, токены и счетчики UserStats.
+При одинаковом seed граф получается одинаковым.
+
+Заполнение настроенной базы (после manage.py migrate) с сохранением токенов для load_test,
+запуск из каталога drf:
+    python -m benchmarks.graphs --users 10000 --distribution powerlaw --avg-degree 20 --tokens tokens.json
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+from dataclasses import dataclass
+
+DISTRIBUTIONS = ("fixed", "uniform", "powerlaw")
+
+
+@dataclass
+class SeededGraph:
+    """
+    Результат генерации графа.
+
+    Поля:
+        user_ids: id созданных пользователей в порядке создания.
+        degrees: Количество друзей каждого пользователя по id.
+        friendships: Количество созданных дружб.
+        requests: Количество созданных заявок в друзья.
+    """
+
+    user_ids: list
+    degrees: dict
+    friendships: int
+    requests: int
+
+    def user_at_percentile(self, percentile):
+        """
+        Возвращает id пользователя, число друзей которого находится на указанном перцентиле (0-100).
+        """
+        ordered = sorted(self.user_ids, key=lambda user_id: (self.degrees.get(user_id, 0), user_id))
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def generate_edges(users, distribution, avg_degree, rng, alpha=2.5):
+    """
+    Возвращает множество неориентированных ребер (i, j), i < j, между номерами пользователей 0..users-1.
+    """
+    edges = set()
+    if users < 2 or avg_degree <= 0:
+        return edges
+    if distribution == "fixed":
+        half = max(1, min(avg_degree, users - 1) // 2)
+        for i in range(users):
+            for step in range(1, half + 1):
+                j = (i + step) % users
+                edges.add((min(i, j), max(i, j)))
+        return edges
+
+    if distribution == "uniform":
+        weights = [1.0] * users
+    elif distribution == "powerlaw":
+        weights = [rng.paretovariate(alpha - 1) for _ in range(users)]
+    else:
+        raise ValueError(f"Неизвестное распределение: {distribution}")
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    target = min(users * avg_degree // 2, users * (users - 1) // 2)
+    attempts = 0
+    while len(edges) < target and attempts < target * 20:
+        attempts += 1
+        i = bisect.bisect_left(cumulative, rng.random() * total)
+        j = bisect.bisect_left(cumulative, rng.random() * total)
+        if i != j:
+            edges.add((min(i, j), max(i, j)))
+    return edges
+
+
+def generate_requests(users, edges, requests_per_user, rng):
+    """
+    Возвращает список ориентированных заявок (from, to) между пользователями, которые не являются друзьями.
+    """
+    target = int(users * requests_per_user)
+    pairs = set()
+    attempts = 0
+    while len(pairs) < target and attempts < target * 20:
+        attempts += 1
+        i, j = rng.randrange(users), rng.randrange(users)
+        pair = (min(i, j), max(i, j))
+        if i != j and pair not in edges and pair not in pairs:
+            pairs.add(pair)
+    return [pair if rng.random() < 0.5 else pair[::-1] for pair in pairs]
+
+
+def seed_graph(
+    users,
+    distribution="powerlaw",
+    avg_degree=10,
+    requests_per_user=1.0,
+    seed=42,
+    prefix="user",
+    batch_size=5000,
+):
+    """
+    Создает в базе пользователей, дружбы, заявки, токены и счетчики синтетического графа.
+
+    Аргументы:
+        users: Количество пользователей.
+        distribution: Распределение степеней: fixed, uniform или powerlaw.
+        avg_degree: Среднее количество друзей.
+        requests_per_user: Среднее количество исходящих ожидающих заявок на пользователя.
+        seed: Начальное значение генератора случайных чисел.
+        prefix: Префикс имен пользователей (prefix0, prefix1, ...).
+        batch_size: Размер пачки bulk_create.
+
+    Возвращает:
+        SeededGraph с id пользователей и их степенями.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    from friends import graph
+    from friends.models import Friendship, FriendRequest, UserStats
+
+    rng = random.Random(seed)
+    edges = generate_edges(users, distribution, avg_degree, rng)
+    requests = generate_requests(users, edges, requests_per_user, rng)
+
+    password = make_password(None)
+    User.objects.bulk_create(
+        [User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password) for i in range(users)],
+        batch_size=batch_size,
+    )
+    ids = dict(User.objects.filter(username__startswith=prefix).values_list("username", "id"))
+    user_ids = [ids[f"{prefix}{i}"] for i in range(users)]
+    Token.objects.bulk_create(
+        [Token(key=Token.generate_key(), user_id=user_id) for user_id in user_ids], batch_size=batch_size
+    )
+    Friendship.objects.bulk_create(
+        (Friendship(user_low_id=user_ids[i], user_high_id=user_ids[j]) for i, j in edges), batch_size=batch_size
+    )
+    FriendRequest.objects.bulk_create(
+        (FriendRequest(from_user_id=user_ids[i], to_user_id=user_ids[j]) for i, j in requests), batch_size=batch_size
+    )
+    for chunk in graph.chunked(user_ids, 2000):
+        UserStats.recount(chunk)
+
+    degrees = dict.fromkeys(user_ids, 0)
+    for i, j in edges:
+        degrees[user_ids[i]] += 1
+        degrees[user_ids[j]] += 1
+    return SeededGraph(user_ids=user_ids, degrees=degrees, friendships=len(edges), requests=len(requests))
+
+
+def add_arguments(parser):
+    """
+    Добавляет в парсер аргументы размера и формы графа, общие для бенчмарков.
+    """
+    parser.add_argument("--users", type=int, default=2000, help="Количество пользователей")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="powerlaw", help="Распределение степеней")
+    parser.add_argument("--avg-degree", type=int, default=10, help="Среднее количество друзей")
+    parser.add_argument("--requests-per-user", type=float, default=1.0, help="Среднее число ожидающих заявок")
+    parser.add_argument("--seed", type=int, default=42, help="Начальное значение генератора графа")
+
+
+def graph_options(args):
+    """
+    Возвращает аргументы seed_graph из разобранных аргументов командной строки.
+    """
+    return {
+        "users": args.users,
+        "distribution": args.distribution,
+        "avg_degree": args.avg_degree,
+        "requests_per_user": args.requests_per_user,
+        "seed": args.seed,
+    }
+
+
+def main():
+    from benchmarks.common import configure_django
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--prefix", default="load", help="Префикс имен пользователей")
+    parser.add_argument("--tokens", help="Файл JSON, в который записываются имена пользователей и токены")
+    args = parser.parse_args()
+
+    configure_django()
+    from rest_framework.authtoken.models import Token
+
+    seeded = seed_graph(prefix=args.prefix, **graph_options(args))
+    degrees = sorted(seeded.degrees.values())
+    print(
+        f"users: {len(seeded.user_ids)}, friendships: {seeded.friendships}, requests: {seeded.requests}, "
+        f"degree p50/p99/max: {degrees[len(degrees) // 2]}/{degrees[int(len(degrees) * 0.99)]}/{degrees[-1]}"
+    )
+    if args.tokens:
+        tokens = Token.objects.filter(user__username__startswith=args.prefix).values_list(
+            "user__username", "key", "user_id"
+        )
+        with open(args.tokens, "w", encoding="utf-8") as output:
+            json.dump(
+                [
+                    {"username": username, "token": key, "degree": seeded.degrees[user_id]}
+                    for username, key, user_id in tokens.iterator()
+                    if user_id in seeded.degrees
+                ],
+                output,
+            )
+        print(f"tokens: {args.tokens}")
+
+
+if __name__ == "__main__":
+    main()
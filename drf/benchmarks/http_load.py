@@ -0,0 +1,131 @@
+"""
+Нагрузочный тест запущенного сервера: много одновременных keep-alive соединений.
+
+Генератор нагрузки написан на asyncio без сторонних зависимостей. Каждое соединение
+последовательно отправляет GET-запросы в течение duration секунд; для каждого уровня
+конкурентности печатаются пропускная способность, количество ошибок и перцентили задержки.
+
+Пример сравнения WSGI (сервис web) и ASGI (сервис web-asgi) из docker-compose.yml:
+    python -m benchmarks.http_load --url http://127.0.0.1:8000/friends/ --token <ключ>
+    python -m benchmarks.http_load --url http://127.0.0.1:8001/async/friends/ --token <ключ>
+"""
+
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.common import print_table, summarize
+
+
+async def _read_response(reader):
+    """
+    Читает один HTTP/1.1 ответ и возвращает (код ответа, нужно ли закрыть соединение).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    else:
+        await reader.read()
+        return status, True
+    return status, headers.get("connection", "").lower() == "close"
+
+
+async def _connection(url, headers, deadline, timeout, result):
+    """
+    Отправляет запросы по одному соединению до deadline, переподключаясь при закрытии.
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    request = f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n{headers}\r\n".encode()
+    writer = None
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(parts.hostname, parts.port or 80), timeout
+                )
+            writer.write(request)
+            await writer.drain()
+            status, close = await asyncio.wait_for(_read_response(reader), timeout)
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            result["errors"] += 1
+            close = True
+            status = None
+        else:
+            result["timings"].append((time.perf_counter() - started) * 1000)
+            if not 200 <= status < 400:
+                result["non_2xx"] += 1
+        if close and writer is not None:
+            writer.close()
+            writer = None
+        if status is None:
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, connections, duration, token, timeout):
+    """
+    Запускает connections соединений на duration секунд и возвращает строку результатов.
+    """
+    headers = f"Authorization: Token {token}\r\n" if token else ""
+    result = {"timings": [], "errors": 0, "non_2xx": 0}
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(_connection(url, headers, deadline, timeout, result) for _ in range(connections)),
+    )
+    elapsed = time.perf_counter() - started
+    latency = summarize(result["timings"]) if result["timings"] else {}
+    return {
+        "connections": connections,
+        "requests": len(result["timings"]),
+        "req/s": round(len(result["timings"]) / elapsed, 1),
+        "errors": result["errors"],
+        "non_2xx": result["non_2xx"],
+        "p50": latency.get("p50"),
+        "p95": latency.get("p95"),
+        "p99": latency.get("p99"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="Адрес эндпоинта")
+    parser.add_argument("--token", help="Токен пользователя для заголовка Authorization")
+    parser.add_argument(
+        "--connections", default="10,100,500", help="Уровни конкурентности через запятую (по умолчанию 10,100,500)"
+    )
+    parser.add_argument("--duration", type=float, default=10, help="Длительность каждого уровня в секундах")
+    parser.add_argument("--timeout", type=float, default=10, help="Таймаут подключения и ответа в секундах")
+    args = parser.parse_args()
+
+    rows = []
+    for connections in (int(value) for value in args.connections.split(",")):
+        rows.append(asyncio.run(run(args.url, connections, args.duration, args.token, args.timeout)))
+    print(f"url: {args.url}, {args.duration:g} s per level, latency in ms")
+    print_table(rows, ["connections", "requests", "req/s", "errors", "non_2xx", "p50", "p95", "p99"])
+
+
+if __name__ == "__main__":
+    main()
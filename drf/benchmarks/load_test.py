@@ -0,0 +1,239 @@
+"""
+Нагрузочный тест всех эндпоинтов friends на запущенном сервере по сценариям.
+
+В отличие от benchmarks.http_load, который нагружает один URL, здесь соединения
+распределяются по сценариям, а результаты собираются по каждому эндпоинту:
+    profile, all_users, friends - GET от имени пользователей из файла --tokens
+        (пользователи перебираются по кругу, поэтому нагрузка идет и на "хабов");
+    register - регистрация новых пользователей с уникальными именами;
+    accept_cycle - пара пользователей из --writers: заявка, принятие, удаление из друзей;
+    reject_cycle - пара пользователей из --writers: заявка и отклонение.
+Циклы записи возвращают граф в исходное состояние, поэтому тест можно повторять на той же базе.
+
+Подготовка базы сервера (из каталога drf, с настройками сервера):
+    python -m benchmarks.graphs --users 10000 --avg-degree 20 --tokens readers.json
+    python -m benchmarks.graphs --users 400 --avg-degree 0 --requests-per-user 0 --prefix writer \\
+        --tokens writers.json
+Запуск:
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --tokens readers.json \\
+        --writers writers.json --connections 50 --duration 30 --output load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from benchmarks.common import compare_results, print_table, save_results, summarize
+from benchmarks.http_load import _read_response
+
+READ_SCENARIOS = {
+    "profile": "/accounts/profile/",
+    "all_users": "/all_users/",
+    "friends": "/friends/",
+}
+WRITE_SCENARIOS = ("register", "accept_cycle", "reject_cycle")
+SCENARIOS = (*READ_SCENARIOS, *WRITE_SCENARIOS)
+
+COLUMNS = ["endpoint", "requests", "req/s", "errors", "non_2xx", "p50", "p95", "p99"]
+
+
+class _Connection:
+    """
+    Keep-alive соединение с сервером, переподключающееся после закрытия или ошибки.
+    """
+
+    def __init__(self, base_url, timeout, result):
+        parts = urlsplit(base_url)
+        self.host, self.port, self.netloc = parts.hostname, parts.port or 80, parts.netloc
+        self.timeout = timeout
+        self.result = result
+        self.reader = self.writer = None
+
+    async def request(self, endpoint, method, path, token=None, body=None):
+        """
+        Выполняет запрос и записывает его результат в статистику endpoint; возвращает код ответа или None.
+        """
+        payload = json.dumps(body).encode() if body is not None else b""
+        headers = f"{method} {path} HTTP/1.1\r\nHost: {self.netloc}\r\n"
+        if token:
+            headers += f"Authorization: Token {token}\r\n"
+        if body is not None:
+            headers += f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+        stats = self.result[endpoint]
+        started = time.perf_counter()
+        try:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout
+                )
+            self.writer.write(headers.encode() + b"\r\n" + payload)
+            await self.writer.drain()
+            status, close = await asyncio.wait_for(_read_response(self.reader), self.timeout)
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            stats["errors"] += 1
+            self.close()
+            await asyncio.sleep(0.05)
+            return None
+        stats["timings"].append((time.perf_counter() - started) * 1000)
+        if not 200 <= status < 400:
+            stats["non_2xx"] += 1
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def _scenario(scenario, connection, deadline, readers, writers, run_id):
+    """
+    Выполняет шаги сценария по одному соединению до deadline.
+    """
+    number = 0
+    while time.monotonic() < deadline:
+        if scenario in READ_SCENARIOS:
+            await connection.request(scenario, "GET", READ_SCENARIOS[scenario], next(readers)["token"])
+        elif scenario == "register":
+            username = f"load_{run_id}_{id(connection)}_{number}"
+            body = {"username": username, "email": f"{username}@example.com", "password": "Load-test-pass1"}
+            await connection.request("register", "POST", "/register/", body=body)
+        else:
+            sender, receiver = writers
+            await connection.request(
+                "send_request", "POST", "/send_request_to/", sender["token"], {"username": receiver["username"]}
+            )
+            if scenario == "accept_cycle":
+                await connection.request(
+                    "accept_request",
+                    "POST",
+                    "/accept_request_from/",
+                    receiver["token"],
+                    {"username": sender["username"]},
+                )
+                await connection.request(
+                    "delete_friend", "POST", "/delete_friend/", sender["token"], {"username": receiver["username"]}
+                )
+            else:
+                await connection.request(
+                    "reject_request",
+                    "POST",
+                    "/reject_request_from/",
+                    receiver["token"],
+                    {"username": sender["username"]},
+                )
+        number += 1
+    connection.close()
+
+
+async def run(base_url, scenarios, connections, duration, timeout, readers, writers):
+    """
+    Запускает connections соединений, распределенных по сценариям по кругу, и возвращает строки результатов.
+    """
+    result = defaultdict(lambda: {"timings": [], "errors": 0, "non_2xx": 0})
+    reader_cycle = itertools.cycle(readers) if readers else None
+    writer_pairs = iter(zip(writers[::2], writers[1::2]))
+    run_id = uuid.uuid4().hex[:8]
+    deadline = time.monotonic() + duration
+    tasks = []
+    for scenario in itertools.islice(itertools.cycle(scenarios), connections):
+        pair = None
+        if scenario in ("accept_cycle", "reject_cycle"):
+            # Каждому соединению записи - своя пара пользователей, чтобы циклы не мешали друг другу
+            pair = next(writer_pairs, None)
+            if pair is None:
+                continue
+        connection = _Connection(base_url, timeout, result)
+        tasks.append(_scenario(scenario, connection, deadline, reader_cycle, pair, run_id))
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    rows = []
+    for endpoint, stats in sorted(result.items()):
+        latency = summarize(stats["timings"]) if stats["timings"] else {}
+        rows.append(
+            {
+                "endpoint": endpoint,
+                "requests": len(stats["timings"]),
+                "req/s": round(len(stats["timings"]) / elapsed, 1),
+                "errors": stats["errors"],
+                "non_2xx": stats["non_2xx"],
+                "p50": latency.get("p50"),
+                "p95": latency.get("p95"),
+                "p99": latency.get("p99"),
+            }
+        )
+    return rows
+
+
+def _load_tokens(path):
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as tokens:
+        return json.load(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", required=True, help="Адрес сервера, например http://127.0.0.1:8000")
+    parser.add_argument("--tokens", help="Файл токенов benchmarks.graphs для сценариев чтения")
+    parser.add_argument("--writers", help="Файл токенов пользователей без связей для циклов записи")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Сценарии через запятую (по умолчанию - все)")
+    parser.add_argument("--connections", type=int, default=50, help="Количество одновременных соединений")
+    parser.add_argument("--duration", type=float, default=30, help="Длительность теста в секундах")
+    parser.add_argument("--timeout", type=float, default=10, help="Таймаут подключения и ответа в секундах")
+    parser.add_argument("--output", help="Файл JSON для сохранения результатов")
+    parser.add_argument("--compare", help="Файл JSON с базовыми результатами для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимый относительный рост задержки")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Код выхода 1 при регрессии")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    readers, writers = _load_tokens(args.tokens), _load_tokens(args.writers)
+    if not readers:
+        scenarios = [scenario for scenario in scenarios if scenario not in READ_SCENARIOS]
+    if len(writers) < 2:
+        scenarios = [scenario for scenario in scenarios if scenario not in ("accept_cycle", "reject_cycle")]
+    if not scenarios:
+        parser.error("нет сценариев для запуска: укажите --tokens и/или --writers")
+
+    rows = asyncio.run(run(args.base_url, scenarios, args.connections, args.duration, args.timeout, readers, writers))
+    print(f"url: {args.base_url}, {args.connections} connections, {args.duration:g} s, latency in ms")
+    print_table(rows, COLUMNS)
+
+    regressions = []
+    if args.compare:
+        comparison = compare_results(
+            args.compare, rows, key="endpoint", metrics=("p50", "p95", "p99"), threshold=args.threshold
+        )
+        regressions = [row for row in comparison if row["regression"]]
+        print(f"\ncompared with {args.compare}:")
+        print_table(comparison, ["endpoint", "metric", "baseline", "current", "change", "regression"])
+    if args.output:
+        save_results(
+            args.output,
+            "load_test",
+            rows,
+            base_url=args.base_url,
+            scenarios=scenarios,
+            connections=args.connections,
+            duration=args.duration,
+        )
+        print(f"\nresults: {args.output}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
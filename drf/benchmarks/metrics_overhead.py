@@ -0,0 +1,152 @@
+"""
+Бенчмарк накладных расходов сбора метрик запросов (friends.middleware.MetricsMiddleware).
+
+На синтетическом графе (benchmarks.graphs) эндпоинты чтения вызываются тестовым клиентом
+поочередно с MetricsMiddleware и без него (и без обертки SQL-запросов); печатается медиана
+времени ответа обоих вариантов и разница. Отдельно замеряется стоимость самого учета
+одного запроса (начало замера, запись в метрики маршрута и заголовок Server-Timing)
+и формирования ответа /metrics/.
+
+Запуск из каталога drf:
+    python -m benchmarks.metrics_overhead --users 2000 --requests 300
+"""
+
+import argparse
+import statistics
+import time
+from contextlib import contextmanager
+
+from benchmarks import graphs
+from benchmarks.common import print_table, setup_django, teardown_django
+
+# Эндпоинты чтения: имя -> путь
+ENDPOINTS = {
+    "profile": "/accounts/profile/",
+    "all_users": "/all_users/",
+    "friends": "/friends/",
+    "outgoing_requests": "/friend_requests/outgoing/",
+    "suggestions": "/suggestions/",
+}
+
+
+def make_clients(token):
+    """
+    Возвращает клиентов с MetricsMiddleware и без него.
+
+    Тестовый клиент собирает цепочку middleware при первом запросе, поэтому клиент без метрик
+    делает первый запрос с измененной настройкой MIDDLEWARE и дальше использует ее.
+    """
+    from django.conf import settings
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    with_metrics, without_metrics = APIClient(), APIClient()
+    for client in (with_metrics, without_metrics):
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+    middleware = [name for name in settings.MIDDLEWARE if name != "friends.middleware.MetricsMiddleware"]
+    with override_settings(MIDDLEWARE=middleware):
+        without_metrics.get("/")
+    with_metrics.get("/")
+    return with_metrics, without_metrics
+
+
+@contextmanager
+def query_wrapper_removed():
+    """
+    Контекстный менеджер, снимающий с соединения обертку SQL-запросов метрик.
+    """
+    from django.db import connection
+
+    from friends import metrics
+
+    connection.execute_wrappers.remove(metrics.execute_wrapper)
+    try:
+        yield
+    finally:
+        connection.execute_wrappers.insert(0, metrics.execute_wrapper)
+
+
+def compare_endpoint(with_metrics, without_metrics, path, requests):
+    """
+    Вызывает эндпоинт поочередно с метриками и без них и возвращает медианы времени в миллисекундах.
+    """
+    timings = {True: [], False: []}
+    for number in range(requests * 2):
+        enabled = number % 2 == 0
+        if enabled:
+            started = time.perf_counter()
+            with_metrics.get(path)
+            timings[True].append((time.perf_counter() - started) * 1000)
+        else:
+            with query_wrapper_removed():
+                started = time.perf_counter()
+                without_metrics.get(path)
+                timings[False].append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings[False]), statistics.median(timings[True])
+
+
+def record_cost(iterations):
+    """
+    Возвращает стоимость учета одного запроса и одной выгрузки /metrics/ в микросекундах.
+    """
+    from friends import metrics
+
+    route = next(iter(metrics.routes()))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        state, token = metrics.start_request()
+        metrics.finish_request(token)
+        metrics.record(route, 200, 0.01, state, 1000)
+        metrics.server_timing(0.01, state)
+    per_request = (time.perf_counter() - started) / iterations * 1e6
+
+    started = time.perf_counter()
+    for _ in range(20):
+        metrics.exposition()
+    return per_request, (time.perf_counter() - started) / 20 * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    graphs.add_arguments(parser)
+    parser.add_argument("--requests", type=int, default=300, help="Количество запросов каждого варианта")
+    parser.add_argument("--actor-percentile", type=float, default=99, help="Перцентиль числа друзей пользователя")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+        from rest_framework.authtoken.models import Token
+
+        seeded = graphs.seed_graph(**graphs.graph_options(args))
+        actor = User.objects.get(pk=seeded.user_at_percentile(args.actor_percentile))
+        with_metrics, without_metrics = make_clients(Token.objects.get(user=actor).key)
+
+        rows = []
+        # Кэш ответов выключен: замеряется полный путь запроса, а не чтение готового ответа
+        with override_settings(FRIENDS_RESPONSE_CACHE={**settings.FRIENDS_RESPONSE_CACHE, "TIMEOUT": 0}):
+            for endpoint in ENDPOINTS:
+                without, with_timing = compare_endpoint(
+                    with_metrics, without_metrics, ENDPOINTS[endpoint], args.requests
+                )
+                rows.append(
+                    {
+                        "endpoint": endpoint,
+                        "without, ms": round(without, 3),
+                        "with metrics, ms": round(with_timing, 3),
+                        "overhead, ms": round(with_timing - without, 3),
+                        "overhead": f"{(with_timing - without) / without:+.1%}",
+                    }
+                )
+        per_request, exposition = record_cost(100000)
+        print(f"users: {args.users} ({args.distribution}), actor degree: {seeded.degrees[actor.pk]}, p50 latency")
+        print_table(rows, ["endpoint", "without, ms", "with metrics, ms", "overhead, ms", "overhead"])
+        print(f"\nrecording one request: {per_request:.2f} us, /metrics/ exposition: {exposition:.0f} us")
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Бенчмарк поиска общих друзей для пользователей с большим числом друзей.
+
+Сравнивает SQL-запрос (Friendship.mutual_friends_of) с пересечением множеств
+смежности из кэша в памяти процесса (friends.graph), холодным и прогретым.
+
+Запуск из каталога drf:
+    python -m benchmarks.mutual_friends --friends 10000 --overlap 0.3
+"""
+
+import argparse
+
+from benchmarks.common import measure, print_table, setup_django, teardown_django
+
+
+def seed(friends, overlap):
+    """
+    Создает двух пользователей, у каждого friends друзей, из которых доля overlap общая.
+    """
+    from django.contrib.auth.models import User
+
+    from friends.models import Friendship, UserStats
+
+    shared = int(friends * overlap)
+    total = 2 + 2 * friends - shared
+    users = User.objects.bulk_create([User(username=f"bench{i}") for i in range(total)], batch_size=5000)
+    first, second, pool = users[0], users[1], users[2:]
+    first_friends = pool[:friends]
+    second_start = friends - shared
+    second_friends = pool[second_start:]
+    rows = [Friendship(user_low_id=first.pk, user_high_id=user.pk) for user in first_friends]
+    rows += [Friendship(user_low_id=second.pk, user_high_id=user.pk) for user in second_friends]
+    Friendship.objects.bulk_create(rows, batch_size=5000)
+    UserStats.recompute([first.pk, second.pk])
+    return first, second, shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--friends", type=int, default=10000, help="Количество друзей у каждого пользователя")
+    parser.add_argument("--overlap", type=float, default=0.3, help="Доля общих друзей")
+    parser.add_argument("--repeat", type=int, default=20, help="Количество замеров")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        from friends import graph
+        from friends.models import Friendship
+
+        first, second, shared = seed(args.friends, args.overlap)
+
+        def sql_count():
+            assert Friendship.mutual_friends_of(first, second).count() == shared
+
+        def sql_page():
+            list(Friendship.mutual_friends_of(first, second).order_by("username").values_list("username")[:50])
+
+        def cold_sets():
+            graph.invalidate(first.pk, second.pk)
+            assert len(graph.mutual_friend_ids(first.pk, second.pk)) == shared
+
+        def warm_sets():
+            assert len(graph.mutual_friend_ids(first.pk, second.pk)) == shared
+
+        rows = []
+        for name, func in (
+            ("sql count", sql_count),
+            ("sql first page", sql_page),
+            ("adjacency sets, cold", cold_sets),
+            ("adjacency sets, warm", warm_sets),
+        ):
+            rows.append({"path": name, **measure(func, repeat=args.repeat)})
+        print(f"friends per user: {args.friends}, mutual friends: {shared}, latency in ms")
+        print_table(rows, ["path", "p50", "p95", "p99", "min", "max"])
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Бенчмарк регистрации пользователей при всплеске регистраций на gunicorn, как в docker-compose.yml.
+
+Для каждого режима запускается gunicorn drf.wsgi с воркерами gthread на отдельной базе SQLite.
+Несколько соединений одновременно регистрируют пользователей через /register/, а другие
+соединения в это же время запрашивают дешевый эндпоинт /. Сравниваются хэширование
+пароля в потоке запроса (WORKERS=0) и ограниченные пулы потоков и процессов
+(friends.hashing): пропускная способность регистраций, количество ответов 429
+и задержка дешевого эндпоинта. Пул ограничивает регистрации, только если потоков воркера
+больше, чем исполнителей и мест в очереди пула.
+
+Запуск из каталога drf:
+    python -m benchmarks.registration --clients 32 --registrations 200 --threads 16 --workers 4 --max-pending 4
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.common import print_table, setup_django, summarize, teardown_django
+from benchmarks.load_test import _Connection
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, port, gunicorn_workers, threads, hashing):
+    """
+    Запускает gunicorn drf.wsgi с воркерами gthread и ждет, пока он начнет принимать соединения.
+
+    :param database: Путь к файлу базы SQLite.
+    :param hashing: Переменные окружения FRIENDS_HASHING_*.
+    :return: Процесс gunicorn.
+    """
+    env = {**os.environ, "DB_NAME": str(database), "DEBUG": "False", **hashing}
+    env.setdefault("SECRET_KEY", "benchmark")
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "drf.wsgi",
+        "--worker-class",
+        "gthread",
+        "--workers",
+        str(gunicorn_workers),
+        "--threads",
+        str(threads),
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--log-level",
+        "warning",
+    ]
+    server = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn завершился с кодом {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn не начал принимать соединения за 30 секунд")
+
+
+async def run(mode, base_url, clients, registrations, readers, timeout):
+    """
+    Выполняет registrations регистраций в clients соединениях при readers соединениях чтения.
+
+    :return: Строка результатов для таблицы.
+    """
+    result = defaultdict(lambda: {"timings": [], "errors": 0, "non_2xx": 0})
+    counter = itertools.count()
+    statuses = []
+    done = asyncio.Event()
+
+    async def register():
+        connection = _Connection(base_url, timeout, result)
+        while (number := next(counter)) < registrations:
+            username = f"{mode}{number}"
+            body = {"username": username, "email": f"{username}@example.com", "password": "Bench-pass1"}
+            statuses.append(await connection.request("register", "POST", "/register/", body=body))
+        connection.close()
+
+    async def read():
+        connection = _Connection(base_url, timeout, result)
+        while not done.is_set():
+            await connection.request("read", "GET", "/")
+        connection.close()
+
+    reader_tasks = [asyncio.create_task(read()) for _ in range(readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*(register() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*reader_tasks)
+
+    created = statuses.count(201)
+    read_timings = result["read"]["timings"]
+    latency = summarize(read_timings) if read_timings else {}
+    return {
+        "mode": mode,
+        "created/s": round(created / elapsed, 1),
+        "201": created,
+        "429": statuses.count(429),
+        "other": len(statuses) - created - statuses.count(429),
+        "read p50": latency.get("p50"),
+        "read p95": latency.get("p95"),
+        "read p99": latency.get("p99"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="Количество соединений, регистрирующих пользователей")
+    parser.add_argument("--readers", type=int, default=2, help="Количество соединений, запрашивающих /")
+    parser.add_argument("--registrations", type=int, default=200, help="Количество регистраций в каждом режиме")
+    parser.add_argument("--gunicorn-workers", type=int, default=1, help="Количество процессов gunicorn")
+    parser.add_argument("--threads", type=int, default=16, help="Количество потоков в процессе gunicorn")
+    parser.add_argument("--workers", type=int, default=4, help="Размер пула хэширования")
+    parser.add_argument("--max-pending", type=int, default=4, help="Длина очереди пула хэширования")
+    parser.add_argument("--timeout", type=float, default=60, help="Таймаут ответа в секундах")
+    args = parser.parse_args()
+
+    old_name = setup_django(test_name="benchmark_registration.sqlite3")
+    try:
+        from django.db import connection
+
+        database = os.path.abspath(connection.settings_dict["NAME"])
+        rows = []
+        for mode, executor, workers in (
+            ("inline", "thread", 0),
+            ("threads", "thread", args.workers),
+            ("processes", "process", args.workers),
+        ):
+            hashing = {
+                "FRIENDS_HASHING_WORKERS": str(workers),
+                "FRIENDS_HASHING_MAX_PENDING": str(args.max_pending),
+                "FRIENDS_HASHING_TIMEOUT": "30",
+                "FRIENDS_HASHING_EXECUTOR": executor,
+            }
+            port = _free_port()
+            server = start_server(database, port, args.gunicorn_workers, args.threads, hashing)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                rows.append(
+                    asyncio.run(run(mode, base_url, args.clients, args.registrations, args.readers, args.timeout))
+                )
+            finally:
+                server.terminate()
+                server.wait()
+        print(
+            f"gunicorn: {args.gunicorn_workers} x gthread {args.threads} threads, clients: {args.clients}, "
+            f"readers: {args.readers}, registrations per mode: {args.registrations}"
+        )
+        print_table(rows, ["mode", "created/s", "201", "429", "other", "read p50", "read p95", "read p99"])
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Бенчмарк сериализации больших списков: ModelSerializer против легких сериализаторов на values_list.
+
+Для заявок в друзья, друзей и списка пользователей замеряется полный путь страницы
+без HTTP: запрос к базе, сериализация и отрисовка JSON. Сравниваются ModelSerializer
+с JSONRenderer, легкий сериализатор с JSONRenderer и легкий сериализатор с ORJSONRenderer
+(если orjson установлен). Перед замером проверяется, что все варианты дают одинаковые байты.
+
+Запуск из каталога drf:
+    python -m benchmarks.serializers --rows 5000 --repeat 20
+"""
+
+import argparse
+
+from benchmarks.common import measure, print_table, setup_django, teardown_django
+
+
+def seed(rows):
+    """
+    Создает пользователя с rows друзьями, rows входящими заявками и 3 * rows других пользователей.
+    """
+    from django.contrib.auth.models import User
+
+    from friends import graph
+    from friends.models import Friendship, FriendRequest
+
+    owner = User.objects.create(username="owner")
+    users = User.objects.bulk_create([User(username=f"user{i:07d}") for i in range(3 * rows)], batch_size=5000)
+    friends, senders, _ = graph.chunked(users, rows)
+    Friendship.objects.bulk_create(
+        [Friendship(user_low_id=owner.pk, user_high_id=user.pk) for user in friends], batch_size=5000
+    )
+    FriendRequest.objects.bulk_create(
+        [FriendRequest(from_user_id=user.pk, to_user_id=owner.pk) for user in senders], batch_size=5000
+    )
+    return owner
+
+
+def cases(owner):
+    """
+    Возвращает список (название списка, queryset, ModelSerializer, легкий сериализатор, context).
+    """
+    from django.contrib.auth.models import User
+
+    from friends.models import Friendship, FriendRequest
+    from friends.serializers import (
+        AllUsersSerializer,
+        FriendRequestSerializer,
+        FriendRequestValuesSerializer,
+        FriendshipSerializer,
+        FriendshipValuesSerializer,
+        UsernameValuesSerializer,
+    )
+
+    context = {"user": owner}
+    return [
+        (
+            "friend requests",
+            FriendRequest.objects.filter(to_user=owner).select_related("from_user", "to_user").order_by("-timestamp"),
+            FriendRequestSerializer,
+            FriendRequestValuesSerializer,
+            {},
+        ),
+        (
+            "friends",
+            Friendship.friendships_of(owner).order_by("-created_at"),
+            FriendshipSerializer,
+            FriendshipValuesSerializer,
+            context,
+        ),
+        (
+            "all users",
+            User.objects.exclude(pk=owner.pk).only("id", "username").order_by("username"),
+            AllUsersSerializer,
+            UsernameValuesSerializer,
+            {},
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="Количество строк в каждом списке")
+    parser.add_argument("--repeat", type=int, default=20, help="Количество замеров")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        from rest_framework.renderers import JSONRenderer
+
+        from friends import renderers
+        from friends.renderers import ORJSONRenderer
+
+        owner = seed(args.rows)
+        json_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+        rows = []
+        for name, queryset, model_serializer, values_serializer, context in cases(owner):
+            variants = {
+                "ModelSerializer + json": lambda: json_renderer.render(
+                    model_serializer(queryset.all(), many=True, context=context).data
+                ),
+                "values_list + json": lambda: json_renderer.render(
+                    values_serializer(values_serializer.values(queryset), context=context).data
+                ),
+            }
+            if renderers.orjson is not None:
+                variants["values_list + orjson"] = lambda: orjson_renderer.render(
+                    values_serializer(values_serializer.values(queryset), context=context).data
+                )
+            outputs = {func() for func in variants.values()}
+            assert len(outputs) == 1, f"{name}: варианты дают разные байты"
+
+            for variant, func in variants.items():
+                timings = measure(func, repeat=args.repeat)
+                rows.append(
+                    {
+                        "list": name,
+                        "variant": variant,
+                        "rows/s": round(args.rows / (timings["p50"] / 1000)),
+                        "p50": timings["p50"],
+                        "p95": timings["p95"],
+                    }
+                )
+        print(f"rows per list: {args.rows}, latency in ms")
+        print_table(rows, ["list", "variant", "rows/s", "p50", "p95"])
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -48,7 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "friends.middleware.ProfilingMiddleware",
+    "friends.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "friends.middleware.ReadYourWritesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -82,11 +85,58 @@ WSGI_APPLICATION = "drf.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE=postgres включает PostgreSQL (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT), по умолчанию - SQLite.
+# Соединения переиспользуются между запросами DB_CONN_MAX_AGE секунд и проверяются перед повторным использованием.
+# Пул соединений psycopg (OPTIONS["pool"]) появился только в Django 5.1, поэтому на 5.0 для пула нужен PgBouncer.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "friends"),
+            "USER": os.getenv("DB_USER", "friends"),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", "5432"),
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+        }
     }
+else:
+    # timeout - сколько секунд ждать снятия блокировки записи, прежде чем вернуть "database is locked"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DB_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {"timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "20"))},
+        }
+    }
+
+# Реплики только для чтения: DB_REPLICA_HOSTS - хосты реплик PostgreSQL через запятую, для SQLite
+# DB_REPLICA_NAMES - пути к файлам-копиям основной базы (для локальной проверки маршрутизации).
+# Каждый запрос читает из одной случайной реплики (friends.routers.ReplicaRouter), а после записи клиент на
+# FRIENDS_DB_PIN_SECONDS секунд читает из основной базы (friends.middleware.ReadYourWritesMiddleware).
+_replica_field = "HOST" if DB_ENGINE == "postgres" else "NAME"
+_replica_values = os.getenv("DB_REPLICA_HOSTS" if DB_ENGINE == "postgres" else "DB_REPLICA_NAMES", "")
+for _number, _value in enumerate(value.strip() for value in _replica_values.split(",") if value.strip()):
+    DATABASES[f"replica_{_number}"] = {
+        **DATABASES["default"],
+        _replica_field: _value,
+        "TEST": {"MIRROR": "default"},
+    }
+FRIENDS_DB_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+FRIENDS_DB_PIN_SECONDS = int(os.getenv("FRIENDS_DB_PIN_SECONDS", "5"))
+DATABASE_ROUTERS = ["friends.routers.ReplicaRouter"]
+
+# PRAGMA, выполняемые при каждом новом соединении с SQLite (friends.signals.configure_sqlite_connection):
+# WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL не теряет целостность при сбое процесса.
+FRIENDS_SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "20")) * 1000,
 }
 
 
@@ -136,10 +186,104 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "friends.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # FRIENDS_JSON_RENDERER=friends.renderers.ORJSONRenderer кодирует ответы через orjson (если он установлен)
+    "DEFAULT_RENDERER_CLASSES": [
+        os.getenv("FRIENDS_JSON_RENDERER", "rest_framework.renderers.JSONRenderer"),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Размер страницы по умолчанию и максимальный размер страницы для курсорной пагинации списков
+FRIENDS_PAGE_SIZE = int(os.getenv("FRIENDS_PAGE_SIZE", "50"))
+FRIENDS_MAX_PAGE_SIZE = int(os.getenv("FRIENDS_MAX_PAGE_SIZE", "200"))
+
+# Кэш множеств id друзей для подсчета общих друзей пользователей с большим числом друзей (FRIENDS_HOT_USER_DEGREE).
+# Проверки дружбы при записи выполняются в базе под блокировкой и кэш не читают. По умолчанию - LRU в памяти процесса
+# (max_entries=0 отключает кэш) со временем жизни множества ttl секунд: изменение дружбы сбрасывает множества
+# только в своем процессе, в остальных - по истечении ttl. friends.graph.DjangoCacheAdjacencyBackend хранит
+# множества в кэше Django (OPTIONS: alias, timeout, key_prefix), общем для всех процессов при сетевом бэкенде кэша.
+FRIENDS_GRAPH_CACHE = {
+    "BACKEND": "friends.graph.LocalAdjacencyBackend",
+    "OPTIONS": {
+        "max_entries": int(os.getenv("FRIENDS_GRAPH_CACHE_SIZE", "10000")),
+        "ttl": int(os.getenv("FRIENDS_GRAPH_CACHE_TTL", "60")),
+    },
+}
+# Кэш аутентификации по токену в памяти процесса: MAX_ENTRIES (0 отключает кэш) и время жизни записи TTL в секундах.
+# Удаление токена и изменение пользователя сбрасывают запись в текущем процессе, в остальных - по истечении TTL.
+FRIENDS_TOKEN_CACHE = {
+    "MAX_ENTRIES": int(os.getenv("FRIENDS_TOKEN_CACHE_SIZE", "10000")),
+    "TTL": int(os.getenv("FRIENDS_TOKEN_CACHE_TTL", "60")),
+}
+# Кэш готовых JSON-ответов профиля и списков друзей и заявок в кэше Django (ALIAS): TIMEOUT - время жизни
+# ответа в секундах (0 отключает кэш), LOCK_TIMEOUT и WAIT - время блокировки пересчета ответа и сколько
+# секунд остальные запросы ждут его результат. Ключ ответа включает версию данных пользователя из базы,
+# поэтому изменение данных сразу делает старые ответы недоступными во всех процессах.
+FRIENDS_RESPONSE_CACHE = {
+    "ALIAS": "default",
+    "TIMEOUT": int(os.getenv("FRIENDS_RESPONSE_CACHE_TIMEOUT", "300")),
+    "LOCK_TIMEOUT": 10,
+    "WAIT": 2,
+}
+# Пул хэширования паролей при регистрации: WORKERS исполнителей (0 - хэшировать в потоке запроса), не больше
+# MAX_PENDING ожидающих задач и TIMEOUT секунд ожидания результата; сверх этого регистрация получает 429
+# с заголовком Retry-After. EXECUTOR - "thread" или "process". Пул свой в каждом воркере gunicorn, а поток запроса
+# ждет хэш, поэтому пул ограничивает регистрации, только если потоков воркера (GUNICORN_THREADS в docker-compose.yml)
+# больше WORKERS + MAX_PENDING: остальные потоки обслуживают другие запросы.
+FRIENDS_PASSWORD_HASHING = {
+    "WORKERS": int(os.getenv("FRIENDS_HASHING_WORKERS", "4")),
+    "MAX_PENDING": int(os.getenv("FRIENDS_HASHING_MAX_PENDING", "4")),
+    "TIMEOUT": float(os.getenv("FRIENDS_HASHING_TIMEOUT", "5")),
+    "EXECUTOR": os.getenv("FRIENDS_HASHING_EXECUTOR", "thread"),
+    "RETRY_AFTER": 1,
+}
+# Максимальное количество имен пользователей в одном массовом запросе /bulk/...
+FRIENDS_BULK_MAX_USERNAMES = int(os.getenv("FRIENDS_BULK_MAX_USERNAMES", "500"))
+
+# Количество повторов транзакции с заявками и друзьями при конфликте блокировок
+FRIENDS_TRANSACTION_RETRIES = int(os.getenv("FRIENDS_TRANSACTION_RETRIES", "5"))
+
+# Начиная с этого числа друзей у обоих пользователей общие друзья считаются пересечением множеств из кэша
+FRIENDS_HOT_USER_DEGREE = int(os.getenv("FRIENDS_HOT_USER_DEGREE", "1000"))
+
+# Изменения рекомендаций друзей больше стольких строк записываются после ответа в фоновом потоке процесса
+# (friends.suggestions.schedule), меньшие - в потоке запроса сразу после фиксации транзакции
+FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS = int(os.getenv("FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS", "10000"))
+
+# Метрики запросов (friends.middleware.MetricsMiddleware): заголовок Server-Timing с временем SQL, сериализации
+# и отрисовки в каждом ответе и доступ к /metrics/ без аутентификации (по умолчанию - только администраторам,
+# в том числе по токену: Prometheus передает его в authorization с type: Token).
+FRIENDS_SERVER_TIMING = os.getenv("FRIENDS_SERVER_TIMING", "True") == "True"
+FRIENDS_METRICS_PUBLIC = os.getenv("FRIENDS_METRICS_PUBLIC", "False") == "True"
+
+# Шина событий потока /async/events/ (friends.events): LocalEventBus хранит события в памяти процесса, и их видят
+# только подписчики того же процесса. Если запись и поток обслуживают разные процессы (web и web-asgi), нужна
+# friends.events.DjangoCacheEventBus поверх общего кэша Django (Redis, Memcached). history - сколько последних
+# событий пользователя повторяется клиенту, переподключившемуся с Last-Event-ID.
+FRIENDS_EVENT_BUS = {
+    "BACKEND": os.getenv("FRIENDS_EVENT_BUS", "friends.events.LocalEventBus"),
+    "OPTIONS": {"history": int(os.getenv("FRIENDS_EVENT_HISTORY", "100"))},
+}
+# Поток событий: интервал heartbeat в секундах и задержка переподключения клиента в миллисекундах
+FRIENDS_EVENT_STREAM = {
+    "HEARTBEAT": float(os.getenv("FRIENDS_EVENT_HEARTBEAT", "15")),
+    "RETRY_MS": 3000,
+}
+
+# Профилирование выборки запросов (friends.profiling), которое включается и выключается эндпоинтом /profiling/
+# без перезапуска. Профили и файл настроек хранятся в DIRECTORY, общем для всех процессов сервера; процесс
+# перечитывает настройки раз в CONFIG_REFRESH секунд. Хранятся последние MAX_PROFILES профилей; TIMEOUT - через
+# сколько секунд профилирование выключится само, EXPLAIN_MS - порог времени SQL-запроса для EXPLAIN по умолчанию.
+FRIENDS_PROFILING = {
+    "DIRECTORY": os.getenv("FRIENDS_PROFILING_DIR", BASE_DIR / "profiles"),
+    "MAX_PROFILES": int(os.getenv("FRIENDS_PROFILING_MAX_PROFILES", "200")),
+    "CONFIG_REFRESH": 5,
+    "TIMEOUT": 3600,
+    "EXPLAIN_MS": 100,
 }
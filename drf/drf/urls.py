@@ -21,11 +21,25 @@ from django.contrib import admin
 from django.urls import include, path
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
+from friends import async_views
 from friends.views import (
     AcceptRequestFromUser,
     AllUsers,
+    BulkAcceptRequests,
+    BulkRejectRequests,
+    BulkSendRequests,
+    CacheStats,
     DeleteFriend,
+    FriendList,
+    FriendSuggestions,
+    GraphExport,
     Greetings,
+    IncomingFriendRequests,
+    Metrics,
+    MutualFriends,
+    OutgoingFriendRequests,
+    ProfileDetail,
+    Profiling,
     RejectRequestFromUser,
     SendRequestToUser,
     UserProfile,
@@ -58,11 +72,34 @@ urlpatterns = [
     path("", Greetings.as_view(), name="greetings"),
     path("admin/", admin.site.urls),
     path("api-auth/", include("rest_framework.urls"), name="api-auth"),
+    path("cache_stats/", CacheStats.as_view(), name="cache_stats"),
+    path("metrics/", Metrics.as_view(), name="metrics"),
+    path("profiling/", Profiling.as_view(), name="profiling"),
+    path("profiling/<str:profile_id>/", ProfileDetail.as_view(), name="profile_detail"),
     path("register/", UserRegister.as_view(), name="register"),
     path("accounts/profile/", UserProfile.as_view(), name="profile"),
     path("all_users/", AllUsers.as_view(), name="all_users"),
+    path("friends/", FriendList.as_view(), name="friends"),
+    path("friend_requests/incoming/", IncomingFriendRequests.as_view(), name="incoming_requests"),
+    path("friend_requests/outgoing/", OutgoingFriendRequests.as_view(), name="outgoing_requests"),
+    path("users/<str:username>/mutual_friends/", MutualFriends.as_view(), name="mutual_friends"),
+    path("suggestions/", FriendSuggestions.as_view(), name="suggestions"),
     path("send_request_to/", SendRequestToUser.as_view(), name="send_request"),
     path("accept_request_from/", AcceptRequestFromUser.as_view(), name="accept_request"),
     path("reject_request_from/", RejectRequestFromUser.as_view(), name="reject_request"),
     path("delete_friend/", DeleteFriend.as_view(), name="delete_friend"),
+    path("async/accounts/profile/", async_views.profile, name="async_profile"),
+    path("async/all_users/", async_views.all_users, name="async_all_users"),
+    path("async/friends/", async_views.friend_list, name="async_friends"),
+    path("async/friend_requests/incoming/", async_views.incoming_requests, name="async_incoming_requests"),
+    path("async/friend_requests/outgoing/", async_views.outgoing_requests, name="async_outgoing_requests"),
+    path("async/send_request_to/", async_views.send_request, name="async_send_request"),
+    path("async/accept_request_from/", async_views.accept_request, name="async_accept_request"),
+    path("async/reject_request_from/", async_views.reject_request, name="async_reject_request"),
+    path("async/delete_friend/", async_views.delete_friend, name="async_delete_friend"),
+    path("async/events/", async_views.event_stream, name="async_events"),
+    path("export/", GraphExport.as_view(), name="export"),
+    path("bulk/send_requests/", BulkSendRequests.as_view(), name="bulk_send_requests"),
+    path("bulk/accept_requests/", BulkAcceptRequests.as_view(), name="bulk_accept_requests"),
+    path("bulk/reject_requests/", BulkRejectRequests.as_view(), name="bulk_reject_requests"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
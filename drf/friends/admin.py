@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Friend, FriendRequest
+from .models import Friendship, FriendRequest, UserStats
 
 # Register your models here.
 admin.site.register(FriendRequest)
-admin.site.register(Friend)
+admin.site.register(Friendship)
+admin.site.register(UserStats)
@@ -0,0 +1,287 @@
+"""
+Асинхронные варианты представлений профиля, списков и заявок в друзья для запуска под ASGI.
+
+Представления DRF синхронные, поэтому здесь используются обычные асинхронные
+представления Django: чтение идет через асинхронный ORM (aget, afirst, async for),
+а операции с заявками, которым нужны транзакции и блокировки строк, выполняются
+сервисами из friends.services в пуле потоков через sync_to_async. Поток событий
+Server-Sent Events (friends.events) держит соединение открытым, не занимая поток.
+"""
+
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import NotFound
+
+from . import authentication, events, services
+from .models import Friendship, FriendRequest, User, UserStats
+from .pagination import FirstPageRequest, async_keyset_page
+from .serializers import (
+    FriendRequestValuesSerializer,
+    FriendshipValuesSerializer,
+    UsernameValuesSerializer,
+    UserProfileSummarySerializer,
+)
+from .views import filter_username_prefix
+
+
+def _response(data, status=200):
+    """
+    Возвращает JSON-ответ в той же кодировке, что и JSONRenderer DRF.
+    """
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={"ensure_ascii": False})
+
+
+def token_required(view):
+    """
+    Декоратор асинхронного представления, требующий аутентификацию по токену.
+
+    Аутентифицированный пользователь сохраняется в request.user, иначе возвращается 401.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await authentication.aauthenticate(request)
+        if user is None:
+            return _response({"detail": "Authentication credentials were not provided."}, status=401)
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
+
+
+def _username(request):
+    """
+    Возвращает username из JSON-тела или формы запроса.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data.get("username") if isinstance(data, dict) else None
+    return request.POST.get("username")
+
+
+async def _page_response(queryset, request, field, serialize, descending=True):
+    """
+    Возвращает ответ со страницей списка и ссылкой next либо 404 при некорректном курсоре.
+    """
+    try:
+        page, next_link = await async_keyset_page(queryset, request, field, descending=descending)
+    except NotFound as error:
+        return _response({"detail": str(error.detail)}, status=404)
+    return _response({"next": next_link, "results": serialize(page)})
+
+
+async def _stats_of(user):
+    try:
+        return await UserStats.objects.aget(user=user)
+    except UserStats.DoesNotExist:
+        return await sync_to_async(UserStats.for_user)(user)
+
+
+@require_GET
+@token_required
+async def profile(request):
+    """
+    Возвращает краткий профиль текущего пользователя: размеры списков друзей и заявок
+    и первую страницу каждого списка (аналог /accounts/profile/?mode=summary).
+    """
+    user = await User.objects.select_related("auth_token").aget(pk=request.user.pk)
+    stats = await _stats_of(user)
+    data = UserProfileSummarySerializer(user).data
+    lists = (
+        (
+            "friends",
+            "async_friends",
+            FriendshipValuesSerializer.values(Friendship.friendships_of(user), "pk"),
+            "created_at",
+            stats.friends_count,
+        ),
+        (
+            "friend_requests_sent",
+            "async_outgoing_requests",
+            FriendRequestValuesSerializer.values(FriendRequest.objects.filter(from_user=user), "pk"),
+            "timestamp",
+            stats.friend_requests_sent_count,
+        ),
+        (
+            "friend_requests_received",
+            "async_incoming_requests",
+            FriendRequestValuesSerializer.values(FriendRequest.objects.filter(to_user=user), "pk"),
+            "timestamp",
+            stats.friend_requests_received_count,
+        ),
+    )
+    for name, url_name, queryset, field, count in lists:
+        base_url = request.build_absolute_uri(reverse(url_name))
+        page, next_link = await async_keyset_page(queryset, FirstPageRequest(request), field, base_url=base_url)
+        if name == "friends":
+            results = FriendshipValuesSerializer(page, context={"user": user}).data
+        else:
+            results = FriendRequestValuesSerializer(page).data
+        data[name] = {"count": count, "next": next_link, "results": results}
+    return _response(data)
+
+
+@require_GET
+@token_required
+async def friend_list(request):
+    """
+    Возвращает страницу друзей текущего пользователя, от новых дружб к старым.
+    """
+    user = request.user
+    return await _page_response(
+        FriendshipValuesSerializer.values(Friendship.friendships_of(user), "pk"),
+        request,
+        "created_at",
+        lambda page: FriendshipValuesSerializer(page, context={"user": user}).data,
+    )
+
+
+@require_GET
+@token_required
+async def incoming_requests(request):
+    """
+    Возвращает страницу входящих заявок в друзья, от новых к старым.
+    """
+    return await _page_response(
+        FriendRequestValuesSerializer.values(FriendRequest.objects.filter(to_user=request.user), "pk"),
+        request,
+        "timestamp",
+        lambda page: FriendRequestValuesSerializer(page).data,
+    )
+
+
+@require_GET
+@token_required
+async def outgoing_requests(request):
+    """
+    Возвращает страницу исходящих заявок в друзья, от новых к старым.
+    """
+    return await _page_response(
+        FriendRequestValuesSerializer.values(FriendRequest.objects.filter(from_user=request.user), "pk"),
+        request,
+        "timestamp",
+        lambda page: FriendRequestValuesSerializer(page).data,
+    )
+
+
+@require_GET
+@token_required
+async def all_users(request):
+    """
+    Возвращает страницу всех пользователей, кроме текущего, по возрастанию имени (аналог /all_users/),
+    с фильтром по началу имени prefix.
+    """
+    users = UsernameValuesSerializer.values(User.objects.exclude(id=request.user.pk), "pk")
+    users = filter_username_prefix(users, request.GET.get("prefix"))
+    return await _page_response(
+        users, request, "username", lambda page: UsernameValuesSerializer(page).data, descending=False
+    )
+
+
+async def _target(request):
+    """
+    Возвращает пользователя из поля username запроса или None, если он не найден.
+    """
+    username = _username(request)
+    if not username:
+        return username, None
+    return username, await User.objects.filter(username=username).afirst()
+
+
+def _not_found():
+    return _response({"detail": "No User matches the given query."}, status=404)
+
+
+@require_POST
+@token_required
+async def send_request(request):
+    """
+    Отправляет заявку в друзья пользователю из поля username (аналог /send_request_to/).
+    """
+    username, friend = await _target(request)
+    if friend is None:
+        return _not_found()
+    if friend.pk == request.user.pk:
+        return _response("Нельзя отправить заявку в друзья самому себе", status=400)
+    result = await sync_to_async(services.send_request)(request.user, friend)
+    if result == services.ALREADY_FRIENDS:
+        return _response(f"{username} уже у вас в друзьях", status=400)
+    if result == services.ALREADY_SENT:
+        return _response("Такая заявка уже существует")
+    if result == services.ACCEPTED:
+        return _response(f"Вы добавили в друзья пользователя {friend}", status=201)
+    return _response(f"Вы отправили заявку в друзья пользователю {friend}", status=201)
+
+
+@require_POST
+@token_required
+async def accept_request(request):
+    """
+    Принимает заявку в друзья от пользователя из поля username (аналог /accept_request_from/).
+    """
+    username, friend = await _target(request)
+    if friend is None:
+        return _not_found()
+    if await sync_to_async(services.accept_request)(request.user, friend) == services.ACCEPTED:
+        return _response(f"Вы добавили {friend} в друзья", status=201)
+    return _response(f"Не удалось принять запрос в друзья от {username}", status=400)
+
+
+@require_POST
+@token_required
+async def reject_request(request):
+    """
+    Отклоняет заявку в друзья от пользователя из поля username (аналог /reject_request_from/).
+    """
+    username, friend = await _target(request)
+    if friend is None:
+        return _not_found()
+    if await sync_to_async(services.reject_request)(request.user, friend) == services.REJECTED:
+        return _response(f"Вы отклонили заявку в друзья от {friend}", status=201)
+    return _response(f"Не удалось отклонить запрос от {username}", status=400)
+
+
+@require_POST
+@token_required
+async def delete_friend(request):
+    """
+    Удаляет пользователя из поля username из друзей (аналог /delete_friend/).
+    """
+    username, friend = await _target(request)
+    if friend is None:
+        return _not_found()
+    if friend.pk == request.user.pk:
+        return _response("Нельзя удалить самого себя из друзей", status=400)
+    if await sync_to_async(services.delete_friend)(request.user, friend) == services.NOT_FRIENDS:
+        return _response(f"{username} не является вашим другом", status=400)
+    return _response(f"Вы удалили {friend} из друзей", status=201)
+
+
+@require_GET
+@token_required
+async def event_stream(request):
+    """
+    Поток Server-Sent Events с событиями заявок и друзей текущего пользователя (friends.events).
+
+    Клиент, переподключившийся с заголовком Last-Event-ID (или параметром last_event_id),
+    получает пропущенные события; без него поток начинается с новых событий.
+    """
+    last_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    if last_id is not None:
+        if not last_id.isdigit():
+            return _response({"detail": "Некорректный Last-Event-ID"}, status=400)
+        last_id = int(last_id)
+    response = StreamingHttpResponse(events.stream(request.user.pk, last_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Отключает буферизацию ответа в nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
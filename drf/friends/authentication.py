@@ -0,0 +1,118 @@
+import copy
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import routers
+from .lru import LRUCache
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Возвращает кэш токенов текущего процесса, создавая его по настройке FRIENDS_TOKEN_CACHE.
+
+    FRIENDS_TOKEN_CACHE - словарь с ключами MAX_ENTRIES (0 - кэш отключен) и TTL (секунды).
+    """
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                options = getattr(settings, "FRIENDS_TOKEN_CACHE", {})
+                _cache = LRUCache(options.get("MAX_ENTRIES", 10000), ttl=options.get("TTL", 60))
+    return _cache
+
+
+@receiver(setting_changed)
+def reset_cache(setting, **kwargs):
+    """
+    Пересоздает кэш токенов при изменении FRIENDS_TOKEN_CACHE (например, в тестах).
+    """
+    global _cache
+    if setting == "FRIENDS_TOKEN_CACHE":
+        _cache = None
+
+
+def invalidate(*keys):
+    """
+    Удаляет из кэша записи с указанными ключами токенов.
+    """
+    get_cache().delete(*keys)
+
+
+def stats():
+    """
+    Возвращает размер кэша токенов и счетчики попаданий и промахов в текущем процессе.
+    """
+    counters = get_cache().stats()
+    total = counters["hits"] + counters["misses"]
+    counters["hit_rate"] = round(counters["hits"] / total, 4) if total else None
+    return counters
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшированием пары (пользователь, токен) в памяти процесса.
+
+    Повторные запросы с тем же токеном не обращаются к базе. Записи живут не дольше TTL
+    и вытесняются при превышении MAX_ENTRIES; при удалении или замене токена и при изменении
+    пользователя (например, деактивации) запись сбрасывается сигналами из friends.signals.
+    Сигналы сбрасывают кэш только в своем процессе, в остальных процессах запись
+    доживает до истечения TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        cached = cache.get(key)
+        if cached is None:
+            # Кэшируемый токен читается из основной базы, чтобы не закэшировать удаленный токен с реплики
+            with routers.use_primary():
+                user, token = super().authenticate_credentials(key)
+            cache.set(key, (user, token))
+        else:
+            user, token = cached
+            if not user.is_active:
+                raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        # Закэшированные объекты общие для потоков, поэтому запрос получает свои копии
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+
+async def aauthenticate(request):
+    """
+    Асинхронно аутентифицирует запрос по заголовку Authorization: Token <ключ>.
+
+    Использует тот же кэш, что и CachedTokenAuthentication, а при промахе читает
+    токен асинхронным ORM.
+
+    :param request: HTTP-запрос Django.
+    :return: Копия пользователя или None, если токен не передан, неизвестен или пользователь неактивен.
+    """
+    header = request.headers.get("Authorization", "").split()
+    if len(header) != 2 or header[0] != CachedTokenAuthentication.keyword:
+        return None
+    key = header[1]
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is None:
+        try:
+            with routers.use_primary():
+                token = await Token.objects.select_related("user").aget(key=key)
+        except Token.DoesNotExist:
+            return None
+        cached = (token.user, token)
+        cache.set(key, cached)
+    user = cached[0]
+    if not user.is_active:
+        return None
+    return copy.copy(user)
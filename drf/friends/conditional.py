@@ -0,0 +1,46 @@
+import hashlib
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .models import UserStats
+
+
+def user_version(request):
+    """
+    Возвращает (версия, время изменения) данных текущего пользователя, читая их один раз за запрос.
+    """
+    cached = getattr(request, "_friends_user_version", None)
+    if cached is None:
+        cached = UserStats.objects.filter(user_id=request.user.pk).values_list("version", "updated_at").first()
+        if cached is None:
+            stats = UserStats.for_user(request.user)
+            cached = (stats.version, stats.updated_at)
+        request._friends_user_version = cached
+    return cached
+
+
+def user_etag(request, *args, **kwargs):
+    """
+    Возвращает сильный ETag ответа по версии данных пользователя.
+
+    Ответ зависит от пользователя, версии его друзей, заявок и токена, полного пути запроса
+    (режим, курсор, размер страницы) и формата ответа (заголовок Accept).
+    """
+    version, _ = user_version(request)
+    accept = request.META.get("HTTP_ACCEPT", "")
+    key = f"{request.user.pk}:{version}:{request.get_full_path()}:{accept}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def user_last_modified(request, *args, **kwargs):
+    """
+    Возвращает время последнего изменения друзей и заявок пользователя.
+    """
+    return user_version(request)[1]
+
+
+# Декоратор метода get представления DRF: на запросы с совпадающим If-None-Match (или If-Modified-Since)
+# отвечает 304 до выполнения запросов к спискам и сериализации, а к ответу 200 добавляет ETag и Last-Modified.
+# Применяется к методу, а не к dispatch, чтобы проверка шла после аутентификации DRF.
+user_conditional = method_decorator(condition(etag_func=user_etag, last_modified_func=user_last_modified))
@@ -0,0 +1,286 @@
+"""
+События заявок и друзей для потока Server-Sent Events /async/events/.
+
+Сервисы friends.services публикуют события после фиксации транзакции (publish_on_commit):
+    friend_request_received - пользователю пришла заявка в друзья;
+    request_accepted - заявку пользователя приняли;
+    request_rejected - заявку пользователя отклонили;
+    friend_removed - пользователя удалили из друзей.
+В данных события - имя пользователя, который выполнил действие, и время события.
+
+События доставляются через шину, заданную настройкой FRIENDS_EVENT_BUS. У каждого пользователя своя
+последовательность id событий, поэтому клиент, переподключившийся с Last-Event-ID, получает пропущенные
+события из истории шины. Если часть пропущенных событий уже вытеснена из истории или шина перезапущена,
+клиент получает событие resync и должен перечитать заявки и друзей.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+# Типы событий
+FRIEND_REQUEST_RECEIVED = "friend_request_received"
+REQUEST_ACCEPTED = "request_accepted"
+REQUEST_REJECTED = "request_rejected"
+FRIEND_REMOVED = "friend_removed"
+RESYNC = "resync"
+
+Event = namedtuple("Event", ["id", "type", "data"])
+
+
+class _LocalStream:
+    __slots__ = ("last_id", "events", "waiters")
+
+    def __init__(self, history):
+        self.last_id = 0
+        self.events = deque(maxlen=history)
+        self.waiters = set()
+
+
+class LocalEventBus:
+    """
+    Шина событий в памяти процесса.
+
+    События видят только подписчики того же процесса, поэтому шина подходит для одного процесса
+    ASGI-сервера и для тестов. Публикация из потоков сервисов будит подписчиков в цикле событий
+    через call_soon_threadsafe.
+
+    Параметры:
+        history: Сколько последних событий каждого пользователя хранить для повтора по Last-Event-ID.
+        max_users: Сколько пользователей хранить; вытесняются давно не получавшие событий пользователи
+            без подписчиков.
+    """
+
+    def __init__(self, history=100, max_users=10000):
+        self.history = history
+        self.max_users = max_users
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event_type, data):
+        """
+        Публикует событие пользователю и возвращает его.
+        """
+        with self._lock:
+            stream = self._streams.get(user_id)
+            if stream is None:
+                stream = self._streams[user_id] = _LocalStream(self.history)
+                self._evict()
+            self._streams.move_to_end(user_id)
+            stream.last_id += 1
+            event = Event(stream.last_id, event_type, data)
+            stream.events.append(event)
+            waiters = list(stream.waiters)
+        for loop, signal in waiters:
+            loop.call_soon_threadsafe(signal.set)
+        return event
+
+    def _evict(self):
+        if len(self._streams) <= self.max_users:
+            return
+        for user_id, stream in self._streams.items():
+            if not stream.waiters:
+                del self._streams[user_id]
+                return
+
+    async def last_id(self, user_id):
+        """
+        Возвращает id последнего события пользователя (0, если событий не было).
+        """
+        with self._lock:
+            stream = self._streams.get(user_id)
+            return stream.last_id if stream else 0
+
+    def _after(self, user_id, after_id):
+        stream = self._streams.get(user_id)
+        last_id = stream.last_id if stream else 0
+        if after_id == last_id:
+            return []
+        # При history=0 история пуста, и пропущенные события повторить нельзя, как и вытесненные
+        if after_id > last_id or not stream.events or stream.events[0].id > after_id + 1:
+            return [Event(last_id, RESYNC, {})]
+        return [event for event in stream.events if event.id > after_id]
+
+    async def listen(self, user_id, after_id, timeout):
+        """
+        Возвращает события пользователя после after_id, ожидая их не дольше timeout секунд (иначе пустой список).
+        """
+        signal = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), signal)
+        with self._lock:
+            events = self._after(user_id, after_id)
+            if events:
+                return events
+            self._streams.setdefault(user_id, _LocalStream(self.history)).waiters.add(waiter)
+        try:
+            try:
+                await asyncio.wait_for(signal.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            with self._lock:
+                return self._after(user_id, after_id)
+        finally:
+            with self._lock:
+                stream = self._streams.get(user_id)
+                if stream is not None:
+                    stream.waiters.discard(waiter)
+
+
+class DjangoCacheEventBus:
+    """
+    Шина событий поверх кэша Django, общая для всех процессов при сетевом кэше (Redis, Memcached).
+
+    id событий пользователя выдает атомарный cache.incr, события хранятся отдельными ключами
+    с временем жизни timeout. Подписчик опрашивает счетчик пользователя раз в poll_interval секунд.
+
+    Параметры:
+        alias: Имя кэша из настройки CACHES.
+        history: Сколько последних событий пользователя можно повторить по Last-Event-ID.
+        timeout: Время жизни события в секундах.
+        poll_interval: Интервал опроса счетчика событий в секундах.
+        key_prefix: Префикс ключей.
+    """
+
+    def __init__(self, alias="default", history=100, timeout=3600, poll_interval=1.0, key_prefix="friends:events"):
+        self.cache = caches[alias]
+        self.history = history
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+
+    def _sequence_key(self, user_id):
+        return f"{self.key_prefix}:{user_id}:last"
+
+    def _event_key(self, user_id, event_id):
+        return f"{self.key_prefix}:{user_id}:{event_id}"
+
+    def publish(self, user_id, event_type, data):
+        """
+        Публикует событие пользователю и возвращает его.
+        """
+        key = self._sequence_key(user_id)
+        self.cache.add(key, 0, None)
+        try:
+            event_id = self.cache.incr(key)
+        except ValueError:
+            # Счетчик вытеснен из кэша между add и incr
+            self.cache.add(key, 0, None)
+            event_id = self.cache.incr(key)
+        self.cache.set(self._event_key(user_id, event_id), (event_type, data), self.timeout)
+        return Event(event_id, event_type, data)
+
+    async def last_id(self, user_id):
+        """
+        Возвращает id последнего события пользователя (0, если событий не было).
+        """
+        return await self.cache.aget(self._sequence_key(user_id)) or 0
+
+    async def listen(self, user_id, after_id, timeout):
+        """
+        Возвращает события пользователя после after_id, ожидая их не дольше timeout секунд (иначе пустой список).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            last_id = await self.last_id(user_id)
+            if last_id != after_id:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            await asyncio.sleep(min(self.poll_interval, remaining))
+        if after_id > last_id or last_id - after_id > self.history:
+            return [Event(last_id, RESYNC, {})]
+        keys = {self._event_key(user_id, event_id): event_id for event_id in range(after_id + 1, last_id + 1)}
+        found = await self.cache.aget_many(keys)
+        if len(found) < len(keys):
+            # Часть событий истекла
+            return [Event(last_id, RESYNC, {})]
+        return [Event(event_id, *found[key]) for key, event_id in keys.items()]
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    """
+    Возвращает шину событий, созданную по настройке FRIENDS_EVENT_BUS.
+    """
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                config = settings.FRIENDS_EVENT_BUS
+                _bus = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+    return _bus
+
+
+@receiver(setting_changed)
+def reset_bus(setting, **kwargs):
+    """
+    Пересоздает шину событий при изменении FRIENDS_EVENT_BUS (например, в тестах).
+    """
+    global _bus
+    if setting == "FRIENDS_EVENT_BUS":
+        _bus = None
+
+
+def publish_on_commit(event_type, actor, recipient_ids):
+    """
+    Публикует событие event_type от пользователя actor пользователям recipient_ids после фиксации транзакции.
+
+    Если транзакция откатится (в том числе перед повтором в atomic_with_retry), событие не публикуется.
+    Ошибка шины не отменяет уже зафиксированную операцию, а только записывается в лог.
+    """
+    recipient_ids = list(recipient_ids)
+    if not recipient_ids:
+        return
+    username = actor.username
+
+    def publish():
+        bus = get_bus()
+        data = {"username": username, "created_at": datetime.now(timezone.utc).isoformat()}
+        for user_id in recipient_ids:
+            bus.publish(user_id, event_type, data)
+
+    transaction.on_commit(publish, robust=True)
+
+
+def format_event(event):
+    """
+    Возвращает событие в формате text/event-stream.
+    """
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, ensure_ascii=False)}\n\n"
+
+
+async def stream(user_id, last_id=None):
+    """
+    Асинхронный генератор потока событий пользователя в формате text/event-stream.
+
+    Начинается с задержки переподключения (retry) и событий после last_id (если он передан),
+    затем отдает новые события по мере публикации, а при их отсутствии - комментарий-heartbeat
+    раз в FRIENDS_EVENT_STREAM["HEARTBEAT"] секунд, чтобы прокси не закрывали соединение.
+    """
+    options = settings.FRIENDS_EVENT_STREAM
+    bus = get_bus()
+    yield f"retry: {options['RETRY_MS']}\n\n"
+    if last_id is None:
+        last_id = await bus.last_id(user_id)
+    while True:
+        events = await bus.listen(user_id, last_id, options["HEARTBEAT"])
+        if not events:
+            yield ": heartbeat\n\n"
+            continue
+        for event in events:
+            yield format_event(event)
+            last_id = event.id
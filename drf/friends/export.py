@@ -0,0 +1,127 @@
+"""
+Потоковый экспорт графа друзей в NDJSON и CSV.
+
+Экспорт состоит из записей трех типов, одинаковых в обоих форматах:
+
+    {"type": "user", "username": ..., "email": ..., "created_at": ...}
+    {"type": "friendship", "from_user": ..., "to_user": ..., "created_at": ...}
+    {"type": "friend_request", "from_user": ..., "to_user": ..., "created_at": ...}
+
+Сначала идут пользователи, затем дружбы и заявки, поэтому при импорте все участники
+ребра уже известны. Дружба неориентированна: from_user - участник с меньшим id.
+Все строки читаются через iterator(chunk_size) без кэша queryset, поэтому память
+не зависит от размера графа.
+"""
+
+import csv
+import functools
+import json
+import operator
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .models import Friendship, FriendRequest
+from .serializers import _datetime_formatter
+
+# Колонки CSV: объединение полей записей всех типов
+FIELDS = ("type", "username", "email", "from_user", "to_user", "created_at")
+
+FORMATS = ("ndjson", "csv")
+
+
+def export_records(user=None, chunk_size=2000):
+    """
+    Возвращает генератор записей экспорта всего графа или графа одного пользователя.
+
+    Экспорт пользователя содержит его самого (с email), его друзей и участников его заявок
+    (без email), все его дружбы и входящие и исходящие заявки.
+
+    Аргументы:
+        user: Пользователь, граф которого экспортируется; None - весь граф.
+        chunk_size: Сколько строк читать из базы за один раз.
+    """
+    format_datetime = _datetime_formatter()
+    users = User.objects.all()
+    friendships = Friendship.objects.all()
+    requests = FriendRequest.objects.all()
+    if user is not None:
+        as_low, as_high = Friendship.friend_ids(user)
+        participants = (
+            Q(pk=user.pk),
+            Q(id__in=as_low),
+            Q(id__in=as_high),
+            Q(id__in=requests.filter(from_user=user).values("to_user_id")),
+            Q(id__in=requests.filter(to_user=user).values("from_user_id")),
+        )
+        users = users.filter(functools.reduce(operator.or_, participants))
+        friendships = friendships.filter(Q(user_low=user) | Q(user_high=user))
+        requests = requests.filter(Q(from_user=user) | Q(to_user=user))
+
+    rows = users.order_by("id").values_list("id", "username", "email", "date_joined")
+    for user_id, username, email, date_joined in rows.iterator(chunk_size=chunk_size):
+        record = {"type": "user", "username": username}
+        if user is None or user_id == user.pk:
+            record["email"] = email
+        record["created_at"] = format_datetime(date_joined)
+        yield record
+
+    edges = (
+        ("friendship", friendships, ("user_low__username", "user_high__username", "created_at")),
+        ("friend_request", requests, ("from_user__username", "to_user__username", "timestamp")),
+    )
+    for record_type, queryset, columns in edges:
+        rows = queryset.order_by("id").values_list(*columns)
+        for from_user, to_user, created_at in rows.iterator(chunk_size=chunk_size):
+            yield {
+                "type": record_type,
+                "from_user": from_user,
+                "to_user": to_user,
+                "created_at": format_datetime(created_at),
+            }
+
+
+def iter_ndjson(records, batch_size=500):
+    """
+    Кодирует записи в строки NDJSON и отдает их пачками по batch_size строк.
+    """
+    batch = []
+    for record in records:
+        batch.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if len(batch) >= batch_size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+class _Echo:
+    """
+    Объект с методом write, возвращающим переданную строку: csv.writer пишет в него строки по одной.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(records, batch_size=500):
+    """
+    Кодирует записи в строки CSV с заголовком FIELDS и отдает их пачками по batch_size строк.
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=FIELDS)
+    batch = [writer.writeheader()]
+    for record in records:
+        batch.append(writer.writerow(record))
+        if len(batch) >= batch_size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def iter_export(output_format, user=None, chunk_size=2000):
+    """
+    Возвращает генератор пачек текста экспорта в формате output_format ("ndjson" или "csv").
+    """
+    records = export_records(user, chunk_size=chunk_size)
+    return iter_csv(records) if output_format == "csv" else iter_ndjson(records)
@@ -0,0 +1,223 @@
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import routers
+from .lru import LRUCache
+from .models import Friendship, UserStats
+
+
+class LocalAdjacencyBackend:
+    """
+    Бэкенд кэша смежности в памяти процесса с вытеснением давно неиспользуемых множеств.
+
+    Изменение дружбы сбрасывает множества только в том процессе, где оно выполнено, поэтому
+    в остальных процессах множество может оставаться устаревшим не дольше ttl секунд.
+
+    Параметры:
+        max_entries: Максимальное количество закэшированных пользователей (0 - кэш отключен).
+        ttl: Время жизни множества в секундах (None - без ограничения, только для одного процесса).
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.cache = LRUCache(max_entries, ttl=ttl)
+
+    @property
+    def enabled(self):
+        return self.cache.max_entries > 0
+
+    def get(self, user_id):
+        """
+        Возвращает множество id друзей пользователя или None при промахе.
+        """
+        return self.cache.get(user_id)
+
+    def set(self, user_id, friend_ids):
+        """
+        Сохраняет множество id друзей пользователя.
+        """
+        self.cache.set(user_id, friend_ids)
+
+    def delete(self, user_ids):
+        """
+        Удаляет множества друзей указанных пользователей.
+        """
+        self.cache.delete(*user_ids)
+
+
+class DjangoCacheAdjacencyBackend:
+    """
+    Бэкенд кэша смежности поверх кэша Django, общий для всех процессов при сетевом кэше.
+
+    Размер и вытеснение определяются настройками выбранного кэша Django.
+
+    Параметры:
+        alias: Имя кэша из настройки CACHES.
+        timeout: Время жизни множества в секундах.
+        key_prefix: Префикс ключей.
+    """
+
+    enabled = True
+
+    def __init__(self, alias="default", timeout=300, key_prefix="friends:adjacency"):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def _key(self, user_id):
+        return f"{self.key_prefix}:{user_id}"
+
+    def get(self, user_id):
+        """
+        Возвращает множество id друзей пользователя или None при промахе.
+        """
+        friend_ids = self.cache.get(self._key(user_id))
+        return None if friend_ids is None else frozenset(friend_ids)
+
+    def set(self, user_id, friend_ids):
+        """
+        Сохраняет множество id друзей пользователя.
+        """
+        self.cache.set(self._key(user_id), list(friend_ids), self.timeout)
+
+    def delete(self, user_ids):
+        """
+        Удаляет множества друзей указанных пользователей.
+        """
+        self.cache.delete_many([self._key(user_id) for user_id in user_ids])
+
+
+_backend = None
+_counters = {"hits": 0, "misses": 0}
+_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Возвращает бэкенд кэша смежности, созданный по настройке FRIENDS_GRAPH_CACHE.
+    """
+    global _backend
+    if _backend is None:
+        config = settings.FRIENDS_GRAPH_CACHE
+        _backend = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    """
+    Пересоздает бэкенд и сбрасывает счетчики при изменении FRIENDS_GRAPH_CACHE (например, в тестах).
+    """
+    global _backend
+    if setting == "FRIENDS_GRAPH_CACHE":
+        _backend = None
+        reset_stats()
+
+
+def stats():
+    """
+    Возвращает счетчики попаданий и промахов кэша смежности в текущем процессе.
+    """
+    with _lock:
+        hits, misses = _counters["hits"], _counters["misses"]
+    total = hits + misses
+    return {
+        "backend": type(get_backend()).__name__,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    """
+    Обнуляет счетчики попаданий и промахов.
+    """
+    with _lock:
+        _counters["hits"] = _counters["misses"] = 0
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def friend_id_set(user_id):
+    """
+    Возвращает множество id друзей пользователя, загружая его из базы при промахе кэша.
+
+    :param user_id: id пользователя.
+    :return: frozenset id друзей.
+    """
+    backend = get_backend()
+    friend_ids = backend.get(user_id) if backend.enabled else None
+    if friend_ids is not None:
+        _count("hits")
+        return friend_ids
+    _count("misses")
+    # Кэшируемое множество читается из основной базы: отстающая реплика вернула бы его
+    # без только что зафиксированных изменений, и оно жило бы в кэше до следующего сброса
+    with routers.use_primary():
+        friend_ids = frozenset(load_adjacency([user_id])[user_id])
+    if backend.enabled:
+        backend.set(user_id, friend_ids)
+    return friend_ids
+
+
+def chunked(items, size):
+    """
+    Разбивает итерируемый набор на списки длиной не больше size.
+    """
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def load_adjacency(user_ids, chunk_size=500):
+    """
+    Загружает из базы множества id друзей для группы пользователей, минуя кэш.
+
+    :param user_ids: Итерируемый набор id пользователей.
+    :param chunk_size: Количество id в одном условии IN.
+    :return: Словарь {id пользователя: множество id друзей}.
+    """
+    adjacency = {user_id: set() for user_id in user_ids}
+    for chunk in chunked(adjacency, chunk_size):
+        for low, high in Friendship.objects.filter(user_low_id__in=chunk).values_list("user_low_id", "user_high_id"):
+            adjacency[low].add(high)
+        for low, high in Friendship.objects.filter(user_high_id__in=chunk).values_list("user_low_id", "user_high_id"):
+            adjacency[high].add(low)
+    return adjacency
+
+
+def are_hot(*user_ids):
+    """
+    Проверяет, что у всех пользователей не меньше FRIENDS_HOT_USER_DEGREE друзей.
+
+    Для таких пользователей пересечение множеств из кэша дешевле SQL-соединения,
+    для остальных загрузка множеств при промахе дороже самого соединения.
+    """
+    if not get_backend().enabled:
+        return False
+    degrees = UserStats.objects.filter(user_id__in=user_ids).values_list("friends_count", flat=True)
+    degrees = list(degrees)
+    return len(degrees) == len(set(user_ids)) and min(degrees) >= settings.FRIENDS_HOT_USER_DEGREE
+
+
+def mutual_friend_ids(first_id, second_id):
+    """
+    Возвращает множество id общих друзей как пересечение множеств смежности.
+    """
+    return friend_id_set(first_id) & friend_id_set(second_id)
+
+
+def invalidate(*user_ids):
+    """
+    Удаляет из кэша множества друзей указанных пользователей.
+    """
+    get_backend().delete(user_ids)
@@ -0,0 +1,139 @@
+"""
+Загрузка графа друзей из NDJSON или CSV в формате выгрузки friends.export.
+
+Записи загружаются пачками: пользователи, их токены и строки UserStats, дружбы и заявки
+создаются несколькими bulk_create с ignore_conflicts на пачку, поэтому повторная загрузка
+тех же записей ничего не дублирует. Сигналы post_save при bulk_create не отправляются:
+токены и счетчики создаются здесь же пачкой, а не запросом на каждого пользователя.
+Участники дружбы или заявки должны быть загружены раньше нее (в той же или в предыдущей пачке).
+"""
+
+import csv
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.authtoken.models import Token
+
+from . import graph
+from .export import FIELDS
+from .models import Friendship, FriendRequest, UserStats
+
+
+def read_records(lines, input_format, skip=0):
+    """
+    Возвращает генератор записей из строк файла выгрузки.
+
+    Аргументы:
+        lines: Итерируемый набор строк файла (например, открытый файл).
+        input_format: "ndjson" или "csv".
+        skip: Сколько первых записей пропустить (продолжение с контрольной точки).
+    """
+    if input_format == "csv":
+        for number, row in enumerate(csv.DictReader(lines)):
+            if number >= skip:
+                yield {field: value for field, value in row.items() if field in FIELDS and value != ""}
+        return
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        if number >= skip:
+            yield json.loads(line)
+        number += 1
+
+
+def _parse_datetime(value):
+    """
+    Возвращает дату записи с часовым поясом или текущее время, если дата не указана.
+    """
+    if not value:
+        return timezone.now()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Некорректная дата: {value}")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+@contextmanager
+def preserve_timestamps():
+    """
+    Контекстный менеджер, внутри которого bulk_create сохраняет даты дружб и заявок из записей.
+
+    Поля created_at и timestamp заполняются автоматически (auto_now_add) и при обычном создании
+    получают текущее время; при загрузке нужны исходные даты, поэтому автозаполнение
+    на время загрузки отключается.
+    """
+    fields = [Friendship._meta.get_field("created_at"), FriendRequest._meta.get_field("timestamp")]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def import_batch(records):
+    """
+    Загружает пачку записей и возвращает счетчики обработанных записей по типам.
+
+    Вызывается внутри транзакции и контекста preserve_timestamps. Ключи результата:
+    user, friendship, friend_request - записи этих типов (включая уже существующие),
+    skipped - записи неизвестного типа или без имени пользователя, ребра с неизвестными
+    участниками и ребра пользователя с самим собой.
+    """
+    counts = Counter()
+    users = [record for record in records if record.get("type") == "user" and record.get("username")]
+    edges = [record for record in records if record.get("type") in ("friendship", "friend_request")]
+    counts["skipped"] = len(records) - len(users) - len(edges)
+
+    usernames = {record["username"] for record in users}
+    # Пароли старой системы не переносятся: новый пароль задается при восстановлении доступа
+    unusable_password = make_password(None)
+    User.objects.bulk_create(
+        [
+            User(
+                username=record["username"],
+                email=record.get("email", ""),
+                date_joined=_parse_datetime(record.get("created_at")),
+                password=unusable_password,
+            )
+            for record in users
+        ],
+        ignore_conflicts=True,
+    )
+    usernames.update(name for record in edges for name in (record.get("from_user"), record.get("to_user")))
+    ids = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+    user_ids = [ids[record["username"]] for record in users]
+    # Token.save не вызывается при bulk_create, поэтому ключи генерируются здесь
+    Token.objects.bulk_create(
+        [Token(key=Token.generate_key(), user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+    counts["user"] = len(users)
+
+    friendships, requests, touched = [], [], set(user_ids)
+    for record in edges:
+        from_id, to_id = ids.get(record.get("from_user")), ids.get(record.get("to_user"))
+        if from_id is None or to_id is None or from_id == to_id:
+            counts["skipped"] += 1
+            continue
+        created_at = _parse_datetime(record.get("created_at"))
+        if record["type"] == "friendship":
+            low, high = Friendship.ordered_pair(from_id, to_id)
+            friendships.append(Friendship(user_low_id=low, user_high_id=high, created_at=created_at))
+        else:
+            requests.append(FriendRequest(from_user_id=from_id, to_user_id=to_id, timestamp=created_at))
+        counts[record["type"]] += 1
+        touched.update((from_id, to_id))
+    Friendship.objects.bulk_create(friendships, ignore_conflicts=True)
+    FriendRequest.objects.bulk_create(requests, ignore_conflicts=True)
+
+    # Создает недостающие строки счетчиков и пересчитывает счетчики участников новых ребер
+    UserStats.recount(touched)
+    graph.invalidate(*touched)
+    return counts
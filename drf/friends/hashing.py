@@ -0,0 +1,136 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import exceptions
+
+_pool = None
+_lock = threading.Lock()
+
+
+class HashingPoolSaturated(exceptions.Throttled):
+    """
+    Исключение, когда пул хэширования паролей занят и очередь заполнена.
+
+    Отдается клиенту как 429 Too Many Requests с заголовком Retry-After.
+    """
+
+    default_detail = "Слишком много регистраций одновременно, повторите запрос позже."
+
+
+def _setup_worker():
+    """
+    Инициализирует Django в процессе пула, если процесс запущен не через fork.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+class HashingPool:
+    """
+    Ограниченный пул для хэширования паролей вне потока обработки запроса.
+
+    Одновременно выполняется не больше workers хэшей и ожидает в очереди не больше
+    max_pending; при заполнении очереди задача сразу отклоняется, а не ждет свободного
+    исполнителя. Поток запроса ждет результат, поэтому пул разгружает сервер, только если
+    у воркера больше потоков, чем workers + max_pending (gunicorn --worker-class gthread --threads):
+    всплеск регистраций занимает не больше workers + max_pending потоков, остальные обслуживают
+    другие запросы.
+
+    Параметры:
+        workers: Количество исполнителей (0 - хэшировать в потоке запроса без ограничений).
+        max_pending: Количество задач, ожидающих свободного исполнителя.
+        timeout: Сколько секунд ждать результата, прежде чем отклонить запрос.
+        executor: "thread" (hashlib отпускает GIL во время PBKDF2) или "process".
+        retry_after: Значение заголовка Retry-After в секундах для отклоненных запросов.
+    """
+
+    def __init__(self, workers=4, max_pending=16, timeout=5, executor="thread", retry_after=1):
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(workers + max_pending) if workers > 0 else None
+        self._executor = None
+        if workers > 0 and executor == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker)
+        elif workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing")
+
+    def submit(self, func, *args):
+        """
+        Выполняет функцию в пуле и возвращает ее результат.
+
+        :raises HashingPoolSaturated: Если очередь заполнена или результат не получен за timeout.
+        """
+        if self._executor is None:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolSaturated(wait=self.retry_after)
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingPoolSaturated(wait=self.retry_after)
+
+    def shutdown(self):
+        """
+        Останавливает исполнителей пула, не дожидаясь завершения задач.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_pool():
+    """
+    Возвращает пул хэширования текущего процесса, создавая его по настройке FRIENDS_PASSWORD_HASHING.
+    """
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                options = getattr(settings, "FRIENDS_PASSWORD_HASHING", {})
+                _pool = HashingPool(
+                    workers=options.get("WORKERS", 4),
+                    max_pending=options.get("MAX_PENDING", 16),
+                    timeout=options.get("TIMEOUT", 5),
+                    executor=options.get("EXECUTOR", "thread"),
+                    retry_after=options.get("RETRY_AFTER", 1),
+                )
+    return _pool
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    """
+    Пересоздает пул при изменении FRIENDS_PASSWORD_HASHING (например, в тестах).
+    """
+    global _pool
+    if setting == "FRIENDS_PASSWORD_HASHING":
+        with _lock:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = None
+
+
+def make_password(password):
+    """
+    Хэширует пароль настроенным хэшером Django в пуле хэширования.
+
+    :param password: Пароль в открытом виде.
+    :return: Закодированный хэш пароля для поля User.password.
+    :raises HashingPoolSaturated: Если пул перегружен.
+    """
+    return get_pool().submit(hashers.make_password, password)
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Потокобезопасный кэш в памяти процесса с вытеснением давно неиспользуемых записей.
+
+    Размер ограничен max_entries; при указании ttl записи старше ttl секунд считаются
+    отсутствующими. Счетчики hits/misses позволяют оценить эффективность кэша.
+
+    Методы:
+        get: Возвращает значение по ключу или default.
+        set: Сохраняет значение по ключу.
+        delete: Удаляет значения по ключам.
+        clear: Очищает кэш и счетчики.
+        stats: Возвращает размер кэша и счетчики попаданий и промахов.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Возвращает значение по ключу и отмечает запись как недавно использованную.
+        """
+        with self._lock:
+            value, expires_at = self._data.get(key, (_MISSING, None))
+            if value is _MISSING or (expires_at is not None and expires_at < time.monotonic()):
+                if value is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Сохраняет значение, вытесняя самые старые записи при превышении max_entries.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        """
+        Удаляет записи с указанными ключами, если они есть.
+        """
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Удаляет все записи и сбрасывает счетчики.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Возвращает словарь с размером кэша и счетчиками попаданий и промахов.
+        """
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
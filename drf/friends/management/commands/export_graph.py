@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from friends import export
+
+
+class Command(BaseCommand):
+    """
+    Команда для выгрузки графа друзей (всего или одного пользователя) в NDJSON или CSV.
+
+    Записи читаются из базы пачками по --chunk-size строк и сразу пишутся в файл,
+    поэтому память не зависит от размера графа. Формат записей описан в friends.export;
+    выгрузку можно загрузить обратно командой import_graph.
+    """
+
+    help = "Выгружает пользователей, дружбы и заявки в друзья в NDJSON или CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Имя пользователя, граф которого выгружается (по умолчанию - весь граф)")
+        parser.add_argument("--format", choices=export.FORMATS, default="ndjson", help="Формат выгрузки")
+        parser.add_argument("--output", default="-", help="Путь к файлу выгрузки (- для stdout)")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Сколько строк читать из базы за один раз")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        chunks = export.iter_export(options["format"], user=user, chunk_size=options["chunk_size"])
+        if options["output"] == "-":
+            # Выгрузка идет в stdout, поэтому итог пишется в stderr
+            written = self._write(chunks, self.stdout)
+            self.stderr.write(f"Выгружено строк: {written}", style_func=self.style.SUCCESS)
+        else:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                written = self._write(chunks, output)
+            self.stdout.write(self.style.SUCCESS(f"Выгружено строк: {written}"))
+
+    @staticmethod
+    def _write(chunks, output):
+        written = 0
+        for chunk in chunks:
+            output.write(chunk)
+            written += chunk.count("\n")
+        return written
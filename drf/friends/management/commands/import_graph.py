@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from friends import export, graph, graph_import
+
+
+class Command(BaseCommand):
+    """
+    Команда для загрузки пользователей, дружб и заявок в друзья из NDJSON или CSV.
+
+    Файл в формате выгрузки export_graph читается потоком и загружается пачками
+    по --batch-size записей, каждая пачка - в отдельной транзакции (см. friends.graph_import).
+    После каждой пачки в файл контрольной точки записывается количество загруженных записей;
+    при повторном запуске с тем же файлом контрольной точки загрузка продолжается с места
+    остановки. Рекомендации друзей после загрузки перестраиваются командой rebuild_suggestions.
+    """
+
+    help = "Загружает граф друзей из NDJSON или CSV в формате export_graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Путь к файлу выгрузки (- для stdin)")
+        parser.add_argument("--format", choices=export.FORMATS, help="Формат файла (по умолчанию - по расширению)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Количество записей в пачке")
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл контрольной точки (по умолчанию <input>.checkpoint; для stdin контрольная точка не ведется)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["input"]
+        input_format = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        checkpoint = options["checkpoint"] or (None if path == "-" else f"{path}.checkpoint")
+        skip = self._read_checkpoint(checkpoint)
+        if skip:
+            self.stdout.write(f"Продолжение с контрольной точки: пропущено записей {skip}")
+
+        if path == "-":
+            counts = self._load(sys.stdin, input_format, options["batch_size"], skip, checkpoint)
+        else:
+            if not os.path.exists(path):
+                raise CommandError(f"Файл {path} не найден")
+            with open(path, encoding="utf-8", newline="") as lines:
+                counts = self._load(lines, input_format, options["batch_size"], skip, checkpoint)
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово: пользователей {counts['user']}, дружб {counts['friendship']}, "
+                f"заявок {counts['friend_request']}, пропущено {counts['skipped']}. "
+                "Для рекомендаций друзей запустите rebuild_suggestions"
+            )
+        )
+
+    def _load(self, lines, input_format, batch_size, skip, checkpoint):
+        """
+        Загружает записи пачками и возвращает общие счетчики по типам записей.
+        """
+        counts = Counter()
+        loaded = skip
+        started = time.monotonic()
+        records = graph_import.read_records(lines, input_format, skip=skip)
+        with graph_import.preserve_timestamps():
+            for batch in graph.chunked(records, batch_size):
+                with transaction.atomic():
+                    counts.update(graph_import.import_batch(batch))
+                loaded += len(batch)
+                self._write_checkpoint(checkpoint, loaded)
+                processed = loaded - skip
+                rate = processed / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"Загружено записей: {loaded} (пользователей {counts['user']}, дружб {counts['friendship']}, "
+                    f"заявок {counts['friend_request']}, пропущено {counts['skipped']}), {rate:.0f} записей/с"
+                )
+        return counts
+
+    @staticmethod
+    def _read_checkpoint(checkpoint):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint, encoding="utf-8") as state:
+            return json.load(state)["records"]
+
+    @staticmethod
+    def _write_checkpoint(checkpoint, loaded):
+        if not checkpoint:
+            return
+        # Запись через временный файл: прерванная запись не портит контрольную точку
+        temporary = f"{checkpoint}.tmp"
+        with open(temporary, "w", encoding="utf-8") as state:
+            json.dump({"records": loaded}, state)
+        os.replace(temporary, checkpoint)
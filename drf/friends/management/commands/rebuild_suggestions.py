@@ -0,0 +1,43 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from friends import suggestions
+
+
+class Command(BaseCommand):
+    """
+    Команда для полной перестройки таблицы рекомендаций друзей.
+
+    Пользователи обрабатываются пачками по возрастанию id; рекомендации каждой
+    пачки пересчитываются и заменяются в отдельной транзакции, поэтому команду
+    можно запускать на работающей системе.
+    """
+
+    help = "Перестраивает таблицу рекомендаций друзей FriendSuggestion"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Количество пользователей в пачке")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        started = time.monotonic()
+        last_id = 0
+        processed = created = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            with transaction.atomic():
+                created += suggestions.rebuild(user_ids)
+            processed += len(user_ids)
+            last_id = user_ids[-1]
+            self.stdout.write(f"Обработано пользователей: {processed}, рекомендаций: {created}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Готово: {processed} пользователей, {created} рекомендаций за {elapsed:.1f} с")
+        )
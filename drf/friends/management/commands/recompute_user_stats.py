@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from friends.models import UserStats
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета счетчиков друзей и заявок всех пользователей.
+
+    Пользователи обрабатываются пачками по возрастанию id; каждая пачка
+    пересчитывается несколькими агрегирующими запросами в отдельной транзакции.
+    Недостающие строки UserStats создаются, расхождения исправляются.
+    """
+
+    help = "Пересчитывает счетчики UserStats и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Количество пользователей в пачке")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = 0
+        processed = created = repaired = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            with transaction.atomic():
+                batch_created, batch_repaired = UserStats.recompute(user_ids)
+            processed += len(user_ids)
+            created += batch_created
+            repaired += batch_repaired
+            last_id = user_ids[-1]
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано пользователей: {processed}, создано: {created}, исправлено: {repaired}")
+        )
@@ -0,0 +1,340 @@
+"""
+Метрики производительности запросов в формате Prometheus.
+
+Для каждого маршрута (имени URL из drf/urls.py) считаются запросы по классам кодов ответа,
+гистограммы времени ответа, числа SQL-запросов и размера ответа, а также суммарное время
+SQL-запросов, сериализации и отрисовки ответа. Метрики собирает friends.middleware.MetricsMiddleware,
+отдает эндпоинт /metrics/.
+
+Маршруты регистрируются один раз при первом обращении: запрос только находит готовый объект
+метрик маршрута по имени URL и увеличивает его счетчики, словари меток на запрос не создаются.
+Время SQL-запросов учитывает обертка execute_wrapper, которую сигнал connection_created
+устанавливает на каждое соединение с базой; состояние текущего запроса она находит
+через contextvar, поэтому учитываются и запросы асинхронных представлений из потоков sync_to_async.
+
+Метрики хранятся в памяти процесса: при нескольких воркерах gunicorn каждый отдает свои.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Границы корзин гистограмм (верхние, включительно)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+# Маршрут запросов, для которых не нашлось URL (404) или имени URL
+UNMATCHED = "unmatched"
+
+
+class RequestState:
+    """
+    Замеры одного запроса, которые накапливаются во время его обработки.
+
+    Поля:
+        queries: Количество SQL-запросов.
+        db_time: Суммарное время SQL-запросов в секундах.
+        serialize_time: Время сериализации (data сериализаторов) в секундах без SQL-запросов,
+            выполненных во время сериализации (они учтены в db_time).
+        render_time: Время отрисовки ответа рендерером в секундах.
+    """
+
+    __slots__ = (
+        "queries",
+        "db_time",
+        "serialize_time",
+        "render_time",
+        "_depth",
+        "_started",
+        "_db_time_at_start",
+        "_render_started",
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self._depth = 0
+        self._started = 0.0
+        self._db_time_at_start = 0.0
+        self._render_started = 0.0
+
+
+_current = ContextVar("friends_metrics_request", default=None)
+
+
+def start_request():
+    """
+    Начинает замер запроса и возвращает (состояние, токен для finish_request).
+    """
+    state = RequestState()
+    return state, _current.set(state)
+
+
+def finish_request(token):
+    """
+    Завершает замер запроса, начатый start_request.
+    """
+    _current.reset(token)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL (connection.execute_wrapper), учитывающая запросы в замере текущего запроса.
+    """
+    state = _current.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.db_time += time.perf_counter() - started
+        state.queries += 1
+
+
+class _SerializeTimer:
+    """
+    Контекстный менеджер, учитывающий время сериализации в замере текущего запроса.
+
+    Вложенные сериализаторы (например, списки внутри профиля) учитываются один раз - внешним.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        state = _current.get()
+        if state is not None:
+            if state._depth == 0:
+                state._started = time.perf_counter()
+                state._db_time_at_start = state.db_time
+            state._depth += 1
+
+    def __exit__(self, *exc_info):
+        state = _current.get()
+        if state is not None:
+            state._depth -= 1
+            if state._depth == 0:
+                elapsed = time.perf_counter() - state._started
+                state.serialize_time += elapsed - (state.db_time - state._db_time_at_start)
+        return False
+
+
+serialize_timer = _SerializeTimer()
+
+
+def render_started(response):
+    """
+    Начинает замер отрисовки ответа (SimpleTemplateResponse, в том числе Response DRF).
+    """
+    state = _current.get()
+    if state is not None:
+        state._render_started = time.perf_counter()
+        response.add_post_render_callback(_render_finished)
+
+
+def _render_finished(response):
+    state = _current.get()
+    if state is not None:
+        state.render_time += time.perf_counter() - state._render_started
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин.
+
+    Поля:
+        bounds: Верхние границы корзин.
+        counts: Количество наблюдений в каждой корзине (последняя - больше всех границ).
+        sum: Сумма наблюдений.
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Возвращает список (граница, накопленное количество), последняя граница - "+Inf".
+        """
+        total, result = 0, []
+        for bound, count in zip((*self.bounds, "+Inf"), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class RouteMetrics:
+    """
+    Метрики одного маршрута.
+
+    Поля:
+        route: Имя маршрута (имя URL с пространством имен).
+        responses: Количество ответов по классам кодов STATUS_CLASSES.
+        duration: Гистограмма времени ответа в секундах.
+        queries: Гистограмма числа SQL-запросов на запрос.
+        size: Гистограмма размера тела ответа в байтах (потоковые ответы не учитываются).
+        db_time, serialize_time, render_time: Суммарное время SQL, сериализации и отрисовки в секундах.
+    """
+
+    __slots__ = ("route", "responses", "duration", "queries", "size", "db_time", "serialize_time", "render_time")
+
+    def __init__(self, route):
+        self.route = route
+        self.responses = [0] * len(STATUS_CLASSES)
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+
+    def record(self, status_code, duration, state, size):
+        """
+        Учитывает завершенный запрос. Вызывается под блокировкой реестра.
+        """
+        self.responses[min(max(status_code // 100, 1), 5) - 1] += 1
+        self.duration.observe(duration)
+        self.queries.observe(state.queries)
+        if size is not None:
+            self.size.observe(size)
+        self.db_time += state.db_time
+        self.serialize_time += state.serialize_time
+        self.render_time += state.render_time
+
+
+_lock = threading.Lock()
+_routes = None
+
+
+def _route_names(patterns, namespace=""):
+    """
+    Возвращает имена всех маршрутов URLconf с пространствами имен (как view_name в ResolverMatch).
+    """
+    from django.urls import URLResolver
+
+    names = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = f"{namespace}{pattern.namespace}:" if pattern.namespace else namespace
+            names += _route_names(pattern.url_patterns, prefix)
+        elif pattern.name:
+            names.append(f"{namespace}{pattern.name}")
+    return names
+
+
+def routes():
+    """
+    Возвращает словарь {маршрут: RouteMetrics}, при первом вызове регистрируя маршруты URLconf.
+    """
+    global _routes
+    registry = _routes
+    if registry is None:
+        from django.urls import get_resolver
+
+        with _lock:
+            if _routes is None:
+                names = [*_route_names(get_resolver().url_patterns), UNMATCHED]
+                _routes = {name: RouteMetrics(name) for name in names}
+            registry = _routes
+    return registry
+
+
+def record(view_name, status_code, duration, state, size):
+    """
+    Учитывает завершенный запрос в метриках маршрута view_name.
+    """
+    registry = routes()
+    metrics = registry.get(view_name) or registry[UNMATCHED]
+    with _lock:
+        metrics.record(status_code, duration, state, size)
+
+
+def reset():
+    """
+    Обнуляет все метрики (маршруты будут зарегистрированы заново при следующем обращении).
+    """
+    global _routes
+    with _lock:
+        _routes = None
+
+
+def server_timing(duration, state):
+    """
+    Возвращает значение заголовка Server-Timing для замера запроса.
+    """
+    return (
+        f'db;dur={state.db_time * 1000:.2f};desc="{state.queries} queries", '
+        f"serialize;dur={state.serialize_time * 1000:.2f}, "
+        f"render;dur={state.render_time * 1000:.2f}, "
+        f"total;dur={duration * 1000:.2f}"
+    )
+
+
+# Метрики-счетчики сумм времени: (имя, поле RouteMetrics, описание)
+_TIME_COUNTERS = (
+    ("friends_db_query_seconds_total", "db_time", "Суммарное время SQL-запросов в секундах."),
+    ("friends_serialize_seconds_total", "serialize_time", "Суммарное время сериализации в секундах."),
+    ("friends_render_seconds_total", "render_time", "Суммарное время отрисовки ответа в секундах."),
+)
+
+# Метрики-гистограммы: (имя, поле RouteMetrics, описание)
+_HISTOGRAMS = (
+    ("friends_http_request_duration_seconds", "duration", "Время ответа в секундах."),
+    ("friends_db_queries_per_request", "queries", "Количество SQL-запросов на запрос."),
+    ("friends_http_response_size_bytes", "size", "Размер тела ответа в байтах."),
+)
+
+
+def exposition():
+    """
+    Возвращает все метрики в текстовом формате Prometheus (version 0.0.4).
+    """
+    with _lock:
+        snapshot = [
+            {
+                "route": metrics.route,
+                "responses": list(metrics.responses),
+                **{
+                    field: (getattr(metrics, field).cumulative(), getattr(metrics, field).sum)
+                    for _, field, _ in _HISTOGRAMS
+                },
+                **{field: getattr(metrics, field) for _, field, _ in _TIME_COUNTERS},
+            }
+            for metrics in routes().values()
+        ]
+
+    lines = []
+    name = "friends_http_requests_total"
+    lines += [f"# HELP {name} Количество ответов по маршрутам и классам кодов ответа.", f"# TYPE {name} counter"]
+    for row in snapshot:
+        for status_class, count in zip(STATUS_CLASSES, row["responses"]):
+            lines.append(f'{name}{{route="{row["route"]}",status="{status_class}"}} {count}')
+
+    for name, field, help_text in _HISTOGRAMS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for row in snapshot:
+            route = row["route"]
+            buckets, total = row[field]
+            for bound, count in buckets:
+                lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{route="{route}"}} {total!r}')
+            lines.append(f'{name}_count{{route="{route}"}} {buckets[-1][1]}')
+
+    for name, field, help_text in _TIME_COUNTERS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for row in snapshot:
+            lines.append(f'{name}{{route="{row["route"]}"}} {row[field]!r}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,175 @@
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics, profiling, routers
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _client_key(request):
+    """
+    Возвращает ключ кэша клиента по токену из заголовка Authorization или по сессии.
+
+    Middleware выполняется до аутентификации DRF, поэтому клиент определяется по учетным данным
+    запроса, а не по request.user. Для анонимного клиента без сессии возвращается None.
+    """
+    credential = request.headers.get("Authorization") or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return "friends:pin:" + hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+class ReadYourWritesMiddleware:
+    """
+    Middleware, закрепляющий чтения клиента за основной базой на короткое время после его записи.
+
+    Небезопасный запрос (POST и т.п.) целиком читает из основной базы: проверки перед записью
+    не должны видеть отстающую реплику. После него клиент закрепляется на FRIENDS_DB_PIN_SECONDS
+    секунд в кэше Django, и в течение этого времени его чтения не уходят на реплики. Чтобы закрепление
+    работало между процессами, кэш по умолчанию должен быть общим (например, Redis или Memcached).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = _client_key(request)
+        with routers.request_scope(pinned=request.method not in SAFE_METHODS or self._pinned(key)):
+            response = self.get_response(request)
+        self._pin_after_write(request, key)
+        return response
+
+    async def __acall__(self, request):
+        key = _client_key(request)
+        with routers.request_scope(pinned=request.method not in SAFE_METHODS or await self._apinned(key)):
+            response = await self.get_response(request)
+        await self._apin_after_write(request, key)
+        return response
+
+    def _enabled(self, key):
+        return key is not None and getattr(settings, "FRIENDS_DB_REPLICAS", ())
+
+    def _pinned(self, key):
+        return bool(self._enabled(key) and cache.get(key))
+
+    async def _apinned(self, key):
+        return bool(self._enabled(key) and await cache.aget(key))
+
+    def _pin_after_write(self, request, key):
+        if self._enabled(key) and request.method not in SAFE_METHODS:
+            cache.set(key, True, timeout=settings.FRIENDS_DB_PIN_SECONDS)
+
+    async def _apin_after_write(self, request, key):
+        if self._enabled(key) and request.method not in SAFE_METHODS:
+            await cache.aset(key, True, timeout=settings.FRIENDS_DB_PIN_SECONDS)
+
+
+class MetricsMiddleware:
+    """
+    Middleware, собирающий метрики производительности запросов (friends.metrics).
+
+    Время ответа, число и время SQL-запросов, время сериализации и отрисовки и размер ответа
+    учитываются в метриках маршрута по имени URL; при FRIENDS_SERVER_TIMING те же замеры
+    добавляются в ответ заголовком Server-Timing. Middleware стоит в MIDDLEWARE сразу после
+    ProfilingMiddleware, чтобы время ответа включало остальные middleware. Для потоковых ответов учитывается
+    время до начала передачи тела, размер не учитывается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        state, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self._record(request, response, state, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        state, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self._record(request, response, state, time.perf_counter() - started)
+        return response
+
+    def process_template_response(self, request, response):
+        # Вызывается обработчиком Django непосредственно перед отрисовкой ответа
+        metrics.render_started(response)
+        return response
+
+    @staticmethod
+    def _record(request, response, state, duration):
+        match = request.resolver_match
+        size = None if response.streaming else len(response.content)
+        metrics.record(match.view_name if match else None, response.status_code, duration, state, size)
+        if settings.FRIENDS_SERVER_TIMING:
+            response.headers["Server-Timing"] = metrics.server_timing(duration, state)
+
+
+class ProfilingMiddleware:
+    """
+    Middleware, профилирующий выборку запросов по настройкам из кэша (friends.profiling).
+
+    Стоит первым в MIDDLEWARE: профиль охватывает остальные middleware, а EXPLAIN медленных
+    SQL-запросов и запись профиля на диск выполняются после того, как MetricsMiddleware
+    закончил замер, и не попадают в метрики запроса. Пока профилирование выключено,
+    запрос проверяет только настройки в памяти процесса.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        route = profiling.sample(request)
+        if route is None:
+            return self.get_response(request)
+        profile, token = profiling.start(route, request)
+        try:
+            response = profiling.run(profile, self.get_response, request)
+        finally:
+            duration = profiling.stop(profile, token)
+        profiling.finish(profile, response.status_code, duration)
+        return response
+
+    async def __acall__(self, request):
+        route = profiling.sample(request)
+        if route is None:
+            return await self.get_response(request)
+        profile, token = profiling.start(route, request, profile_calls=False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = profiling.stop(profile, token)
+        await sync_to_async(profiling.finish)(profile, response.status_code, duration)
+        return response
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:05
+
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def copy_friend_to_friendship(apps, schema_editor):
+    """
+    Переносит друзей из таблицы friends_friend_users в Friendship.
+
+    Старая схема хранила дружбу дважды (по строке на каждого владельца списка),
+    поэтому пары нормализуются в (меньший id, больший id), а повторы отбрасываются
+    через ignore_conflicts, без хранения всех пар в памяти.
+    """
+    Friend = apps.get_model("friends", "Friend")
+    Friendship = apps.get_model("friends", "Friendship")
+    Through = Friend.users.through
+
+    rows = (
+        Through.objects.filter(friend__current_user__isnull=False)
+        .values_list("friend__current_user_id", "user_id")
+        .order_by("pk")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = set()
+    for owner_id, user_id in rows:
+        if owner_id == user_id:
+            continue
+        batch.add((owner_id, user_id) if owner_id < user_id else (user_id, owner_id))
+        if len(batch) >= BATCH_SIZE:
+            _flush_friendships(Friendship, batch)
+            batch = set()
+    if batch:
+        _flush_friendships(Friendship, batch)
+
+
+def _flush_friendships(Friendship, pairs):
+    Friendship.objects.bulk_create(
+        [Friendship(user_low_id=low, user_high_id=high) for low, high in pairs],
+        ignore_conflicts=True,
+    )
+
+
+def copy_friendship_to_friend(apps, schema_editor):
+    """
+    Обратная миграция: восстанавливает списки друзей Friend из Friendship.
+    """
+    Friend = apps.get_model("friends", "Friend")
+    Friendship = apps.get_model("friends", "Friendship")
+    Through = Friend.users.through
+
+    owners = {}
+    batch = []
+    for low_id, high_id in Friendship.objects.values_list("user_low_id", "user_high_id").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        for owner_id, user_id in ((low_id, high_id), (high_id, low_id)):
+            if owner_id not in owners:
+                owners[owner_id] = Friend.objects.create(current_user_id=owner_id).pk
+            batch.append(Through(friend_id=owners[owner_id], user_id=user_id))
+        if len(batch) >= BATCH_SIZE:
+            Through.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        Through.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0003_friendship"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_friend_to_friendship, copy_friendship_to_friend),
+    ]
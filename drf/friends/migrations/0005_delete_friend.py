@@ -0,0 +1,16 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0004_copy_friend_to_friendship"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="Friend",
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 21:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0005_delete_friend"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(fields=["from_user", "-timestamp"], name="friendrequest_from_ts_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(fields=["to_user", "-timestamp"], name="friendrequest_to_ts_idx"),
+        ),
+    ]
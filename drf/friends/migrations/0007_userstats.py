@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-17 21:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("friends", "0006_friendrequest_timestamp_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("friends_count", models.IntegerField(default=0)),
+                ("friend_requests_sent_count", models.IntegerField(default=0)),
+                ("friend_requests_received_count", models.IntegerField(default=0)),
+            ],
+        ),
+    ]
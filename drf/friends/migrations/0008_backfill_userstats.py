@@ -0,0 +1,48 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:05
+
+from django.db import migrations
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_userstats(apps, schema_editor):
+    """
+    Создает строки UserStats для существующих пользователей по фактическим данным.
+    """
+    User = apps.get_model("auth", "User")
+    Friendship = apps.get_model("friends", "Friendship")
+    FriendRequest = apps.get_model("friends", "FriendRequest")
+    UserStats = apps.get_model("friends", "UserStats")
+
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:BATCH_SIZE])
+        if not user_ids:
+            break
+        counts = {user_id: {} for user_id in user_ids}
+        aggregates = (
+            ("friends_count", Friendship.objects.filter(user_low_id__in=user_ids), "user_low_id"),
+            ("friends_count", Friendship.objects.filter(user_high_id__in=user_ids), "user_high_id"),
+            ("friend_requests_sent_count", FriendRequest.objects.filter(from_user_id__in=user_ids), "from_user_id"),
+            ("friend_requests_received_count", FriendRequest.objects.filter(to_user_id__in=user_ids), "to_user_id"),
+        )
+        for counter, queryset, field in aggregates:
+            for user_id, count in queryset.values_list(field).annotate(count=Count("id")).order_by():
+                counts[user_id][counter] = counts[user_id].get(counter, 0) + count
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=user_id, **values) for user_id, values in counts.items()],
+            ignore_conflicts=True,
+        )
+        last_id = user_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0007_userstats"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_userstats, migrations.RunPython.noop),
+    ]
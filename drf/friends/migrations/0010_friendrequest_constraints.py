@@ -0,0 +1,75 @@
+# Generated by Django 5.0.7 on 2026-10-17 14:00
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 500
+
+
+def remove_duplicate_requests(apps, schema_editor):
+    """
+    Удаляет заявки самому себе и повторные заявки (from_user, to_user), оставляя самую раннюю,
+    и пересчитывает счетчики заявок UserStats отправителей и получателей удаленных заявок.
+    """
+    FriendRequest = apps.get_model("friends", "FriendRequest")
+    self_requests = FriendRequest.objects.filter(from_user=models.F("to_user"))
+    affected = set(self_requests.values_list("from_user_id", flat=True))
+    self_requests.delete()
+    duplicates = (
+        FriendRequest.objects.values("from_user_id", "to_user_id")
+        .annotate(first_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in list(duplicates):
+        FriendRequest.objects.filter(
+            from_user_id=duplicate["from_user_id"], to_user_id=duplicate["to_user_id"]
+        ).exclude(id=duplicate["first_id"]).delete()
+        affected.update((duplicate["from_user_id"], duplicate["to_user_id"]))
+    recount_requests(apps, sorted(affected))
+
+
+def recount_requests(apps, user_ids):
+    """
+    Пересчитывает счетчики отправленных и полученных заявок пользователей по таблице FriendRequest.
+    """
+    FriendRequest = apps.get_model("friends", "FriendRequest")
+    UserStats = apps.get_model("friends", "UserStats")
+
+    def count(field):
+        rows = FriendRequest.objects.filter(**{field: OuterRef("user_id")}).order_by().values(field)
+        return Coalesce(Subquery(rows.annotate(count=Count("id")).values("count")), 0)
+
+    user_ids = iter(user_ids)
+    while batch := list(islice(user_ids, BATCH_SIZE)):
+        UserStats.objects.filter(user_id__in=batch).update(
+            friend_requests_sent_count=count("from_user_id"),
+            friend_requests_received_count=count("to_user_id"),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0009_friendsuggestion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="friendrequest",
+            constraint=models.UniqueConstraint(fields=("from_user", "to_user"), name="unique_friend_request"),
+        ),
+        migrations.AddConstraint(
+            model_name="friendrequest",
+            constraint=models.CheckConstraint(
+                check=models.Q(("from_user", models.F("to_user")), _negated=True),
+                name="friend_request_not_self",
+            ),
+        ),
+    ]
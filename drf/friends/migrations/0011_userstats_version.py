@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-17 21:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0010_friendrequest_constraints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userstats",
+            name="updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="userstats",
+            name="version",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
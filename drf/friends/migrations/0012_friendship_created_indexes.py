@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 22:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("friends", "0011_userstats_version"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["user_low", "-created_at"], name="friendship_low_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["user_high", "-created_at"], name="friendship_high_created_idx"),
+        ),
+    ]
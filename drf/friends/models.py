@@ -1,5 +1,21 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Отправляется после создания или удаления дружбы (внутри транзакции записи).
+# Аргументы: user_ids - пара id пользователей, created - True при создании дружбы.
+friendship_changed = Signal()
+
+# Отправляется после создания нескольких дружб одной вставкой (внутри транзакции записи).
+# Аргументы: pairs - список пар id пользователей, ставших друзьями.
+friendships_created = Signal()
+
+# Отправляется после изменения счетчиков и версии данных пользователей (внутри транзакции записи).
+# Аргументы: user_ids - список id пользователей, чьи друзья, заявки или профиль изменились.
+user_stats_changed = Signal()
 
 
 # Create your models here.
@@ -13,49 +29,450 @@ class FriendRequest(models.Model):
         timestamp: Дата и время создания запроса.
 
     Методы:
+        send: Создает запрос в друзья.
         accept: Принимает запрос в друзья, добавляя пользователей друг другу в список друзей.
+        reject: Отклоняет запрос в друзья.
     """
 
     from_user = models.ForeignKey(User, related_name="friend_requests_sent", on_delete=models.CASCADE)
     to_user = models.ForeignKey(User, related_name="friend_requests_received", on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["from_user", "to_user"], name="unique_friend_request"),
+            models.CheckConstraint(check=~Q(from_user=F("to_user")), name="friend_request_not_self"),
+        ]
+        indexes = [
+            models.Index(fields=["from_user", "-timestamp"], name="friendrequest_from_ts_idx"),
+            models.Index(fields=["to_user", "-timestamp"], name="friendrequest_to_ts_idx"),
+        ]
+
+    @classmethod
+    def send(cls, from_user, to_user):
+        """
+        Создает запрос в друзья и обновляет счетчики заявок обоих пользователей.
+
+        Аргументы:
+            from_user: Пользователь, отправляющий запрос.
+            to_user: Пользователь, получающий запрос.
+
+        Возвращает:
+            Созданный объект FriendRequest.
+        """
+        with transaction.atomic():
+            friend_request = cls.objects.create(from_user=from_user, to_user=to_user)
+            UserStats.adjust(from_user, sent=1)
+            UserStats.adjust(to_user, received=1)
+        return friend_request
+
     def accept(self):
         """
-        Принимает запрос в друзья и добавляет пользователей друг другу в список друзей.
+        Принимает запрос в друзья: добавляет пользователей друг другу в друзья и удаляет запрос.
+
+        Дружба хранится одной строкой Friendship, поэтому принятие запроса - это одна запись в базу.
+        """
+        with transaction.atomic():
+            # id, а не объекты пользователей: обращение к from_user и to_user загрузило бы обе строки User
+            Friendship.make_friends(self.from_user_id, self.to_user_id)
+            self._remove()
 
-        Этот метод создает или обновляет объект Friend для обоих пользователей, добавляя их друг к другу в друзья.
+    def reject(self):
+        """
+        Отклоняет запрос в друзья, удаляя его.
         """
-        friend, created = Friend.objects.get_or_create(current_user=self.from_user)
-        friend.users.add(self.to_user)
-        friend, created = Friend.objects.get_or_create(current_user=self.to_user)
-        friend.users.add(self.from_user)
-        self.save()
+        with transaction.atomic():
+            self._remove()
 
+    def _remove(self):
+        """
+        Удаляет запрос и уменьшает счетчики заявок, если запрос еще существовал.
+        """
+        deleted, _ = FriendRequest.objects.filter(pk=self.pk).delete()
+        if deleted:
+            UserStats.adjust(self.from_user_id, sent=-1)
+            UserStats.adjust(self.to_user_id, received=-1)
 
-class Friend(models.Model):
+
+class Friendship(models.Model):
     """
-    Модель для представления списка друзей пользователя.
+    Модель для представления дружбы между двумя пользователями.
+
+    Каждая пара друзей хранится ровно одной строкой: пользователь с меньшим id
+    записывается в user_low, с большим - в user_high. Уникальный составной индекс
+    по (user_low, user_high) позволяет проверить дружбу одним обращением к индексу.
 
     Поля:
-        users: Список друзей пользователя.
-        current_user: Пользователь, владеющий данным списком друзей.
+        user_low: Пользователь с меньшим id.
+        user_high: Пользователь с большим id.
+        created_at: Дата и время, когда пользователи стали друзьями.
 
     Методы:
-        lose_friend: Удаляет указанного друга из списка друзей текущего пользователя.
+        make_friends: Добавляет пользователей друг другу в друзья.
+        lose_friend: Удаляет дружбу между пользователями.
+        are_friends: Проверяет, являются ли пользователи друзьями.
+        friends_of: Возвращает queryset друзей пользователя.
+        friendships_of: Возвращает queryset дружб пользователя.
+        mutual_friends_of: Возвращает queryset общих друзей двух пользователей.
     """
 
-    users = models.ManyToManyField(User)
-    current_user = models.ForeignKey(User, related_name="owner", null=True, on_delete=models.CASCADE)
+    user_low = models.ForeignKey(User, related_name="friendships_low", on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name="friendships_high", on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_low", "user_high"], name="unique_friendship"),
+            models.CheckConstraint(check=Q(user_low__lt=models.F("user_high")), name="friendship_ordered_pair"),
+        ]
+        indexes = [
+            models.Index(fields=["user_high", "user_low"], name="friendship_high_low_idx"),
+            models.Index(fields=["user_low", "-created_at"], name="friendship_low_created_idx"),
+            models.Index(fields=["user_high", "-created_at"], name="friendship_high_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_low_id} <-> {self.user_high_id}"
+
+    @staticmethod
+    def ordered_pair(first, second):
+        """
+        Возвращает id пользователей в порядке (меньший, больший).
+
+        Аргументы:
+            first: Пользователь или его id.
+            second: Пользователь или его id.
+        """
+        first_id = getattr(first, "pk", first)
+        second_id = getattr(second, "pk", second)
+        return (first_id, second_id) if first_id < second_id else (second_id, first_id)
+
+    @classmethod
+    def make_friends(cls, first, second):
+        """
+        Добавляет пользователей друг другу в друзья, если они еще не друзья.
+
+        Аргументы:
+            first: Первый пользователь.
+            second: Второй пользователь.
+
+        Возвращает:
+            True, если дружба была создана.
+        """
+        low, high = cls.ordered_pair(first, second)
+        with transaction.atomic():
+            friendship, created = cls.objects.get_or_create(user_low_id=low, user_high_id=high)
+            if created:
+                UserStats.adjust(low, friends=1)
+                UserStats.adjust(high, friends=1)
+                friendship_changed.send(sender=cls, user_ids=(low, high), created=True)
+        return created
 
     @classmethod
     def lose_friend(cls, current_user, new_friend):
         """
-        Удаляет указанного пользователя из списка друзей текущего пользователя.
+        Удаляет дружбу между пользователями.
+
+        Аргументы:
+            current_user: Пользователь, который теряет друга.
+            new_friend: Пользователь, которого нужно удалить из списка друзей.
+
+        Возвращает:
+            True, если дружба была удалена.
+        """
+        low, high = cls.ordered_pair(current_user, new_friend)
+        with transaction.atomic():
+            deleted, _ = cls.objects.filter(user_low_id=low, user_high_id=high).delete()
+            if deleted:
+                UserStats.adjust(low, friends=-1)
+                UserStats.adjust(high, friends=-1)
+                friendship_changed.send(sender=cls, user_ids=(low, high), created=False)
+        return deleted > 0
+
+    @classmethod
+    def are_friends(cls, first, second):
+        """
+        Проверяет, являются ли пользователи друзьями.
+        """
+        low, high = cls.ordered_pair(first, second)
+        return cls.objects.filter(user_low_id=low, user_high_id=high).exists()
+
+    @classmethod
+    def friend_ids(cls, user):
+        """
+        Возвращает пару подзапросов с id друзей пользователя (по каждой стороне ребра).
+        """
+        user_id = getattr(user, "pk", user)
+        return (
+            cls.objects.filter(user_low_id=user_id).values("user_high_id"),
+            cls.objects.filter(user_high_id=user_id).values("user_low_id"),
+        )
+
+    @classmethod
+    def friends_of(cls, user):
+        """
+        Возвращает queryset пользователей, являющихся друзьями указанного пользователя.
+        """
+        as_low, as_high = cls.friend_ids(user)
+        return User.objects.filter(Q(id__in=as_low) | Q(id__in=as_high))
+
+    @classmethod
+    def mutual_friends_of(cls, first, second):
+        """
+        Возвращает queryset общих друзей двух пользователей одним SQL-запросом.
+
+        Каждое условие - это подзапрос по индексу (user_low, user_high) или (user_high, user_low),
+        поэтому база строит пересечение без загрузки списков друзей в приложение.
+        """
+        as_low, as_high = cls.friend_ids(second)
+        return cls.friends_of(first).filter(Q(id__in=as_low) | Q(id__in=as_high))
+
+    @classmethod
+    def friendships_of(cls, user):
+        """
+        Возвращает queryset строк Friendship, в которых участвует пользователь, вместе с обоими пользователями.
+
+        Каждая сторона условия OR читается по своему индексу (user_low, created_at) или (user_high, created_at),
+        поэтому список друзей по дате дружбы не требует полного просмотра таблицы.
+        """
+        user_id = getattr(user, "pk", user)
+        return (
+            cls.objects.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id))
+            .select_related("user_low", "user_high")
+            .only("created_at", "user_low__username", "user_high__username")
+        )
+
+    def other_user(self, user):
+        """
+        Возвращает второго участника дружбы относительно указанного пользователя.
+        """
+        user_id = getattr(user, "pk", user)
+        return self.user_high if self.user_low_id == user_id else self.user_low
+
+
+class UserStats(models.Model):
+    """
+    Модель для денормализованных счетчиков друзей и заявок пользователя.
+
+    Счетчики обновляются в той же транзакции, что и изменение дружбы или заявки,
+    поэтому чтение количества друзей и заявок - это чтение одной строки.
+    Операции в обход моделей (удаление пользователей, массовые правки) могут
+    привести к расхождению, которое исправляет команда recompute_user_stats.
+
+    Поля:
+        user: Пользователь, которому принадлежат счетчики.
+        friends_count: Количество друзей.
+        friend_requests_sent_count: Количество отправленных заявок в друзья.
+        friend_requests_received_count: Количество полученных заявок в друзья.
+        version: Версия данных пользователя, увеличивается при каждом изменении его друзей, заявок и токена.
+        updated_at: Дата и время последнего изменения версии.
+
+    Методы:
+        adjust: Изменяет счетчики пользователя на указанные значения.
+        adjust_many: Изменяет счетчики группы пользователей одним запросом.
+        touch: Увеличивает версию группы пользователей без изменения счетчиков.
+        for_user: Возвращает строку счетчиков пользователя.
+        recompute: Пересчитывает счетчики группы пользователей по фактическим данным.
+        recount: Пересчитывает счетчики группы пользователей одним запросом UPDATE.
+    """
+
+    user = models.OneToOneField(User, primary_key=True, related_name="stats", on_delete=models.CASCADE)
+    friends_count = models.IntegerField(default=0)
+    friend_requests_sent_count = models.IntegerField(default=0)
+    friend_requests_received_count = models.IntegerField(default=0)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    COUNTER_FIELDS = ("friends_count", "friend_requests_sent_count", "friend_requests_received_count")
+
+    def __str__(self):
+        return f"{self.user_id}: {self.friends_count} friends"
+
+    @classmethod
+    def adjust(cls, user, friends=0, sent=0, received=0):
+        """
+        Атомарно изменяет счетчики пользователя выражениями F().
+
+        Вместе со счетчиками увеличивается версия данных пользователя (см. friends.conditional).
+        Если строки счетчиков еще нет (например, пользователь создан через bulk_create),
+        она создается пересчетом по фактическим данным, которые уже включают текущее изменение.
+
+        Аргументы:
+            user: Пользователь или его id.
+            friends: Изменение количества друзей.
+            sent: Изменение количества отправленных заявок.
+            received: Изменение количества полученных заявок.
+        """
+        user_id = getattr(user, "pk", user)
+        deltas = zip(cls.COUNTER_FIELDS, (friends, sent, received))
+        updates = {field: F(field) + delta for field, delta in deltas if delta}
+        if not updates:
+            return
+        if not cls.objects.filter(user_id=user_id).update(**updates, **cls._version_bump()):
+            cls.recompute([user_id])
+        user_stats_changed.send(sender=cls, user_ids=[user_id])
+
+    @classmethod
+    def adjust_many(cls, user_ids, friends=0, sent=0, received=0):
+        """
+        Изменяет одинаково счетчики группы пользователей одним запросом UPDATE.
+
+        Недостающие строки создаются пересчетом, как в adjust.
+
+        Аргументы:
+            user_ids: Список id пользователей.
+            friends: Изменение количества друзей.
+            sent: Изменение количества отправленных заявок.
+            received: Изменение количества полученных заявок.
+        """
+        user_ids = list(user_ids)
+        deltas = zip(cls.COUNTER_FIELDS, (friends, sent, received))
+        updates = {field: F(field) + delta for field, delta in deltas if delta}
+        if not updates or not user_ids:
+            return
+        if cls.objects.filter(user_id__in=user_ids).update(**updates, **cls._version_bump()) < len(user_ids):
+            existing = set(cls.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+            cls.recompute([user_id for user_id in user_ids if user_id not in existing])
+        user_stats_changed.send(sender=cls, user_ids=user_ids)
+
+    @classmethod
+    def touch(cls, user_ids, create_missing=True):
+        """
+        Увеличивает версию данных пользователей, не меняя счетчики.
+
+        Нужна для изменений, которые видны в профиле, но не меняют количество друзей и заявок.
+        Недостающие строки создаются пересчетом.
+
+        Аргументы:
+            user_ids: Список id пользователей.
+            create_missing: Создавать недостающие строки (False - только увеличить версию существующих).
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        updated = cls.objects.filter(user_id__in=user_ids).update(**cls._version_bump())
+        if updated < len(user_ids) and create_missing:
+            cls.recompute(user_ids)
+        user_stats_changed.send(sender=cls, user_ids=user_ids)
+
+    @classmethod
+    def recount(cls, user_ids):
+        """
+        Пересчитывает счетчики группы пользователей одним UPDATE с подзапросами по индексам ребер.
+
+        В отличие от recompute не читает строки в приложение и не ищет расхождения, поэтому
+        подходит для массовой загрузки, меняющей счетчики тысяч пользователей. Недостающие
+        строки создаются, версия увеличивается у всех строк группы.
 
         Аргументы:
-                current_user: Пользователь, который теряет друга.
-                new_friend: Пользователь, которого нужно удалить из списка друзей.
+            user_ids: Список id пользователей.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+
+        def count(queryset, field):
+            rows = queryset.filter(**{field: OuterRef("user_id")}).order_by().values(field)
+            return Coalesce(Subquery(rows.annotate(count=Count("id")).values("count")), 0)
+
+        cls.objects.filter(user_id__in=user_ids).update(
+            friends_count=count(Friendship.objects, "user_low_id") + count(Friendship.objects, "user_high_id"),
+            friend_requests_sent_count=count(FriendRequest.objects, "from_user_id"),
+            friend_requests_received_count=count(FriendRequest.objects, "to_user_id"),
+            **cls._version_bump(),
+        )
+        user_stats_changed.send(sender=cls, user_ids=user_ids)
+
+    @staticmethod
+    def _version_bump():
+        return {"version": F("version") + 1, "updated_at": timezone.now()}
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        Возвращает строку счетчиков пользователя, создавая ее пересчетом при отсутствии.
         """
-        friend, created = cls.objects.get_or_create(current_user=current_user)
-        friend.users.remove(new_friend)
+        user_id = getattr(user, "pk", user)
+        stats = cls.objects.filter(user_id=user_id).first()
+        if stats is None:
+            cls.recompute([user_id])
+            stats = cls.objects.get(user_id=user_id)
+        return stats
+
+    @classmethod
+    def recompute(cls, user_ids):
+        """
+        Пересчитывает счетчики указанных пользователей по таблицам Friendship и FriendRequest.
+
+        Использует четыре агрегирующих запроса на всю группу, создает недостающие строки
+        и обновляет только строки с расхождениями.
+
+        Аргументы:
+            user_ids: Список id пользователей.
+
+        Возвращает:
+            Кортеж (создано строк, исправлено строк).
+        """
+        user_ids = list(user_ids)
+        actual = {user_id: [0, 0, 0] for user_id in user_ids}
+        aggregates = (
+            (0, Friendship.objects.filter(user_low_id__in=user_ids), "user_low_id"),
+            (0, Friendship.objects.filter(user_high_id__in=user_ids), "user_high_id"),
+            (1, FriendRequest.objects.filter(from_user_id__in=user_ids), "from_user_id"),
+            (2, FriendRequest.objects.filter(to_user_id__in=user_ids), "to_user_id"),
+        )
+        for position, queryset, field in aggregates:
+            for user_id, count in queryset.values_list(field).annotate(count=Count("id")).order_by():
+                actual[user_id][position] += count
+
+        existing = cls.objects.in_bulk(user_ids)
+        missing, drifted = [], []
+        for user_id, counts in actual.items():
+            stats = existing.get(user_id)
+            if stats is None:
+                missing.append(cls(user_id=user_id, **dict(zip(cls.COUNTER_FIELDS, counts))))
+            elif [getattr(stats, field) for field in cls.COUNTER_FIELDS] != counts:
+                for field, count in zip(cls.COUNTER_FIELDS, counts):
+                    setattr(stats, field, count)
+                stats.version += 1
+                stats.updated_at = timezone.now()
+                drifted.append(stats)
+        cls.objects.bulk_create(missing, ignore_conflicts=True)
+        cls.objects.bulk_update(drifted, cls.COUNTER_FIELDS + ("version", "updated_at"))
+        if drifted:
+            user_stats_changed.send(sender=cls, user_ids=[stats.user_id for stats in drifted])
+        return len(missing), len(drifted)
+
+
+class FriendSuggestion(models.Model):
+    """
+    Модель для предрассчитанных рекомендаций друзей (друзья друзей).
+
+    Строка (user, candidate) означает, что candidate не является другом user,
+    но у них mutual_count общих друзей. Таблица обновляется инкрементально при
+    изменении дружбы и полностью перестраивается командой rebuild_suggestions.
+
+    Поля:
+        user: Пользователь, которому предлагается рекомендация.
+        candidate: Рекомендуемый пользователь.
+        mutual_count: Количество общих друзей.
+        updated_at: Дата и время последнего изменения рекомендации.
+    """
+
+    user = models.ForeignKey(User, related_name="friend_suggestions", on_delete=models.CASCADE)
+    candidate = models.ForeignKey(User, related_name="suggested_to", on_delete=models.CASCADE)
+    mutual_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "candidate"], name="unique_friend_suggestion"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-mutual_count"], name="suggestion_user_rank_idx"),
+            models.Index(fields=["candidate", "user"], name="suggestion_candidate_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.candidate_id} ({self.mutual_count})"
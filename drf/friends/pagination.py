@@ -0,0 +1,161 @@
+import base64
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import QueryDict
+from django.urls import reverse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class UsernameCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по имени пользователя.
+
+    Страница выбирается условием ``username > <курсор>`` по уникальному индексу,
+    поэтому время ответа не зависит от номера страницы и размера таблицы.
+    Курсоры next/previous непрозрачны для клиента.
+
+    Параметры запроса:
+        cursor: Курсор страницы из полей next/previous предыдущего ответа.
+        page_size: Размер страницы (не больше FRIENDS_MAX_PAGE_SIZE).
+    """
+
+    ordering = "username"
+    page_size = settings.FRIENDS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.FRIENDS_MAX_PAGE_SIZE
+
+
+class FriendshipCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация списка друзей, от новых дружб к старым.
+    """
+
+    ordering = "-created_at"
+    page_size = settings.FRIENDS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.FRIENDS_MAX_PAGE_SIZE
+
+
+class FriendRequestCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация заявок в друзья, от новых заявок к старым.
+    """
+
+    ordering = "-timestamp"
+    page_size = settings.FRIENDS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.FRIENDS_MAX_PAGE_SIZE
+
+
+class FriendSuggestionCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация рекомендаций друзей, от большего числа общих друзей к меньшему.
+    """
+
+    ordering = ("-mutual_count", "id")
+    page_size = settings.FRIENDS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.FRIENDS_MAX_PAGE_SIZE
+
+
+class FirstPageRequest:
+    """
+    Обертка запроса без параметров cursor и page_size для чтения первой страницы размера по умолчанию.
+
+    Используется для списков, встроенных в другой ответ: параметры пагинации запроса относятся
+    к самому ответу, а не к встроенным спискам.
+    """
+
+    query_params = GET = QueryDict()
+
+    def __init__(self, request):
+        self._request = request
+
+    def build_absolute_uri(self, location=None):
+        return self._request.build_absolute_uri(location)
+
+
+def first_page(pagination_class, queryset, request, url_name, serialize, count=None):
+    """
+    Возвращает количество элементов и первую страницу списка для встраивания в другой ответ.
+
+    Ссылка next указывает на отдельный ресурс списка (url_name), поэтому клиент
+    может продолжить обход с того места, где закончилась встроенная страница.
+    Параметры cursor и page_size текущего запроса относятся к нему самому, а не к встроенным
+    спискам, поэтому каждый список начинается с первой страницы размера по умолчанию.
+
+    Аргументы:
+        pagination_class: Класс курсорной пагинации списка.
+        queryset: Queryset элементов списка.
+        request: Текущий HTTP-запрос.
+        url_name: Имя URL отдельного ресурса списка.
+        serialize: Функция, сериализующая страницу элементов.
+        count: Заранее известное количество элементов; если не указано, считается запросом COUNT.
+    """
+    paginator = pagination_class()
+    page = paginator.paginate_queryset(queryset, FirstPageRequest(request))
+    paginator.base_url = request.build_absolute_uri(reverse(url_name))
+    return {
+        "count": queryset.count() if count is None else count,
+        "next": paginator.get_next_link(),
+        "results": serialize(page),
+    }
+
+
+def _encode_keyset_cursor(position, pk):
+    return base64.urlsafe_b64encode(f"{position}|{pk}".encode()).decode()
+
+
+def _decode_keyset_cursor(cursor):
+    position, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+    return position, int(pk)
+
+
+async def async_keyset_page(queryset, request, field, base_url=None, descending=True):
+    """
+    Возвращает страницу queryset по убыванию (или возрастанию) (field, id) для асинхронных представлений.
+
+    Курсорная пагинация DRF читает страницу синхронным ORM, поэтому асинхронные
+    представления используют свою keyset-пагинацию только вперед: курсор хранит
+    значение field и id последнего элемента страницы, а страница читается async-итерацией.
+
+    Аргументы:
+        queryset: Queryset элементов списка: модели или именованные кортежи values_list с колонками field и pk.
+        request: Текущий HTTP-запрос Django (параметры cursor и page_size).
+        field: Поле сортировки, например "created_at", "timestamp" или "username".
+        base_url: Адрес ресурса списка для ссылки next (по умолчанию - адрес текущего запроса).
+        descending: Сортировать от больших значений к меньшим (False - от меньших к большим).
+
+    Возвращает:
+        Кортеж (список элементов страницы, ссылка на следующую страницу или None).
+
+    Исключения:
+        NotFound: Если курсор некорректен.
+    """
+    try:
+        page_size = min(int(request.GET.get("page_size", settings.FRIENDS_PAGE_SIZE)), settings.FRIENDS_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = settings.FRIENDS_PAGE_SIZE
+    page_size = max(page_size, 1)
+
+    sign, after = ("-", "lt") if descending else ("", "gt")
+    queryset = queryset.order_by(f"{sign}{field}", f"{sign}pk")
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            position, pk = _decode_keyset_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+        queryset = queryset.filter(Q(**{f"{field}__{after}": position}) | Q(**{field: position, f"pk__{after}": pk}))
+
+    page = [obj async for obj in queryset[: page_size + 1]]
+    if len(page) <= page_size:
+        return page, None
+    page = page[:page_size]
+    last = page[-1]
+    position = getattr(last, field)
+    cursor = _encode_keyset_cursor(position.isoformat() if hasattr(position, "isoformat") else position, last.pk)
+    return page, replace_query_param(base_url or request.build_absolute_uri(), "cursor", cursor)
@@ -0,0 +1,442 @@
+"""
+Профилирование выборки запросов, включаемое во время работы сервера.
+
+Настройки профилирования хранятся в файле CONFIG_FILE каталога профилей FRIENDS_PROFILING["DIRECTORY"]
+и меняются через эндпоинт /profiling/ без перезапуска gunicorn: для каждого маршрута (имени URL) задается доля
+запросов, которые профилируются, и порог времени SQL-запроса для EXPLAIN. Каждый процесс перечитывает
+файл не чаще раза в FRIENDS_PROFILING["CONFIG_REFRESH"] секунд, поэтому настройки видят все воркеры,
+которым доступен каталог (как и сохраненные профили). Пока маршрутов в настройках нет, запрос
+проверяет только словарь настроек в памяти процесса.
+
+Для запроса из выборки friends.middleware.ProfilingMiddleware записывает cProfile и все SQL-запросы
+с параметрами и временем; после ответа для медленных SELECT выполняется EXPLAIN, а профиль
+(дерево вызовов, самые дорогие функции и SQL) сохраняется в каталог FRIENDS_PROFILING["DIRECTORY"],
+где хранятся последние FRIENDS_PROFILING["MAX_PROFILES"] профилей. Рядом лежит файл .prof
+для pstats и snakeviz. Вместо значений параметров SQL (ключей токенов, хэшей паролей, личных данных)
+в профиле сохраняются их типы. Асинхронные запросы профилируются без cProfile: профилировщик включается
+на поток, а в цикле событий он записывал бы и чужие запросы.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+from . import metrics
+
+# Файл настроек в каталоге профилей; расширение не .json, чтобы файл не считался профилем
+CONFIG_FILE = "profiling.conf"
+
+# Ключ настроек маршрутов, который действует для всех маршрутов без своей доли
+ALL_ROUTES = "*"
+
+_PROFILE_ID = re.compile(r"\d{13}-[0-9a-f]{8}")
+
+# Поля профиля, которые возвращает список профилей
+SUMMARY_FIELDS = ("id", "route", "method", "path", "status", "duration_ms", "query_count", "db_ms", "created_at")
+
+
+def _options():
+    return {
+        "DIRECTORY": "profiles",
+        "MAX_PROFILES": 200,
+        "CONFIG_REFRESH": 5,
+        "TIMEOUT": 3600,
+        "EXPLAIN_MS": 100,
+        "MAX_QUERIES": 1000,
+        "TOP_FUNCTIONS": 50,
+        "TREE_MIN_FRACTION": 0.005,
+        **settings.FRIENDS_PROFILING,
+    }
+
+
+# Настройки из файла и момент (time.monotonic), до которого их не нужно перечитывать
+_config = None
+
+
+@receiver(setting_changed)
+def reset_config(setting, **kwargs):
+    """
+    Сбрасывает настройки профилирования процесса при изменении FRIENDS_PROFILING (например, в тестах).
+    """
+    global _config
+    if setting == "FRIENDS_PROFILING":
+        _config = None
+
+
+def get_config(refresh=False):
+    """
+    Возвращает настройки профилирования: {"routes": {маршрут: доля}, "explain_ms": ..., "expires_at": ...}.
+
+    Настройки читаются из файла не чаще раза в CONFIG_REFRESH секунд, refresh=True читает их сразу.
+    Если профилирование выключено или время настроек истекло, возвращается пустой словарь.
+    """
+    global _config
+    cached = _config
+    now = time.monotonic()
+    if refresh or cached is None or cached[0] <= now:
+        cached = _config = (now + _options()["CONFIG_REFRESH"], _read_config())
+    return cached[1]
+
+
+def _read_config():
+    try:
+        config = json.loads((_directory() / CONFIG_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    if datetime.fromisoformat(config["expires_at"]) <= datetime.now(timezone.utc):
+        return {}
+    return config
+
+
+def set_config(routes, explain_ms=None, timeout=None):
+    """
+    Включает профилирование маршрутов и возвращает новые настройки.
+
+    :param routes: Доля профилируемых запросов по именам маршрутов (ALL_ROUTES - для остальных маршрутов).
+    :param explain_ms: Порог времени SQL-запроса в миллисекундах для EXPLAIN (по умолчанию EXPLAIN_MS).
+    :param timeout: Через сколько секунд профилирование выключится (по умолчанию TIMEOUT).
+    """
+    global _config
+    options = _options()
+    timeout = timeout or options["TIMEOUT"]
+    config = {
+        "routes": routes,
+        "explain_ms": options["EXPLAIN_MS"] if explain_ms is None else explain_ms,
+        "expires_at": datetime.fromtimestamp(time.time() + timeout, timezone.utc).isoformat(),
+    }
+    directory = _directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Запись во временный файл и переименование: другие процессы не прочитают недописанные настройки
+    temporary = directory / f".{CONFIG_FILE}.{uuid.uuid4().hex[:8]}.tmp"
+    temporary.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    os.replace(temporary, directory / CONFIG_FILE)
+    _config = None
+    return config
+
+
+def clear_config():
+    """
+    Выключает профилирование во всех процессах (в текущем - сразу, в остальных - после CONFIG_REFRESH).
+    """
+    global _config
+    (_directory() / CONFIG_FILE).unlink(missing_ok=True)
+    _config = None
+
+
+class ProfiledRequest:
+    """
+    Профиль одного запроса, который накапливается во время его обработки.
+
+    Поля:
+        route: Имя маршрута.
+        method: HTTP-метод.
+        path: Путь запроса.
+        queries: SQL-запросы: словари sql, params, alias, many, ms.
+        dropped_queries: Сколько SQL-запросов не записано сверх MAX_QUERIES.
+        profiler: cProfile.Profile или None, если вызовы функций не записываются.
+    """
+
+    __slots__ = ("route", "method", "path", "queries", "dropped_queries", "profiler", "max_queries", "_started")
+
+    def __init__(self, route, method, path, profiler, max_queries):
+        self.route = route
+        self.method = method
+        self.path = path
+        self.queries = []
+        self.dropped_queries = 0
+        self.profiler = profiler
+        self.max_queries = max_queries
+        self._started = 0.0
+
+
+_current = ContextVar("friends_profiling_request", default=None)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL (connection.execute_wrapper), записывающая запросы в профиль текущего запроса.
+    """
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        if len(profile.queries) < profile.max_queries:
+            alias = context["connection"].alias
+            profile.queries.append({"sql": sql, "params": params, "alias": alias, "many": many, "ms": elapsed * 1000})
+        else:
+            profile.dropped_queries += 1
+
+
+def sample(request):
+    """
+    Возвращает имя маршрута запроса, если запрос попал в выборку профилирования, иначе None.
+    """
+    routes = get_config().get("routes")
+    if not routes:
+        return None
+    try:
+        route = resolve(request.path_info, getattr(request, "urlconf", None)).view_name
+    except Resolver404:
+        route = metrics.UNMATCHED
+    rate = routes.get(route, routes.get(ALL_ROUTES, 0))
+    return route if rate and random.random() < rate else None
+
+
+def start(route, request, profile_calls=True):
+    """
+    Начинает профилирование запроса и возвращает (профиль, токен для stop).
+
+    :param route: Имя маршрута из sample.
+    :param request: HTTP-запрос.
+    :param profile_calls: Будут ли вызовы функций записываться cProfile (get_response вызывается через run).
+    """
+    profiler = cProfile.Profile() if profile_calls else None
+    profile = ProfiledRequest(route, request.method, request.path, profiler, _options()["MAX_QUERIES"])
+    token = _current.set(profile)
+    profile._started = time.perf_counter()
+    return profile, token
+
+
+def _profiled(get_response, request):
+    # Корень дерева вызовов: вызовы, начатые до включения профилировщика, cProfile записывает без вызывающей
+    return get_response(request)
+
+
+_ROOT = (_profiled.__code__.co_filename, _profiled.__code__.co_firstlineno, _profiled.__code__.co_name)
+
+
+def run(profile, get_response, request):
+    """
+    Вызывает get_response(request) под cProfile профиля и возвращает ответ.
+    """
+    return profile.profiler.runcall(_profiled, get_response, request)
+
+
+def stop(profile, token):
+    """
+    Завершает профиль, начатый start, и возвращает время запроса в секундах.
+    """
+    duration = time.perf_counter() - profile._started
+    _current.reset(token)
+    return duration
+
+
+def finish(profile, status_code, duration):
+    """
+    Выполняет EXPLAIN медленных SQL-запросов профиля, сохраняет профиль и возвращает его id.
+
+    Вызывается после stop, когда ответ уже сформирован: EXPLAIN и запись на диск
+    не попадают ни в профиль, ни во время ответа в профиле.
+    """
+    threshold = get_config().get("explain_ms", _options()["EXPLAIN_MS"])
+    queries = [_query_record(query, threshold) for query in profile.queries]
+    record = {
+        "route": profile.route,
+        "method": profile.method,
+        "path": profile.path,
+        "status": status_code,
+        "duration_ms": round(duration * 1000, 3),
+        "query_count": len(profile.queries) + profile.dropped_queries,
+        "db_ms": round(sum(query["ms"] for query in profile.queries), 3),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "explain_ms": threshold,
+        "dropped_queries": profile.dropped_queries,
+        "queries": queries,
+        "functions": [],
+        "call_tree": None,
+    }
+    if profile.profiler is not None:
+        profile.profiler.create_stats()
+        options = _options()
+        record["functions"] = _top_functions(profile.profiler.stats, options["TOP_FUNCTIONS"])
+        record["call_tree"] = _call_tree(profile.profiler.stats, duration * options["TREE_MIN_FRACTION"])
+    return save(record, profile.profiler)
+
+
+def _query_record(query, threshold):
+    """
+    Возвращает запись SQL-запроса для профиля, с планом EXPLAIN для SELECT не быстрее threshold мс.
+
+    EXPLAIN выполняется с настоящими параметрами, а в запись попадают только их типы; строковые
+    литералы параметров, которые PostgreSQL подставляет в план, заменяются на '?'.
+    """
+    record = {
+        "sql": query["sql"],
+        "params": None if query["many"] else _redacted_params(query["params"]),
+        "alias": query["alias"],
+        "ms": round(query["ms"], 3),
+        "explain": None,
+    }
+    if query["ms"] >= threshold and not query["many"] and query["sql"].lstrip()[:6].upper() == "SELECT":
+        connection = connections[query["alias"]]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}", query["params"])
+                rows = cursor.fetchall()
+            record["explain"] = _redact(
+                "\n".join(" ".join(str(column) for column in row) for row in rows), query["params"]
+            )
+        except DatabaseError as error:
+            record["explain"] = f"EXPLAIN failed: {error}"
+    return record
+
+
+def _param_values(params):
+    if params is None:
+        return []
+    return list(params.values() if isinstance(params, dict) else params)
+
+
+def _redacted_params(params):
+    if params is None:
+        return None
+    return [None if value is None else type(value).__name__ for value in _param_values(params)]
+
+
+def _redact(text, params):
+    for value in _param_values(params):
+        if isinstance(value, str) and value:
+            text = text.replace("'{}'".format(value.replace("'", "''")), "'?'")
+    return text
+
+
+def _label(function):
+    return pstats.func_std_string(function)
+
+
+def _top_functions(stats, limit):
+    """
+    Возвращает limit функций с наибольшим суммарным временем (вместе с вызванными функциями).
+    """
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": _label(function),
+            "calls": calls,
+            "own_ms": round(own * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        }
+        for function, (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def _call_tree(stats, min_time):
+    """
+    Возвращает дерево вызовов из статистики cProfile (корень - вызов get_response), отбрасывая ветки
+    быстрее min_time секунд.
+
+    cProfile хранит время вызовов по парам "вызывающая - вызванная функция" без полного стека,
+    поэтому время вызванной функции в ветке считается пропорционально доле вызывающей функции
+    в этой ветке от ее общего времени (как в gprof). Рекурсивные вызовы в ветку не раскрываются.
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, calls, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((cumulative, calls, function))
+    for children in callees.values():
+        children.sort(key=lambda child: child[0], reverse=True)
+
+    def node(function, cumulative, calls, path):
+        total = stats[function][3]
+        share = cumulative / total if total else 0.0
+        children = []
+        for child_time, child_calls, child in callees.get(function, ()):
+            child_time *= share
+            if child_time >= min_time and child not in path:
+                children.append(node(child, child_time, child_calls, path | {child}))
+        return {"function": _label(function), "calls": calls, "ms": round(cumulative * 1000, 3), "children": children}
+
+    if _ROOT not in stats:
+        return None
+    return node(_ROOT, stats[_ROOT][3], 1, {_ROOT})
+
+
+def _directory():
+    return Path(_options()["DIRECTORY"])
+
+
+def save(record, profiler=None):
+    """
+    Сохраняет профиль (и статистику cProfile в файл .prof) и удаляет самые старые профили сверх MAX_PROFILES.
+
+    Файлы пишутся во временные и переименовываются, поэтому читатели не видят недописанных профилей.
+    """
+    directory = _directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f"{time.time_ns() // 1_000_000:013d}-{uuid.uuid4().hex[:8]}"
+    record = {"id": profile_id, **record}
+    if profiler is not None:
+        temporary = directory / f".{profile_id}.prof.tmp"
+        profiler.dump_stats(temporary)
+        os.replace(temporary, directory / f"{profile_id}.prof")
+    temporary = directory / f".{profile_id}.json.tmp"
+    temporary.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+    os.replace(temporary, directory / f"{profile_id}.json")
+    _rotate(directory)
+    return profile_id
+
+
+def _rotate(directory):
+    # Имена профилей начинаются с времени создания, поэтому сортировка по имени - сортировка по времени
+    names = sorted(path.stem for path in directory.glob("*.json"))
+    for name in names[: max(len(names) - _options()["MAX_PROFILES"], 0)]:
+        (directory / f"{name}.json").unlink(missing_ok=True)
+        (directory / f"{name}.prof").unlink(missing_ok=True)
+
+
+def list_profiles():
+    """
+    Возвращает краткие записи сохраненных профилей (поля SUMMARY_FIELDS), от новых к старым.
+    """
+    directory = _directory()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            # Профиль удален другим процессом при ротации
+            continue
+        profiles.append({field: record.get(field) for field in SUMMARY_FIELDS})
+    return profiles
+
+
+def load(profile_id):
+    """
+    Возвращает сохраненный профиль по id или None, если его нет.
+    """
+    if not _PROFILE_ID.fullmatch(profile_id):
+        return None
+    try:
+        return json.loads((_directory() / f"{profile_id}.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+def stats_path(profile_id):
+    """
+    Возвращает путь к файлу статистики cProfile профиля или None, если его нет.
+    """
+    if not _PROFILE_ID.fullmatch(profile_id):
+        return None
+    path = _directory() / f"{profile_id}.prof"
+    return path if path.is_file() else None
@@ -0,0 +1,90 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson с тем же выводом, что и JSONRenderer DRF.
+
+    orjson кодирует большие списки в несколько раз быстрее стандартного json. Вывод совпадает
+    с JSONRenderer байт в байт: компактные разделители, символы вне ASCII без экранирования,
+    экранированные U+2028 и U+2029. Даты и прочие типы, которые orjson кодирует по-своему,
+    передаются в JSONEncoder DRF. Если orjson не установлен или запрошен отступ
+    (например, application/json; indent=4), используется JSONRenderer.
+    """
+
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Кодирует data в JSON и возвращает байты.
+        """
+        renderer_context = renderer_context or {}
+        if orjson is None or not self.compact or self.ensure_ascii or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            # Ключи словарей не-строки и другие случаи, которые orjson не кодирует
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Рендерер формата NDJSON для выбора формата экспорта (Accept или ?format=ndjson).
+
+    Экспорт отдается потоковым ответом мимо рендерера; сам рендерер кодирует одной строкой
+    только ответы об ошибках.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return (json.dumps(data, ensure_ascii=False) + "\n").encode()
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Рендерер формата CSV для выбора формата экспорта (Accept или ?format=csv).
+
+    Как и NDJSONRenderer, сам кодирует только ответы об ошибках: строкой с текстом ошибки.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        detail = data.get("detail", data) if isinstance(data, dict) else data
+        return f"{detail}\n".encode()
+
+
+class PrometheusTextRenderer(BaseRenderer):
+    """
+    Рендерер текстового формата метрик Prometheus (friends.metrics.exposition).
+    """
+
+    media_type = "text/plain"
+    format = "prometheus"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode()
+        detail = data.get("detail", data) if isinstance(data, dict) else data
+        return f"{detail}\n".encode()
@@ -0,0 +1,162 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .conditional import user_version
+
+_counters = {"hits": 0, "misses": 0, "waits": 0}
+_lock = threading.Lock()
+
+
+def _options():
+    return {"ALIAS": "default", "TIMEOUT": 300, "LOCK_TIMEOUT": 10, "WAIT": 2, **settings.FRIENDS_RESPONSE_CACHE}
+
+
+def _cache():
+    return caches[_options()["ALIAS"]]
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def stats():
+    """
+    Возвращает счетчики попаданий, промахов и ожиданий чужого пересчета в текущем процессе.
+    """
+    with _lock:
+        counters = dict(_counters)
+    total = counters["hits"] + counters["misses"]
+    counters["hit_rate"] = round(counters["hits"] / total, 4) if total else None
+    return counters
+
+
+def reset_stats():
+    """
+    Обнуляет счетчики кэша ответов.
+    """
+    with _lock:
+        for name in _counters:
+            _counters[name] = 0
+
+
+def get_or_compute(key, compute):
+    """
+    Возвращает запись кэша по ключу, вычисляя ее не больше чем одним запросом одновременно.
+
+    Первый запрос, не нашедший запись, берет блокировку (cache.add) и вычисляет ее;
+    остальные ждут появления записи до WAIT секунд, а затем вычисляют сами без сохранения.
+    compute возвращает кортеж (результат, запись для кэша или None, если кэшировать нельзя).
+
+    :return: Кортеж (результат или None, запись кэша или None).
+    """
+    options = _options()
+    cache = _cache()
+    entry = cache.get(key)
+    if entry is not None:
+        _count("hits")
+        return None, entry
+    _count("misses")
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, timeout=options["LOCK_TIMEOUT"]):
+        _count("waits")
+        deadline = time.monotonic() + options["WAIT"]
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return None, entry
+            if cache.get(lock_key) is None:
+                break
+        return compute()
+    try:
+        result, entry = compute()
+        if entry is not None:
+            cache.set(key, entry, timeout=options["TIMEOUT"])
+        return result, entry
+    finally:
+        cache.delete(lock_key)
+
+
+class CachedJSONResponse(HttpResponse):
+    """
+    Ответ с готовыми байтами JSON из кэша.
+
+    Свойство data декодирует тело по требованию, как data у Response DRF, поэтому
+    код, читающий response.data (например, тесты), работает и с закэшированным ответом.
+    """
+
+    @property
+    def data(self):
+        return json.loads(self.content)
+
+
+def _entry_response(request, entry):
+    """
+    Собирает ответ из записи кэша, отвечая 304 на совпадающий условный запрос.
+    """
+    body, content_type, etag, last_modified = entry
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+    )
+    if response is None:
+        response = CachedJSONResponse(body, content_type=content_type)
+    if etag:
+        response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = last_modified
+    return response
+
+
+def cached_user_response(method):
+    """
+    Декоратор метода get представления DRF, кэширующий ответ пользователя готовыми байтами JSON.
+
+    Ключ ответа состоит из id пользователя, версии его данных (UserStats.version), полного пути
+    запроса и формата ответа. Версия читается из базы тем же запросом, что и для ETag, поэтому
+    любое изменение друзей, заявок или токена пользователя сразу делает старые ответы недоступными
+    во всех процессах, даже если у каждого процесса свой кэш. При попадании ответ, в том числе 304
+    на условный запрос, собирается из кэша после одного чтения версии, без запросов к спискам
+    и без рендеринга. Кэшируются только ответы 200 в формате JSON; на время первого вычисления
+    ответа популярного пользователя остальные запросы ждут его результат (single-flight),
+    а не пересчитывают ответ параллельно.
+    Декоратор ставится поверх user_conditional, чтобы в запись попали ETag и Last-Modified.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        renderer = getattr(request, "accepted_renderer", None)
+        if not _options()["TIMEOUT"] or getattr(renderer, "format", None) != "json":
+            return method(self, request, *args, **kwargs)
+
+        accept = request.META.get("HTTP_ACCEPT", "")
+        path_hash = hashlib.sha256(f"{request.get_full_path()}:{accept}".encode()).hexdigest()[:32]
+        user_id = request.user.pk
+        version, _ = user_version(request)
+        key = f"friends:response:{user_id}:{version}:{path_hash}"
+
+        def compute():
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200 or getattr(response, "data", None) is None:
+                return response, None
+            body = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+            content_type = (
+                f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+            )
+            return response, (body, content_type, response.get("ETag"), response.get("Last-Modified"))
+
+        response, entry = get_or_compute(key, compute)
+        return response if response is not None else _entry_response(request, entry)
+
+    return wrapper
@@ -0,0 +1,94 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# База, из которой читает текущий запрос (контекст): DEFAULT_DB_ALIAS, если чтения закреплены за основной базой,
+# реплика, выбранная в начале запроса, или None вне запроса (каждое чтение - в случайную реплику)
+_read_alias = contextvars.ContextVar("friends_db_read_alias", default=None)
+
+
+def _replicas():
+    return getattr(settings, "FRIENDS_DB_REPLICAS", ())
+
+
+def pin_to_primary():
+    """
+    Направляет все последующие чтения текущего контекста в основную базу.
+    """
+    _read_alias.set(DEFAULT_DB_ALIAS)
+
+
+def is_pinned():
+    """
+    Возвращает True, если чтения текущего контекста закреплены за основной базой.
+    """
+    return _read_alias.get() == DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_primary():
+    """
+    Контекстный менеджер, внутри которого все чтения идут в основную базу.
+    """
+    token = _read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def request_scope(pinned=False):
+    """
+    Контекстный менеджер состояния маршрутизации одного запроса.
+
+    Незакрепленный запрос выбирает одну случайную реплику и читает все данные из нее: реплики
+    отстают по-разному, и чтения из разных реплик могли бы сложиться в несогласованный ответ
+    (например, версия UserStats из одной реплики и список из другой, более отстающей).
+
+    :param pinned: Закрепить чтения запроса за основной базой с самого начала.
+    """
+    replicas = _replicas()
+    if pinned:
+        alias = DEFAULT_DB_ALIAS
+    else:
+        alias = random.choice(replicas) if replicas else None
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Маршрутизатор баз: запись - в основную базу, чтение - в реплику из FRIENDS_DB_REPLICAS, выбранную
+    на весь запрос (request_scope), а вне запроса - в случайную реплику.
+
+    Чтение идет в основную базу, если реплик нет, если контекст закреплен за основной базой
+    (после записи в этом запросе или недавней записи того же клиента, см. ReadYourWritesMiddleware)
+    или если открыта транзакция в основной базе: SELECT ... FOR UPDATE и чтения внутри
+    транзакции должны видеть ее собственные изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = _replicas()
+        alias = _read_alias.get()
+        if not replicas or alias == DEFAULT_DB_ALIAS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias if alias in replicas else random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Запрос, который уже писал, дальше читает из основной базы: реплика может отставать
+        _read_alias.set(DEFAULT_DB_ALIAS)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему репликацией из основной базы
+        return db not in getattr(settings, "FRIENDS_DB_REPLICAS", ())
@@ -1,11 +1,33 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import serializers
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.parsers import JSONParser
 from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from rest_framework.validators import UniqueValidator
 
-from .models import Friend, FriendRequest
+from . import hashing, metrics, profiling
+from .models import Friendship, FriendRequest, FriendSuggestion
+
+
+class TimedDataMixin:
+    """
+    Примесь к сериализаторам DRF, учитывающая время получения data в метриках запроса (friends.metrics).
+    """
+
+    @property
+    def data(self):
+        with metrics.serialize_timer:
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """
+    ListSerializer для many=True с учетом времени сериализации в метриках запроса.
+    """
 
 
 class FriendRequestSerializer(serializers.ModelSerializer):
@@ -26,6 +48,42 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         fields = ["from_user", "to_user", "timestamp"]
 
 
+class UsernameListSerializer(serializers.Serializer):
+    """
+    Сериализатор для проверки списка имен пользователей в массовых операциях с заявками.
+
+    Поля:
+        usernames: Непустой список имен пользователей (не больше FRIENDS_BULK_MAX_USERNAMES).
+    """
+
+    usernames = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        max_length=settings.FRIENDS_BULK_MAX_USERNAMES,
+    )
+
+
+class ProfilingConfigSerializer(serializers.Serializer):
+    """
+    Сериализатор для проверки настроек профилирования запросов (friends.profiling).
+
+    Поля:
+        routes: Доля профилируемых запросов от 0 до 1 по именам маршрутов; "*" - для остальных маршрутов.
+        explain_ms: Порог времени SQL-запроса в миллисекундах, начиная с которого сохраняется его план (EXPLAIN).
+        timeout: Через сколько секунд профилирование выключится само.
+    """
+
+    routes = serializers.DictField(child=serializers.FloatField(min_value=0, max_value=1), allow_empty=False)
+    explain_ms = serializers.FloatField(min_value=0, required=False)
+    timeout = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_routes(self, routes):
+        unknown = set(routes) - set(metrics.routes()) - {profiling.ALL_ROUTES}
+        if unknown:
+            raise serializers.ValidationError(f"Неизвестные маршруты: {', '.join(sorted(unknown))}")
+        return routes
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Сериализатор для создания и проверки данных пользователя.
@@ -63,7 +121,8 @@ class UserSerializer(serializers.ModelSerializer):
             email=validated_data["email"],
             username=validated_data["username"],
         )
-        user.set_password(validated_data["password"])  # Хэшируем пароль
+        # Хэшируем пароль в ограниченном пуле; при перегрузке пула клиент получит 429
+        user.password = hashing.make_password(validated_data["password"])
         user.save()
         return user
 
@@ -81,6 +140,48 @@ class FriendSerializer(serializers.ModelSerializer):
         fields = ["username"]
 
 
+class FriendshipSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для представления дружбы с точки зрения одного из пользователей.
+
+    Пользователь, для которого строится список, передается в context["user"].
+
+    Поля:
+        username: Имя пользователя друга.
+        created_at: Дата и время, когда пользователи стали друзьями.
+    """
+
+    username = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Friendship
+        fields = ["username", "created_at"]
+
+    def get_username(self, obj):
+        """
+        Возвращает имя второго участника дружбы.
+        """
+        return obj.other_user(self.context["user"]).username
+
+
+class FriendSuggestionSerializer(TimedDataMixin, serializers.ModelSerializer):
+    """
+    Сериализатор для представления рекомендации друга.
+
+    Поля:
+        username: Имя рекомендуемого пользователя.
+        mutual_friends: Количество общих друзей.
+    """
+
+    username = serializers.CharField(source="candidate.username")
+    mutual_friends = serializers.IntegerField(source="mutual_count")
+
+    class Meta:
+        model = FriendSuggestion
+        fields = ["username", "mutual_friends"]
+        list_serializer_class = TimedListSerializer
+
+
 class AllUsersSerializer(serializers.ModelSerializer):
     """
     Сериализатор для отображения всех пользователей в системе.
@@ -94,7 +195,33 @@ class AllUsersSerializer(serializers.ModelSerializer):
         fields = ["username"]
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSummarySerializer(TimedDataMixin, serializers.ModelSerializer):
+    """
+    Сериализатор для краткого профиля пользователя без встроенных списков.
+
+    Поля:
+        username: Имя пользователя.
+        email: Электронная почта пользователя.
+        token: Токен аутентификации пользователя.
+    """
+
+    token = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ["username", "email", "token"]
+
+    def get_token(self, obj):
+        """
+        Возвращает токен аутентификации пользователя, если он существует.
+        """
+        try:
+            return obj.auth_token.key
+        except Token.DoesNotExist:
+            return None
+
+
+class UserProfileSerializer(TimedDataMixin, serializers.ModelSerializer):
     """
     Сериализатор для отображения профиля пользователя и его связанных данных, таких как друзья и заявки в друзья.
 
@@ -123,33 +250,164 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "token",
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Добавляет к queryset пользователей загрузку всех связанных данных профиля.
+
+        Токен подгружается через JOIN, а запросы в друзья - двумя запросами Prefetch
+        вместе с именами обоих пользователей, поэтому число запросов не зависит
+        от количества друзей и заявок.
+        """
+        request_queryset = FriendRequest.objects.select_related("from_user", "to_user").order_by("timestamp", "id")
+        return queryset.select_related("auth_token").prefetch_related(
+            Prefetch("friend_requests_sent", queryset=request_queryset),
+            Prefetch("friend_requests_received", queryset=request_queryset),
+        )
+
     def get_friends(self, obj):
         """
         Возвращает список друзей пользователя.
         """
-        friends = Friend.objects.filter(current_user=obj).prefetch_related("users")
-        return FriendSerializer(friends.first().users.all(), many=True).data if friends.exists() else []
+        return FriendSerializer(Friendship.friends_of(obj).only("username"), many=True).data
 
     def get_friend_requests_sent(self, obj):
         """
         Возвращает список запросов в друзья, отправленных пользователем.
         """
-        sent_requests = FriendRequest.objects.filter(from_user=obj)
-        return FriendRequestSerializer(sent_requests, many=True).data
+        return FriendRequestSerializer(obj.friend_requests_sent.all(), many=True).data
 
     def get_friend_requests_received(self, obj):
         """
         Возвращает список запросов в друзья, полученных пользователем.
         """
-        received_requests = FriendRequest.objects.filter(to_user=obj)
-        return FriendRequestSerializer(received_requests, many=True).data
+        return FriendRequestSerializer(obj.friend_requests_received.all(), many=True).data
 
     def get_token(self, obj):
         """
         Возвращает токен аутентификации пользователя, если он существует.
         """
         try:
-            token = Token.objects.get(user=obj)
-            return token.key
+            return obj.auth_token.key
         except Token.DoesNotExist:
             return None
+
+
+# Поле DRF, которым легкие сериализаторы форматируют даты в случаях, не покрытых _datetime_formatter
+_datetime_field = serializers.DateTimeField()
+
+
+def _datetime_formatter():
+    """
+    Возвращает функцию форматирования дат с тем же выводом, что и DateTimeField DRF.
+
+    DateTimeField определяет текущий часовой пояс заново для каждого значения, и на больших
+    страницах это основная часть времени сериализации. Здесь пояс определяется один раз
+    на страницу. Наивные даты и формат, отличный от ISO 8601, форматирует само поле DRF.
+    """
+    output_format = api_settings.DATETIME_FORMAT
+    if not settings.USE_TZ or not isinstance(output_format, str) or output_format.lower() != ISO_8601:
+        return _datetime_field.to_representation
+    current_timezone = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if not value or isinstance(value, str) or timezone.is_naive(value):
+            return _datetime_field.to_representation(value)
+        value = value.astimezone(current_timezone).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+    return format_datetime
+
+
+class ValuesListSerializer:
+    """
+    Базовый легкий сериализатор только для чтения для больших списков.
+
+    ModelSerializer на каждую строку создает экземпляр модели и проходит по связанным полям DRF.
+    Легкий сериализатор берет из базы только нужные колонки кортежами (values_list с named=True,
+    поэтому курсорная пагинация читает поле сортировки как атрибут строки) и строит выходные
+    словари напрямую. Вывод совпадает с соответствующим ModelSerializer байт в байт.
+
+    Поля:
+        columns: Колонки values_list, которые нужны to_representation.
+
+    Методы:
+        values: Возвращает queryset строк-кортежей для сериализатора.
+        to_representation: Строит выходной словарь одной строки.
+        data: Список выходных словарей всех строк.
+    """
+
+    columns = ()
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+        self.format_datetime = _datetime_formatter()
+
+    @classmethod
+    def values(cls, queryset, *extra):
+        """
+        Возвращает queryset именованных кортежей колонок сериализатора и дополнительных колонок extra.
+        """
+        return queryset.values_list(*cls.columns, *extra, named=True)
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        to_representation = self.to_representation
+        with metrics.serialize_timer:
+            return [to_representation(row) for row in self.rows]
+
+
+class UsernameValuesSerializer(ValuesListSerializer):
+    """
+    Легкий сериализатор имени пользователя; вывод совпадает с FriendSerializer и AllUsersSerializer.
+
+    Поля:
+        username: Имя пользователя.
+    """
+
+    columns = ("username",)
+
+    def to_representation(self, row):
+        return {"username": row[0]}
+
+
+class FriendRequestValuesSerializer(ValuesListSerializer):
+    """
+    Легкий сериализатор заявок в друзья; вывод совпадает с FriendRequestSerializer.
+
+    Имена обоих пользователей читаются тем же запросом через JOIN, без select_related и моделей.
+
+    Поля:
+        from_user: Имя пользователя, отправившего запрос в друзья.
+        to_user: Имя пользователя, получившего запрос в друзья.
+        timestamp: Дата и время создания запроса.
+    """
+
+    columns = ("from_user__username", "to_user__username", "timestamp")
+
+    def to_representation(self, row):
+        return {"from_user": row[0], "to_user": row[1], "timestamp": self.format_datetime(row[2])}
+
+
+class FriendshipValuesSerializer(ValuesListSerializer):
+    """
+    Легкий сериализатор дружбы с точки зрения пользователя из context["user"]; вывод совпадает
+    с FriendshipSerializer.
+
+    Поля:
+        username: Имя пользователя друга.
+        created_at: Дата и время, когда пользователи стали друзьями.
+    """
+
+    columns = ("user_low_id", "user_low__username", "user_high__username", "created_at")
+
+    def to_representation(self, row):
+        user_id = self.context["user"].pk
+        return {
+            "username": row[2] if row[0] == user_id else row[1],
+            "created_at": self.format_datetime(row[3]),
+        }
@@ -0,0 +1,324 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from . import events
+from .models import Friendship, FriendRequest, UserStats, friendships_created
+
+# Статусы результатов операций с заявками и друзьями
+SENT = "sent"
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+DELETED = "deleted"
+ALREADY_SENT = "already_sent"
+ALREADY_FRIENDS = "already_friends"
+NOT_FRIENDS = "not_friends"
+NO_REQUEST = "no_request"
+NOT_FOUND = "not_found"
+SELF = "self"
+
+# Фрагменты сообщений об ошибках, после которых транзакцию можно безопасно повторить:
+# блокировка SQLite, взаимоблокировка и конфликт сериализации PostgreSQL
+RETRYABLE_ERRORS = ("database is locked", "database table is locked", "deadlock", "could not serialize")
+
+
+def atomic_with_retry(func):
+    """
+    Декоратор, выполняющий функцию в транзакции и повторяющий ее при конфликте блокировок.
+
+    Повтор возможен только для внешней транзакции: внутри уже открытой транзакции
+    функция выполняется один раз, а ошибка передается вызывающему коду.
+    Количество попыток задается настройкой FRIENDS_TRANSACTION_RETRIES.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = 1 if connection.in_atomic_block else settings.FRIENDS_TRANSACTION_RETRIES + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == attempts or not any(text in str(error).lower() for text in RETRYABLE_ERRORS):
+                    raise
+                time.sleep(random.uniform(0, min(0.005 * 2**attempt, 0.2)))
+
+    return wrapper
+
+
+def _lock_users(*user_ids):
+    """
+    Блокирует строки пользователей (SELECT ... FOR UPDATE) в порядке возрастания id.
+
+    Все операции над парой пользователей берут одни и те же блокировки в одном порядке,
+    поэтому параллельные встречные заявки выполняются последовательно без взаимоблокировок.
+    SQLite не поддерживает FOR UPDATE и сериализует запись блокировкой всей базы. Если транзакция
+    сначала читает, а потом пишет, при конкурентной записи SQLite сразу возвращает "database is locked",
+    не дожидаясь busy_timeout. Поэтому на SQLite первым запросом выполняется пустой UPDATE: он берет
+    блокировку записи с ожиданием, как BEGIN IMMEDIATE. Оставшиеся конфликты повторяет atomic_with_retry.
+    """
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE "{User._meta.db_table}" SET "id" = "id" WHERE 0')
+        return
+    list(User.objects.select_for_update().filter(pk__in=set(user_ids)).order_by("pk").values_list("pk", flat=True))
+
+
+@atomic_with_retry
+def send_request(user, target):
+    """
+    Отправляет заявку в друзья или принимает встречную заявку, если она есть.
+
+    :param user: Пользователь, отправляющий заявку.
+    :param target: Пользователь, которому отправляется заявка.
+    :return: SELF, ALREADY_FRIENDS, ALREADY_SENT, ACCEPTED или SENT.
+    """
+    if user.pk == target.pk:
+        return SELF
+    _lock_users(user.pk, target.pk)
+    if Friendship.are_friends(user, target):
+        return ALREADY_FRIENDS
+    if FriendRequest.objects.filter(from_user=user, to_user=target).exists():
+        return ALREADY_SENT
+    reverse_request = FriendRequest.objects.filter(from_user=target, to_user=user).first()
+    if reverse_request:
+        reverse_request.accept()
+        events.publish_on_commit(events.REQUEST_ACCEPTED, user, [target.pk])
+        return ACCEPTED
+    try:
+        FriendRequest.send(user, target)
+    except IntegrityError:
+        # Уникальное ограничение (from_user, to_user): заявку уже создал параллельный запрос
+        return ALREADY_SENT
+    events.publish_on_commit(events.FRIEND_REQUEST_RECEIVED, user, [target.pk])
+    return SENT
+
+
+@atomic_with_retry
+def accept_request(user, sender):
+    """
+    Принимает заявку в друзья от пользователя sender.
+
+    :return: ACCEPTED или NO_REQUEST.
+    """
+    _lock_users(user.pk, sender.pk)
+    friend_request = FriendRequest.objects.filter(from_user=sender, to_user=user).first()
+    if friend_request is None:
+        return NO_REQUEST
+    friend_request.accept()
+    events.publish_on_commit(events.REQUEST_ACCEPTED, user, [sender.pk])
+    return ACCEPTED
+
+
+@atomic_with_retry
+def reject_request(user, sender):
+    """
+    Отклоняет заявку в друзья от пользователя sender.
+
+    :return: REJECTED или NO_REQUEST.
+    """
+    _lock_users(user.pk, sender.pk)
+    friend_request = FriendRequest.objects.filter(from_user=sender, to_user=user).first()
+    if friend_request is None:
+        return NO_REQUEST
+    friend_request.reject()
+    events.publish_on_commit(events.REQUEST_REJECTED, user, [sender.pk])
+    return REJECTED
+
+
+@atomic_with_retry
+def delete_friend(user, friend):
+    """
+    Удаляет дружбу между пользователями.
+
+    :return: SELF, DELETED или NOT_FRIENDS.
+    """
+    if user.pk == friend.pk:
+        return SELF
+    _lock_users(user.pk, friend.pk)
+    if not Friendship.lose_friend(user, friend):
+        return NOT_FRIENDS
+    events.publish_on_commit(events.FRIEND_REMOVED, user, [friend.pk])
+    return DELETED
+
+
+def _resolve_usernames(usernames):
+    """
+    Находит пользователей по списку имен одним запросом IN.
+
+    :param usernames: Список имен пользователей (повторы игнорируются).
+    :return: Кортеж (имена без повторов в исходном порядке, словарь {имя: пользователь}).
+    """
+    usernames = list(dict.fromkeys(usernames))
+    users = User.objects.filter(username__in=usernames).only("id", "username")
+    return usernames, {user.username: user for user in users}
+
+
+def _friend_ids_among(user, user_ids):
+    """
+    Возвращает id пользователей из user_ids, которые уже являются друзьями user.
+    """
+    as_low = Friendship.objects.filter(user_low_id=user.pk, user_high_id__in=user_ids).values_list("user_high_id")
+    as_high = Friendship.objects.filter(user_high_id=user.pk, user_low_id__in=user_ids).values_list("user_low_id")
+    return {friend_id for (friend_id,) in as_low.union(as_high)}
+
+
+def _accept_requests(user, friend_requests):
+    """
+    Принимает заявки, отправленные пользователю: создает дружбы одной вставкой и удаляет заявки одним запросом.
+
+    Вызывается внутри транзакции. Заявки от пользователей, которые уже друзья, только удаляются.
+
+    :param user: Пользователь, которому отправлены заявки.
+    :param friend_requests: Список объектов FriendRequest с to_user == user.
+    """
+    if not friend_requests:
+        return
+    sender_ids = [request.from_user_id for request in friend_requests]
+    friend_ids = _friend_ids_among(user, sender_ids)
+    new_friend_ids = [sender_id for sender_id in sender_ids if sender_id not in friend_ids]
+    pairs = [Friendship.ordered_pair(user.pk, friend_id) for friend_id in new_friend_ids]
+    Friendship.objects.bulk_create(
+        [Friendship(user_low_id=low, user_high_id=high) for low, high in pairs],
+        ignore_conflicts=True,
+    )
+    FriendRequest.objects.filter(pk__in=[request.pk for request in friend_requests]).delete()
+
+    UserStats.adjust(user, friends=len(new_friend_ids), received=-len(sender_ids))
+    UserStats.adjust_many(sender_ids, sent=-1)
+    UserStats.adjust_many(new_friend_ids, friends=1)
+    if pairs:
+        friendships_created.send(sender=Friendship, pairs=pairs)
+    events.publish_on_commit(events.REQUEST_ACCEPTED, user, sender_ids)
+
+
+def bulk_send_requests(user, usernames):
+    """
+    Отправляет заявки в друзья списку пользователей.
+
+    Если пользователь уже отправил встречную заявку, она принимается, как в send_request.
+    Все проверки выполняются несколькими запросами на весь список, запись - в одной транзакции.
+
+    :param user: Пользователь, отправляющий заявки.
+    :param usernames: Список имен пользователей.
+    :return: Список словарей {"username", "status"} в порядке имен.
+    """
+    usernames, found = _resolve_usernames(usernames)
+    statuses = _bulk_send_requests(user, [target.pk for target in found.values()])
+    return _results(usernames, found, statuses)
+
+
+def bulk_accept_requests(user, usernames):
+    """
+    Принимает заявки в друзья от списка пользователей.
+
+    :param user: Пользователь, принимающий заявки.
+    :param usernames: Список имен пользователей, отправивших заявки.
+    :return: Список словарей {"username", "status"} в порядке имен.
+    """
+    usernames, found = _resolve_usernames(usernames)
+    statuses = _bulk_accept_requests(user, [sender.pk for sender in found.values()])
+    return _results(usernames, found, statuses)
+
+
+def bulk_reject_requests(user, usernames):
+    """
+    Отклоняет заявки в друзья от списка пользователей одним запросом DELETE.
+
+    :param user: Пользователь, отклоняющий заявки.
+    :param usernames: Список имен пользователей, отправивших заявки.
+    :return: Список словарей {"username", "status"} в порядке имен.
+    """
+    usernames, found = _resolve_usernames(usernames)
+    statuses = _bulk_reject_requests(user, [sender.pk for sender in found.values()])
+    return _results(usernames, found, statuses)
+
+
+def _results(usernames, found, statuses):
+    """
+    Собирает результаты массовой операции в порядке имен пользователей.
+
+    :param usernames: Имена пользователей без повторов.
+    :param found: Словарь {имя: пользователь} найденных пользователей.
+    :param statuses: Словарь {id пользователя: статус}.
+    """
+    return [
+        {"username": username, "status": statuses[found[username].pk] if username in found else NOT_FOUND}
+        for username in usernames
+    ]
+
+
+@atomic_with_retry
+def _bulk_send_requests(user, target_ids):
+    """
+    Транзакционная часть bulk_send_requests.
+
+    :return: Словарь {id пользователя: статус}.
+    """
+    other_ids = [target_id for target_id in target_ids if target_id != user.pk]
+    _lock_users(user.pk, *other_ids)
+    friend_ids = _friend_ids_among(user, other_ids)
+    already_sent = set(
+        FriendRequest.objects.filter(from_user=user, to_user_id__in=other_ids).values_list("to_user_id", flat=True)
+    )
+    reverse_requests = {
+        request.from_user_id: request
+        for request in FriendRequest.objects.filter(from_user_id__in=other_ids, to_user=user)
+    }
+
+    statuses, to_send = {user.pk: SELF}, []
+    for target_id in other_ids:
+        if target_id in friend_ids:
+            statuses[target_id] = ALREADY_FRIENDS
+        elif target_id in already_sent:
+            statuses[target_id] = ALREADY_SENT
+        elif target_id in reverse_requests:
+            statuses[target_id] = ACCEPTED
+        else:
+            statuses[target_id] = SENT
+            to_send.append(target_id)
+
+    FriendRequest.objects.bulk_create([FriendRequest(from_user=user, to_user_id=target_id) for target_id in to_send])
+    if to_send:
+        UserStats.adjust(user, sent=len(to_send))
+        UserStats.adjust_many(to_send, received=1)
+        events.publish_on_commit(events.FRIEND_REQUEST_RECEIVED, user, to_send)
+    _accept_requests(user, [reverse_requests[pk] for pk, status in statuses.items() if status == ACCEPTED])
+    return statuses
+
+
+@atomic_with_retry
+def _bulk_accept_requests(user, sender_ids):
+    """
+    Транзакционная часть bulk_accept_requests.
+
+    :return: Словарь {id пользователя: статус}.
+    """
+    _lock_users(user.pk, *sender_ids)
+    pending = list(FriendRequest.objects.filter(from_user_id__in=sender_ids, to_user=user))
+    _accept_requests(user, pending)
+    accepted = {request.from_user_id for request in pending}
+    return {sender_id: ACCEPTED if sender_id in accepted else NO_REQUEST for sender_id in sender_ids}
+
+
+@atomic_with_retry
+def _bulk_reject_requests(user, sender_ids):
+    """
+    Транзакционная часть bulk_reject_requests.
+
+    :return: Словарь {id пользователя: статус}.
+    """
+    _lock_users(user.pk, *sender_ids)
+    pending = dict(
+        FriendRequest.objects.filter(from_user_id__in=sender_ids, to_user=user).values_list("from_user_id", "pk")
+    )
+    if pending:
+        FriendRequest.objects.filter(pk__in=pending.values()).delete()
+        UserStats.adjust(user, received=-len(pending))
+        UserStats.adjust_many(pending.keys(), sent=-1)
+        events.publish_on_commit(events.REQUEST_REJECTED, user, pending.keys())
+    return {sender_id: REJECTED if sender_id in pending else NO_REQUEST for sender_id in sender_ids}
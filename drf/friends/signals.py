@@ -1,8 +1,60 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from . import authentication, graph, metrics, profiling, suggestions
+from .models import UserStats, friendship_changed, friendships_created
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Сигнал для настройки нового соединения с SQLite командами PRAGMA из FRIENDS_SQLITE_PRAGMAS.
+
+    :param sender: Класс обертки соединения с базой.
+    :param connection: Новое соединение с базой.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "FRIENDS_SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    """
+    Сигнал для установки на соединение обертки, учитывающей SQL-запросы в метриках запроса.
+
+    Обертка ставится первой: контекстный менеджер connection.execute_wrapper снимает последнюю
+    обертку из списка, и соединение, открытое внутри него, не должно потерять обертку метрик.
+
+    :param sender: Класс обертки соединения с базой.
+    :param connection: Новое соединение с базой.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if metrics.execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, metrics.execute_wrapper)
+
+
+@receiver(connection_created)
+def install_query_profiling(sender, connection, **kwargs):
+    """
+    Сигнал для установки на соединение обертки, записывающей SQL-запросы в профиль запроса (friends.profiling).
+
+    Обертка ставится первой по той же причине, что и обертка метрик.
+
+    :param sender: Класс обертки соединения с базой.
+    :param connection: Новое соединение с базой.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if profiling.execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, profiling.execute_wrapper)
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
@@ -21,3 +73,133 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
     """
     if instance and created:
         Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_stats(sender, instance=None, created=False, **kwargs):
+    """
+    Сигнал для создания строки счетчиков друзей и заявок для нового пользователя.
+
+    :param sender: Модель, которая отправляет сигнал (в данном случае `AUTH_USER_MODEL`).
+    :param instance: Экземпляр модели пользователя, который был создан или изменен.
+    :param created: Логическое значение, указывающее, был ли пользователь создан (True) или обновлен (False).
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if instance and created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """
+    Сигнал для сброса закэшированной аутентификации при удалении или замене токена.
+
+    Токен входит в профиль пользователя, поэтому версия данных пользователя увеличивается:
+    меняются ETag профиля и ключ закэшированного ответа.
+
+    :param sender: Модель Token.
+    :param instance: Удаленный или сохраненный токен.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    key = instance.key
+    authentication.invalidate(key)
+    transaction.on_commit(lambda: authentication.invalidate(key))
+    # Без строки UserStats (новый пользователь или удаление пользователя каскадом) ответов по версии еще нет
+    UserStats.touch([instance.user_id], create_missing=False)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user_tokens(sender, instance=None, created=False, **kwargs):
+    """
+    Сигнал для сброса закэшированной аутентификации пользователя при его изменении.
+
+    Закэшированный пользователь не должен пережить деактивацию, поэтому при любом
+    сохранении существующего пользователя сбрасываются записи всех его токенов.
+
+    :param sender: Модель, которая отправляет сигнал (в данном случае `AUTH_USER_MODEL`).
+    :param instance: Экземпляр модели пользователя, который был изменен.
+    :param created: Логическое значение, указывающее, был ли пользователь создан (True) или обновлен (False).
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if instance is None or created:
+        return
+    keys = list(Token.objects.filter(user_id=instance.pk).values_list("key", flat=True))
+    authentication.invalidate(*keys)
+    transaction.on_commit(lambda: authentication.invalidate(*keys))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_user_stats(sender, instance=None, created=False, update_fields=None, **kwargs):
+    """
+    Сигнал для увеличения версии данных пользователя при изменении его имени или почты.
+
+    Версия определяет ETag профиля, поэтому изменение полей профиля должно ее менять.
+    Сохранение только last_login (вход в систему) версию не меняет.
+
+    :param sender: Модель, которая отправляет сигнал (в данном случае `AUTH_USER_MODEL`).
+    :param instance: Экземпляр модели пользователя, который был изменен.
+    :param created: Логическое значение, указывающее, был ли пользователь создан (True) или обновлен (False).
+    :param update_fields: Сохраняемые поля, если они были указаны.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if instance is None or created or (update_fields is not None and set(update_fields) == {"last_login"}):
+        return
+    UserStats.touch([instance.pk])
+
+
+@receiver(friendship_changed)
+def invalidate_friend_graph(sender, user_ids, **kwargs):
+    """
+    Сигнал для сброса закэшированных множеств друзей при изменении дружбы.
+
+    Кэш сбрасывается сразу и повторно после фиксации транзакции, чтобы параллельный
+    запрос не оставил в кэше множество, прочитанное до фиксации.
+
+    :param sender: Модель Friendship.
+    :param user_ids: Пара id пользователей, чья дружба изменилась.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    graph.invalidate(*user_ids)
+    transaction.on_commit(lambda: graph.invalidate(*user_ids))
+
+
+@receiver(friendship_changed)
+def update_friend_suggestions(sender, user_ids, created, **kwargs):
+    """
+    Сигнал для инкрементального обновления рекомендаций друзей при изменении дружбы.
+
+    Множества друзей для изменений рекомендаций читаются в транзакции изменения дружбы, а изменения
+    считаются и записываются после ее фиксации, когда строки обоих пользователей уже не заблокированы,
+    большие - в фоновом потоке (см. friends.suggestions.schedule). При откате транзакции они
+    не записываются, а ошибка записи не отменяет изменение дружбы и только записывается в лог:
+    расхождение исправляет команда rebuild_suggestions.
+
+    :param sender: Модель Friendship.
+    :param user_ids: Пара id пользователей, чья дружба изменилась.
+    :param created: True, если дружба создана, False - если удалена.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    if created:
+        plan = suggestions.plan_friendships_added([user_ids])
+    else:
+        plan = suggestions.plan_friendship_removed(*user_ids)
+    transaction.on_commit(lambda: suggestions.schedule(plan), robust=True)
+
+
+@receiver(friendships_created)
+def update_after_friendships_created(sender, pairs, **kwargs):
+    """
+    Сигнал для сброса кэша множеств друзей и обновления рекомендаций после создания нескольких дружб.
+
+    Как и в update_friend_suggestions, изменения рекомендаций записываются после фиксации транзакции.
+
+    :param sender: Модель Friendship.
+    :param pairs: Список пар id пользователей, ставших друзьями.
+    :param kwargs: Дополнительные аргументы, передаваемые сигналу.
+    """
+    user_ids = {user_id for pair in pairs for user_id in pair}
+    graph.invalidate(*user_ids)
+    transaction.on_commit(lambda: graph.invalidate(*user_ids))
+    plan = suggestions.plan_friendships_added(pairs)
+    transaction.on_commit(lambda: suggestions.schedule(plan), robust=True)
@@ -0,0 +1,258 @@
+"""
+Инкрементальное обновление рекомендаций друзей (FriendSuggestion).
+
+Обновление разделено на два шага. В транзакции изменения дружбы plan_* читает множества друзей
+пользователей (как их видит транзакция), ничего не записывая. После фиксации транзакции schedule
+считает по ним изменения рекомендаций и записывает их (см. friends.signals), поэтому O(число друзей)
+строк рекомендаций не пишутся, пока строки пользователей заблокированы. Изменения больше
+FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS строк (например, массовое принятие заявок пользователем с тысячами
+друзей) считаются и записываются в фоновом потоке процесса, чтобы не задерживать ответ на запрос.
+"""
+
+import logging
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .graph import load_adjacency
+from .models import FriendSuggestion
+
+# Изменения рекомендаций: deltas - словарь {(id пользователя, id кандидата): прибавка к mutual_count},
+# removed - множество пар, строки которых удаляются перед прибавкой
+SuggestionChanges = namedtuple("SuggestionChanges", ["deltas", "removed"])
+
+# План обновления рекомендаций: pairs - пары id пользователей, чья дружба изменилась, adjacency - множества
+# друзей этих пользователей до изменения, как их видела транзакция, created - создана ли дружба
+SuggestionPlan = namedtuple("SuggestionPlan", ["pairs", "adjacency", "created"])
+
+logger = logging.getLogger(__name__)
+
+# Один фоновый поток записывает изменения в порядке фиксации транзакций
+_executor = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def plan_friendships_added(pairs):
+    """
+    Запоминает множества друзей пользователей до создания дружб (одной или нескольких при массовом
+    принятии заявок) для расчета изменений рекомендаций.
+
+    Дружбы уже записаны в базу, поэтому новые дружбы убираются из прочитанных множеств.
+
+    :param pairs: Список пар id пользователей, ставших друзьями.
+    :return: SuggestionPlan для schedule.
+    """
+    adjacency = load_adjacency({user_id for pair in pairs for user_id in pair})
+    for first_id, second_id in pairs:
+        adjacency[first_id].discard(second_id)
+        adjacency[second_id].discard(first_id)
+    return SuggestionPlan(pairs, adjacency, True)
+
+
+def plan_friendship_removed(first_id, second_id):
+    """
+    Запоминает множества друзей пользователей, переставших быть друзьями, для расчета изменений рекомендаций.
+
+    :param first_id: id первого пользователя.
+    :param second_id: id второго пользователя.
+    :return: SuggestionPlan для schedule.
+    """
+    return SuggestionPlan([(first_id, second_id)], load_adjacency([first_id, second_id]), False)
+
+
+def changes(plan):
+    """
+    Считает изменения рекомендаций по плану plan_friendships_added или plan_friendship_removed.
+
+    :param plan: SuggestionPlan.
+    :return: SuggestionChanges для apply.
+    """
+    if plan.created:
+        return _friendships_added(plan.pairs, plan.adjacency)
+    return _friendship_removed(*plan.pairs[0], plan.adjacency)
+
+
+def _friendships_added(pairs, adjacency):
+    """
+    Каждый друг одного пользователя, не являющийся другом второго, получает одного общего друга
+    со вторым пользователем (и наоборот), а рекомендация самих пользователей друг другу удаляется.
+    Добавление дружб повторяется в памяти по одной, начиная с графа без новых дружб, поэтому
+    общий друг, ставший им в той же операции, считается один раз.
+    """
+    deltas, removed = Counter(), set()
+    for first_id, second_id in pairs:
+        first_friends, second_friends = adjacency[first_id], adjacency[second_id]
+        for user_id, candidate_ids in (
+            (second_id, first_friends - second_friends),
+            (first_id, second_friends - first_friends),
+        ):
+            for candidate_id in candidate_ids:
+                deltas[user_id, candidate_id] += 1
+                deltas[candidate_id, user_id] += 1
+        for pair in ((first_id, second_id), (second_id, first_id)):
+            deltas.pop(pair, None)
+            removed.add(pair)
+        first_friends.add(second_id)
+        second_friends.add(first_id)
+    return SuggestionChanges(deltas, removed)
+
+
+def _friendship_removed(first_id, second_id, adjacency):
+    """
+    Счетчики, добавленные дружбой, уменьшаются (рекомендации без общих друзей apply удаляет),
+    а сами пользователи рекомендуются друг другу, если у них остались общие друзья.
+    """
+    first_friends = adjacency[first_id]
+    second_friends = adjacency[second_id]
+
+    deltas = Counter()
+    for user_id, candidate_ids in (
+        (second_id, first_friends - second_friends),
+        (first_id, second_friends - first_friends),
+    ):
+        for candidate_id in candidate_ids:
+            deltas[user_id, candidate_id] -= 1
+            deltas[candidate_id, user_id] -= 1
+
+    removed = {(first_id, second_id), (second_id, first_id)}
+    mutual = len(first_friends & second_friends)
+    if mutual:
+        deltas[first_id, second_id] = deltas[second_id, first_id] = mutual
+    return SuggestionChanges(deltas, removed)
+
+
+def apply(changes):
+    """
+    Записывает изменения рекомендаций, посчитанные changes.
+
+    Вызывается после фиксации транзакции изменения дружбы (см. schedule). В одной транзакции удаляются строки пар
+    из removed, к счетчикам прибавляются deltas (INSERT ... ON CONFLICT DO UPDATE, PostgreSQL и SQLite,
+    поэтому параллельные изменения тех же рекомендаций не теряются) и удаляются рекомендации,
+    у которых не осталось общих друзей. Каждый шаг - один executemany по всем строкам: psycopg 3
+    отправляет строки конвейером (pipeline), SQLite выполняет один подготовленный запрос, поэтому
+    число обращений к базе не зависит от числа измененных рекомендаций.
+
+    :param changes: SuggestionChanges.
+    """
+    deltas, removed = changes
+    deltas = [(pair, delta) for pair, delta in deltas.items() if delta]
+    if not deltas and not removed:
+        return
+    meta = FriendSuggestion._meta
+    table = connection.ops.quote_name(meta.db_table)
+    user, candidate, mutual_count, updated_at = (
+        connection.ops.quote_name(meta.get_field(name).column)
+        for name in ("user", "candidate", "mutual_count", "updated_at")
+    )
+    delete = f"DELETE FROM {table} WHERE {user} = %s AND {candidate} = %s"
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    decremented = [pair for pair, delta in deltas if delta < 0]
+    with transaction.atomic(), connection.cursor() as cursor:
+        if removed:
+            cursor.executemany(delete, list(removed))
+        if deltas:
+            cursor.executemany(
+                f"INSERT INTO {table} ({user}, {candidate}, {mutual_count}, {updated_at}) VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT ({user}, {candidate}) DO UPDATE SET "
+                f"{mutual_count} = {table}.{mutual_count} + EXCLUDED.{mutual_count}, "
+                f"{updated_at} = EXCLUDED.{updated_at}",
+                [(user_id, candidate_id, delta, now) for (user_id, candidate_id), delta in deltas],
+            )
+        if decremented:
+            cursor.executemany(f"{delete} AND {mutual_count} <= 0", decremented)
+
+
+def schedule(plan):
+    """
+    Считает и записывает изменения рекомендаций по плану после фиксации транзакции: небольшие - сразу,
+    в потоке запроса, а больше FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS строк - в фоновом потоке.
+
+    Число строк оценивается сверху по размерам множеств друзей, не считая самих изменений: на самом
+    большом графе бюджетов расчет ~480 тысяч изменений занимает столько же, сколько остальной запрос.
+    Пока в фоновом потоке есть незаписанные изменения, новые изменения тоже уходят в него:
+    уменьшение счетчика не должно обогнать его увеличение, записанное раньше. Фоновые изменения
+    теряются при остановке процесса, расхождение исправляет команда rebuild_suggestions.
+
+    :param plan: SuggestionPlan.
+    """
+    global _pending
+    rows = sum(
+        2 * (len(plan.adjacency[first_id]) + len(plan.adjacency[second_id]) + 1) for first_id, second_id in plan.pairs
+    )
+    with _lock:
+        deferred = _pending > 0 or rows > settings.FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS
+        if deferred:
+            _pending += 1
+    if not deferred:
+        apply(changes(plan))
+        return
+    try:
+        _get_executor().submit(_apply_in_background, plan)
+    except BaseException:
+        with _lock:
+            _pending -= 1
+        raise
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="friend-suggestions")
+        return _executor
+
+
+def _apply_in_background(plan):
+    global _pending
+    try:
+        apply(changes(plan))
+    except Exception:
+        logger.exception("Не удалось записать изменения рекомендаций друзей, исправляет rebuild_suggestions")
+    finally:
+        connection.close()
+        with _lock:
+            _pending -= 1
+
+
+def flush():
+    """
+    Ждет, пока фоновый поток запишет все изменения рекомендаций, переданные ему до вызова.
+    """
+    with _lock:
+        executor = _executor
+    if executor is not None:
+        executor.submit(lambda: None).result()
+
+
+def rebuild(user_ids):
+    """
+    Полностью пересчитывает рекомендации для группы пользователей.
+
+    Загружает друзей пользователей группы и друзей их друзей двумя проходами
+    по таблице Friendship, считает общих друзей в памяти и заменяет строки
+    рекомендаций группы.
+
+    :param user_ids: Список id пользователей.
+    :return: Количество созданных рекомендаций.
+    """
+    adjacency = load_adjacency(user_ids)
+    second_hop = load_adjacency(set().union(*adjacency.values()))
+    suggestions = []
+    for user_id, friends in adjacency.items():
+        counts = {}
+        for friend_id in friends:
+            for candidate_id in second_hop[friend_id]:
+                if candidate_id != user_id and candidate_id not in friends:
+                    counts[candidate_id] = counts.get(candidate_id, 0) + 1
+        suggestions += [
+            FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_count=count)
+            for candidate_id, count in counts.items()
+        ]
+    FriendSuggestion.objects.filter(user_id__in=user_ids).delete()
+    FriendSuggestion.objects.bulk_create(suggestions, batch_size=5000)
+    return len(suggestions)
@@ -1,7 +1,58 @@
+import asyncio
+import csv
+import json
+import os
+import pstats
+import random
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ContextDecorator
+from io import StringIO
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
 import pytest
-from friends.serializers import UserSerializer
+from asgiref.sync import async_to_sync, sync_to_async
+from friends import (
+    authentication,
+    events,
+    graph,
+    hashing,
+    metrics,
+    profiling,
+    response_cache,
+    routers,
+    services,
+    suggestions,
+)
+from friends.middleware import ReadYourWritesMiddleware, _client_key
+from friends.models import Friendship, FriendRequest, FriendSuggestion, UserStats
+from friends.pagination import FriendRequestCursorPagination, FriendshipCursorPagination
+from friends.routers import ReplicaRouter
+from friends.renderers import ORJSONRenderer
+from friends.serializers import (
+    AllUsersSerializer,
+    FriendRequestSerializer,
+    FriendRequestValuesSerializer,
+    FriendshipSerializer,
+    FriendshipValuesSerializer,
+    UsernameValuesSerializer,
+    UserSerializer,
+)
+from friends.views import prefix_upper_bound
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from rest_framework.authtoken.models import Token
 
 User = get_user_model()
@@ -10,6 +61,23 @@ User = get_user_model()
 # Create your tests here.
 
 
+@pytest.fixture(autouse=True)
+def reset_friend_graph_cache():
+    """
+    Фикстура для сброса кэша множеств друзей, кэша токенов и кэша Django между тестами.
+
+    База откатывается после каждого теста, и id пользователей могут повторяться,
+    поэтому кэш из предыдущего теста не должен пережить откат.
+    """
+    graph.reset_backend(setting="FRIENDS_GRAPH_CACHE")
+    authentication.reset_cache(setting="FRIENDS_TOKEN_CACHE")
+    cache.clear()
+    yield
+    graph.reset_backend(setting="FRIENDS_GRAPH_CACHE")
+    authentication.reset_cache(setting="FRIENDS_TOKEN_CACHE")
+    cache.clear()
+
+
 @pytest.fixture
 def user_data():
     """
@@ -136,6 +204,42 @@ def test_register_user(api_client):
     assert "testuser2" == profile.data.get("username")
 
 
+@pytest.mark.django_db
+def test_register_user_hashing_pool_saturated(api_client, settings):
+    """
+    Тест проверяет, что при занятом пуле хэширования регистрация отклоняется с 429.
+
+    Шаги:
+        1. Единственный исполнитель пула без очереди занимается долгой задачей.
+        2. Проверка, что регистрация получает 429 с Retry-After и пользователь не создан.
+        3. После освобождения пула регистрация проходит, пароль проверяется.
+    """
+    settings.FRIENDS_PASSWORD_HASHING = {"WORKERS": 1, "MAX_PENDING": 0, "TIMEOUT": 5, "RETRY_AFTER": 3}
+    pool = hashing.get_pool()
+    started, release = threading.Event(), threading.Event()
+
+    def busy():
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=pool.submit, args=(busy,))
+    worker.start()
+    started.wait(5)
+    params = {"username": "spiky", "email": "spiky@example.com", "password": "newpassword123"}
+    try:
+        response = api_client.post("/register/", data=params)
+    finally:
+        release.set()
+        worker.join()
+
+    assert response.status_code == 429
+    assert response["Retry-After"] == "3"
+    assert not User.objects.filter(username="spiky").exists()
+
+    assert api_client.post("/register/", data=params).status_code == 201
+    assert User.objects.get(username="spiky").check_password("newpassword123")
+
+
 def test_all_users(api_client, create_user, create_second_user):
     """
     Тест проверяет, что отображается список всех пользователей.
@@ -150,8 +254,56 @@ def test_all_users(api_client, create_user, create_second_user):
     response = api_client.get("/all_users/")
 
     assert response.status_code == 200
-    assert isinstance(response.data, list)
-    assert len(response.data) > 0
+    assert isinstance(response.data["results"], list)
+    assert len(response.data["results"]) > 0
+
+
+@pytest.mark.django_db
+def test_all_users_cursor_pagination(api_client):
+    """
+    Тест проверяет курсорную пагинацию и фильтр по префиксу в списке пользователей.
+
+    Шаги:
+        1. Создание пользователей и логин под одним из них.
+        2. Обход всех страниц по курсору next.
+        3. Проверка, что пользователи идут по порядку без повторов, а текущий пользователь исключен.
+        4. Проверка фильтра по префиксу имени: с учетом регистра и без имен за границей префикса.
+    """
+    others = [User(username=name) for name in ("other", "USER09", "user1")]
+    User.objects.bulk_create([User(username=f"user{i:02d}") for i in range(7)] + others)
+    viewer = User.objects.get(username="user03")
+    api_client.force_authenticate(viewer)
+
+    usernames = []
+    url = "/all_users/?page_size=3"
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert len(response.data["results"]) <= 3
+        usernames += [user["username"] for user in response.data["results"]]
+        url = response.data["next"]
+
+    assert usernames == ["USER09", "other", "user00", "user01", "user02", "user04", "user05", "user06", "user1"]
+
+    response = api_client.get("/all_users/", {"prefix": "user0"})
+    assert [user["username"] for user in response.data["results"]] == [
+        "user00",
+        "user01",
+        "user02",
+        "user04",
+        "user05",
+        "user06",
+    ]
+
+
+def test_prefix_upper_bound():
+    """
+    Тест проверяет верхнюю границу диапазона имен с заданным префиксом.
+    """
+    assert prefix_upper_bound("user0") == "user1"
+    assert prefix_upper_bound("az") == "a{"
+    assert prefix_upper_bound("a" + chr(sys.maxunicode)) == "b"
+    assert prefix_upper_bound(chr(sys.maxunicode)) is None
 
 
 def test_send_friend_request_to(api_client, create_user, create_second_user):
@@ -379,3 +531,1541 @@ def test_no_token_on_user_update(user_data):
 
     assert Token.objects.count() == 1, "There should still be only one token for the user"
     assert Token.objects.get(user=user) == old_token, "The token should remain the same after user update"
+
+
+def test_friendship_is_stored_once(create_user, create_second_user):
+    """
+    Тест проверяет, что дружба хранится одной строкой независимо от порядка пользователей.
+
+    Шаги:
+        1. Добавление пользователей в друзья в обратном порядке.
+        2. Проверка, что создана одна строка с упорядоченной парой.
+        3. Проверка, что удаление работает с любой стороны.
+    """
+    assert Friendship.make_friends(create_second_user, create_user)
+    assert not Friendship.make_friends(create_user, create_second_user)
+
+    friendship = Friendship.objects.get()
+    assert friendship.user_low_id < friendship.user_high_id
+    assert Friendship.are_friends(create_user, create_second_user)
+    assert list(Friendship.friends_of(create_user)) == [create_second_user]
+
+    assert Friendship.lose_friend(create_user, create_second_user)
+    assert not Friendship.are_friends(create_second_user, create_user)
+    assert not Friendship.lose_friend(create_second_user, create_user)
+
+
+def _seed_profile_graph(user, prefix, friends, sent, received):
+    """
+    Создает для пользователя указанное количество друзей, исходящих и входящих заявок.
+    """
+    others = User.objects.bulk_create([User(username=f"{prefix}{i}") for i in range(friends + sent + received)])
+    friend_users, sent_users, received_users = others[:friends], others[friends:-received], others[-received:]
+    Friendship.objects.bulk_create(
+        [Friendship(user_low_id=min(user.pk, o.pk), user_high_id=max(user.pk, o.pk)) for o in friend_users]
+    )
+    requests = [FriendRequest(from_user=user, to_user=o) for o in sent_users]
+    requests += [FriendRequest(from_user=o, to_user=user) for o in received_users]
+    FriendRequest.objects.bulk_create(requests)
+    UserStats.recompute([user.pk])
+
+
+def _profile_queries(api_client, user):
+    """
+    Запрашивает профиль пользователя и возвращает ответ и число выполненных SQL-запросов.
+    """
+    api_client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get("/accounts/profile/")
+    assert response.status_code == 200
+    return response, len(queries)
+
+
+@pytest.mark.django_db
+def test_profile_query_count_is_constant(api_client):
+    """
+    Тест проверяет, что число SQL-запросов профиля не растет с количеством друзей и заявок.
+
+    Шаги:
+        1. Получение профиля пользователя с небольшим графом.
+        2. Получение профиля пользователя с тысячами друзей и заявок.
+        3. Проверка, что число запросов одинаково и ответ полный.
+    """
+    small = User.objects.create(username="small")
+    _seed_profile_graph(small, "s", friends=2, sent=2, received=2)
+    big = User.objects.create(username="big")
+    _seed_profile_graph(big, "b", friends=2000, sent=1000, received=1000)
+
+    _, small_queries = _profile_queries(api_client, small)
+    response, big_queries = _profile_queries(api_client, big)
+
+    # Четыре запроса профиля и чтение версии данных пользователя для ETag
+    assert small_queries == big_queries == 5
+    assert len(response.data["friends"]) == 2000
+    assert len(response.data["friend_requests_sent"]) == 1000
+    assert response.data["friend_requests_received"][0]["to_user"] == "big"
+    assert response.data["token"] == Token.objects.get(user=big).key
+
+
+@pytest.mark.django_db
+def test_profile_conditional_get(api_client, create_user, create_second_user, settings):
+    """
+    Тест условных запросов профиля и списков по ETag и Last-Modified.
+
+    Шаги:
+        1. Повторный запрос с If-None-Match получает 304 одним запросом к базе.
+        2. Другой режим профиля имеет другой ETag.
+        3. Заявка от другого пользователя меняет ETag профиля и списка входящих заявок.
+        4. Замена токена меняет ETag профиля, и профиль отдает новый токен.
+    """
+    settings.FRIENDS_RESPONSE_CACHE = {"TIMEOUT": 0}
+    api_client.force_authenticate(create_user)
+    response = api_client.get("/accounts/profile/")
+    etag = response["ETag"]
+    assert response.status_code == 200
+    assert response.has_header("Last-Modified")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get("/accounts/profile/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert len(queries) == 1
+    assert api_client.get("/accounts/profile/?mode=summary", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    incoming = api_client.get("/friend_requests/incoming/")
+    assert api_client.get("/friend_requests/incoming/", HTTP_IF_NONE_MATCH=incoming["ETag"]).status_code == 304
+
+    api_client.force_authenticate(create_second_user)
+    api_client.post("/send_request_to/", data={"username": "testuser"})
+
+    api_client.force_authenticate(create_user)
+    response = api_client.get("/accounts/profile/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert response.data["friend_requests_received"][0]["from_user"] == "testuser2"
+    assert api_client.get("/friend_requests/incoming/", HTTP_IF_NONE_MATCH=incoming["ETag"]).status_code == 200
+
+    etag = response["ETag"]
+    Token.objects.filter(user=create_user).delete()
+    token = Token.objects.create(user=create_user)
+    response = api_client.get("/accounts/profile/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data["token"] == token.key
+
+
+@pytest.mark.django_db
+def test_profile_response_cache(api_client, create_user, create_second_user):
+    """
+    Тест кэша готовых ответов профиля и списков.
+
+    Шаги:
+        1. Повторный запрос профиля и условный запрос отдаются из кэша после чтения одной версии данных.
+        2. Заявка сбрасывает закэшированные ответы и отправителя, и получателя.
+        3. Смена версии в базе в обход сигналов (как в другом процессе) тоже сбрасывает ответы.
+        4. Замена токена сбрасывает закэшированный профиль со старым токеном.
+        5. Одновременные промахи по одному ключу вычисляют ответ один раз.
+    """
+    api_client.force_authenticate(create_user)
+    first = api_client.get("/accounts/profile/")
+    with CaptureQueriesContext(connection) as queries:
+        cached = api_client.get("/accounts/profile/")
+        not_modified = api_client.get("/accounts/profile/", HTTP_IF_NONE_MATCH=first["ETag"])
+    assert len(queries) == 2
+    assert all(UserStats._meta.db_table in query["sql"] for query in queries)
+    assert cached.status_code == 200
+    assert cached.content == first.content
+    assert cached["ETag"] == first["ETag"]
+    assert not_modified.status_code == 304
+    api_client.force_authenticate(create_second_user)
+    assert api_client.get("/friend_requests/outgoing/").data["results"] == []
+
+    api_client.post("/send_request_to/", data={"username": "testuser"})
+    assert api_client.get("/friend_requests/outgoing/").data["results"][0]["to_user"] == "testuser"
+    api_client.force_authenticate(create_user)
+    assert api_client.get("/accounts/profile/").data["friend_requests_received"][0]["from_user"] == "testuser2"
+    assert response_cache.stats()["hits"] >= 2
+
+    Friendship.objects.create(user_low=create_user, user_high=create_second_user)
+    UserStats.objects.filter(user=create_user).update(version=F("version") + 1)
+    assert api_client.get("/accounts/profile/").data["friends"][0]["username"] == "testuser2"
+
+    assert api_client.get("/accounts/profile/").data["token"] == Token.objects.get(user=create_user).key
+    Token.objects.filter(user=create_user).delete()
+    token = Token.objects.create(user=create_user)
+    assert api_client.get("/accounts/profile/").data["token"] == token.key
+
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def slow_compute():
+        calls.append("slow")
+        started.set()
+        release.wait(0.2)
+        return "computed", ("body", "application/json", None, None)
+
+    def unexpected_compute():
+        calls.append("unexpected")
+        return "computed", None
+
+    worker = threading.Thread(target=response_cache.get_or_compute, args=("single-flight", slow_compute))
+    worker.start()
+    started.wait(5)
+    result, entry = response_cache.get_or_compute("single-flight", unexpected_compute)
+    worker.join()
+    assert calls == ["slow"]
+    assert result is None
+    assert entry[0] == "body"
+
+
+def _walk_pages(api_client, url):
+    """
+    Обходит все страницы курсорного списка и возвращает элементы всех страниц.
+    """
+    results = []
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        results += response.data["results"]
+        url = response.data["next"]
+    return results
+
+
+@pytest.mark.django_db
+def test_friend_and_request_sub_resources(api_client):
+    """
+    Тест проверяет постраничные списки друзей, входящих и исходящих заявок.
+
+    Шаги:
+        1. Создание пользователя с друзьями и заявками.
+        2. Обход всех страниц каждого списка.
+        3. Проверка, что все элементы получены без повторов.
+    """
+    user = User.objects.create(username="owner")
+    _seed_profile_graph(user, "p", friends=7, sent=5, received=4)
+    api_client.force_authenticate(user)
+
+    friends = _walk_pages(api_client, "/friends/?page_size=3")
+    assert sorted(friend["username"] for friend in friends) == sorted(f"p{i}" for i in range(7))
+    assert all("created_at" in friend for friend in friends)
+
+    outgoing = _walk_pages(api_client, "/friend_requests/outgoing/?page_size=2")
+    assert sorted(request["to_user"] for request in outgoing) == sorted(f"p{i}" for i in range(7, 12))
+
+    incoming = _walk_pages(api_client, "/friend_requests/incoming/?page_size=2")
+    assert sorted(request["from_user"] for request in incoming) == sorted(f"p{i}" for i in range(12, 16))
+
+
+@pytest.mark.django_db
+def test_values_serializers_match_model_serializers():
+    """
+    Тест проверяет, что легкие сериализаторы и рендерер orjson выдают те же байты, что и ModelSerializer.
+
+    Шаги:
+        1. Создание пользователя с друзьями и заявками, в том числе с именем вне ASCII.
+        2. Сериализация одних и тех же строк ModelSerializer и легким сериализатором.
+        3. Сравнение JSON, отрисованного JSONRenderer и ORJSONRenderer.
+    """
+    user = User.objects.create(username="owner")
+    _seed_profile_graph(user, "p", friends=3, sent=2, received=2)
+    User.objects.create(username="пользователь\u2028")
+
+    requests = FriendRequest.objects.select_related("from_user", "to_user").order_by("-timestamp")
+    friendships = Friendship.friendships_of(user).order_by("-created_at")
+    users = User.objects.order_by("username")
+    pairs = (
+        (FriendRequestSerializer(requests, many=True), FriendRequestValuesSerializer, requests, None),
+        (
+            FriendshipSerializer(friendships, many=True, context={"user": user}),
+            FriendshipValuesSerializer,
+            friendships,
+            {"user": user},
+        ),
+        (AllUsersSerializer(users, many=True), UsernameValuesSerializer, users, None),
+    )
+    for expected, serializer_class, queryset, context in pairs:
+        fast = serializer_class(serializer_class.values(queryset), context=context).data
+        assert JSONRenderer().render(fast) == JSONRenderer().render(expected.data)
+        assert ORJSONRenderer().render({"results": fast}) == JSONRenderer().render({"results": expected.data})
+
+
+@pytest.mark.django_db
+def test_profile_summary_mode(api_client, monkeypatch):
+    """
+    Тест проверяет краткий режим профиля: размеры списков и их первые страницы.
+
+    Шаги:
+        1. Создание пользователя с друзьями и заявками.
+        2. Получение профиля с mode=summary, курсором и размером страницы списка друзей.
+        3. Проверка размеров списков, первых страниц размера по умолчанию и ссылок на продолжение.
+    """
+    for pagination_class in (FriendshipCursorPagination, FriendRequestCursorPagination):
+        monkeypatch.setattr(pagination_class, "page_size", 2)
+    user = User.objects.create(username="owner")
+    _seed_profile_graph(user, "p", friends=5, sent=1, received=3)
+    api_client.force_authenticate(user)
+    cursor = parse_qs(urlparse(api_client.get("/friends/", {"page_size": 1}).data["next"]).query)["cursor"][0]
+
+    response = api_client.get("/accounts/profile/", {"mode": "summary", "page_size": 4, "cursor": cursor})
+
+    assert response.status_code == 200
+    assert response.data["username"] == "owner"
+    assert response.data["friends"]["count"] == 5
+    assert response.data["friends"]["results"] == api_client.get("/friends/").data["results"]
+    assert "/friends/?cursor=" in response.data["friends"]["next"]
+    assert response.data["friend_requests_sent"]["count"] == 1
+    assert response.data["friend_requests_sent"]["next"] is None
+    assert response.data["friend_requests_received"]["count"] == 3
+    assert len(response.data["friend_requests_received"]["results"]) == 2
+
+    rest = _walk_pages(api_client, response.data["friends"]["next"])
+    seen = response.data["friends"]["results"] + rest
+    assert sorted(friend["username"] for friend in seen) == sorted(f"p{i}" for i in range(5))
+
+
+@pytest.mark.django_db
+def test_async_views():
+    """
+    Тест асинхронных представлений профиля, списков и заявок в друзья.
+
+    Шаги:
+        1. Запрос без токена получает 401.
+        2. Отправка и принятие заявок через асинхронные представления.
+        3. Проверка краткого профиля и обхода списков друзей и пользователей по курсорам.
+    """
+    owner = User.objects.create_user("owner", "owner@example.com", "password123")
+    friends = [User.objects.create_user(f"f{i}", f"f{i}@example.com", "password123") for i in range(3)]
+    client = AsyncClient()
+
+    def call(method, path, user=None, **data):
+        headers = {"Authorization": f"Token {Token.objects.get(user=user).key}"} if user else {}
+        return async_to_sync(getattr(client, method))(path, data, headers=headers)
+
+    assert call("get", "/async/accounts/profile/").status_code == 401
+    for friend in friends:
+        assert call("post", "/async/send_request_to/", owner, username=friend.username).status_code == 201
+        assert call("post", "/async/accept_request_from/", friend, username="owner").status_code == 201
+    assert call("post", "/async/send_request_to/", owner, username="f0").status_code == 400
+    assert call("post", "/async/send_request_to/", owner, username="missing").status_code == 404
+    assert call("post", "/async/delete_friend/", owner, username="f2").status_code == 201
+    assert call("post", "/async/send_request_to/", friends[2], username="owner").status_code == 201
+
+    # Параметры пагинации запроса профиля не относятся к встроенным спискам
+    response = call("get", "/async/accounts/profile/", owner, page_size=1, cursor="broken")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["username"] == "owner"
+    assert data["friends"]["count"] == 2
+    assert len(data["friends"]["results"]) == 2
+    assert data["friends"]["next"] is None
+    assert data["friend_requests_received"]["count"] == 1
+    assert data["friend_requests_received"]["results"][0]["from_user"] == "f2"
+    assert data["friend_requests_received"]["next"] is None
+
+    page = call("get", "/async/friends/", owner, page_size=1).json()
+    assert len(page["results"]) == 1
+    assert "/async/friends/?" in page["next"] and "cursor=" in page["next"]
+    seen = page["results"]
+    next_link = page["next"]
+    while next_link:
+        page = call("get", next_link.replace("http://testserver", ""), owner).json()
+        seen += page["results"]
+        next_link = page["next"]
+    assert sorted(friend["username"] for friend in seen) == ["f0", "f1"]
+    assert call("get", "/async/friends/", owner, cursor="broken").status_code == 404
+
+    User.objects.create_user("F9", "F9@example.com", "password123")
+    page = call("get", "/async/all_users/", owner, page_size=2).json()
+    seen = [row["username"] for row in page["results"]]
+    assert "/async/all_users/?" in page["next"]
+    page = call("get", page["next"].replace("http://testserver", ""), owner).json()
+    assert seen + [row["username"] for row in page["results"]] == ["F9", "f0", "f1", "f2"]
+    assert page["next"] is None
+    page = call("get", "/async/all_users/", friends[0], prefix="f").json()
+    assert [row["username"] for row in page["results"]] == ["f1", "f2"]
+    assert call("get", "/async/all_users/", owner, cursor="broken").status_code == 404
+    assert call("get", "/async/all_users/").status_code == 401
+
+
+def _sse(chunk):
+    """
+    Разбирает сообщение text/event-stream в словарь полей (комментарий - поле с пустым именем).
+    """
+    return dict(line.split(": ", 1) for line in chunk.decode().strip().split("\n"))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("backend", ["friends.events.LocalEventBus", "friends.events.DjangoCacheEventBus"])
+def test_event_stream(settings, django_capture_on_commit_callbacks, backend):
+    """
+    Тест проверяет поток Server-Sent Events с событиями заявок и друзей.
+
+    Шаги:
+        1. Операции с заявками и друзьями публикуют события после фиксации транзакции, откат - не публикует.
+        2. Повтор пропущенных событий по Last-Event-ID и resync, если они уже вытеснены из истории.
+        3. Доставка нового события открытому потоку и heartbeat без событий.
+    """
+    options = {"history": 3, "poll_interval": 0.01} if "Cache" in backend else {"history": 3}
+    settings.FRIENDS_EVENT_BUS = {"BACKEND": backend, "OPTIONS": options}
+    settings.FRIENDS_EVENT_STREAM = {"HEARTBEAT": 0.05, "RETRY_MS": 1000}
+    alice, bob, carol = (User.objects.create_user(name, f"{name}@example.com", "password123") for name in "abc")
+
+    def act(operation, *args):
+        with django_capture_on_commit_callbacks(execute=True):
+            return operation(*args)
+
+    act(services.send_request, alice, bob)
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(RuntimeError), transaction.atomic():
+            services.send_request(carol, bob)
+            raise RuntimeError
+    act(services.accept_request, bob, alice)
+    act(services.delete_friend, alice, bob)
+    act(services.send_request, carol, bob)
+    act(services.reject_request, bob, carol)
+    act(services.bulk_send_requests, alice, ["b", "c"])
+
+    client = AsyncClient()
+    headers = {"Authorization": f"Token {Token.objects.get(user=bob).key}"}
+
+    async def next_event(stream):
+        while True:
+            fields = _sse(await anext(stream))
+            if "" not in fields:
+                return fields
+
+    async def scenario():
+        assert (await client.get("/async/events/")).status_code == 401
+        assert (await client.get("/async/events/", headers={**headers, "Last-Event-ID": "x"})).status_code == 400
+
+        response = await client.get("/async/events/", headers={**headers, "Last-Event-ID": "1"})
+        assert response["Content-Type"] == "text/event-stream"
+        stream = aiter(response.streaming_content)
+        assert _sse(await anext(stream)) == {"retry": "1000"}
+        replayed = [await next_event(stream) for _ in range(3)]
+        assert [(event["id"], event["event"]) for event in replayed] == [
+            ("2", events.FRIEND_REMOVED),
+            ("3", events.FRIEND_REQUEST_RECEIVED),
+            ("4", events.FRIEND_REQUEST_RECEIVED),
+        ]
+        assert [json.loads(event["data"])["username"] for event in replayed] == ["a", "c", "a"]
+
+        pending = asyncio.ensure_future(next_event(stream))
+        await sync_to_async(act)(services.send_request, carol, bob)
+        event = await pending
+        assert (event["id"], event["event"], json.loads(event["data"])["username"]) == (
+            "5",
+            events.FRIEND_REQUEST_RECEIVED,
+            "c",
+        )
+        await sync_to_async(act)(services.delete_friend, carol, bob)
+        assert _sse(await anext(stream)) == {"": "heartbeat"}
+        await stream.aclose()
+
+        response = await client.get("/async/events/", headers=headers, data={"last_event_id": "0"})
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        assert await next_event(stream) == {"id": "5", "event": events.RESYNC, "data": "{}"}
+        await stream.aclose()
+
+    async_to_sync(scenario)()
+    assert async_to_sync(events.get_bus().last_id)(alice.pk) == 1
+    assert async_to_sync(events.get_bus().last_id)(carol.pk) == 2
+
+
+@pytest.mark.parametrize("bus", [events.LocalEventBus(history=0), events.DjangoCacheEventBus(history=0)])
+def test_event_bus_without_history(bus):
+    """
+    Тест проверяет шину событий без истории (history=0).
+
+    Шаги:
+        1. Публикация двух событий пользователю.
+        2. Переподключение с Last-Event-ID пропущенного события - resync, как для вытесненного события.
+        3. Переподключение с Last-Event-ID последнего события - новых событий нет.
+    """
+    user_id = 10**9
+    bus.publish(user_id, events.FRIEND_REQUEST_RECEIVED, {})
+    bus.publish(user_id, events.FRIEND_REMOVED, {})
+    listen = async_to_sync(bus.listen)
+    assert listen(user_id, 1, 0) == [events.Event(2, events.RESYNC, {})]
+    assert listen(user_id, 2, 0) == []
+
+
+def test_replica_router_read_your_writes(settings):
+    """
+    Тест маршрутизации чтений на реплику и закрепления клиента за основной базой после записи.
+
+    Шаги:
+        1. Чтение идет в реплику, после записи в том же контексте - в основную базу.
+        2. После POST клиента его чтения идут в основную базу, чтения другого клиента - в реплику.
+        3. После истечения закрепления чтения клиента снова идут в реплику.
+        4. Все чтения одного запроса идут в одну реплику.
+    """
+    settings.FRIENDS_DB_REPLICAS = ["replica_0"]
+    router = ReplicaRouter()
+    pinned_before = routers.is_pinned()
+    with routers.request_scope():
+        assert router.db_for_read(User) == "replica_0"
+        assert router.db_for_write(User) == "default"
+        assert router.db_for_read(User) == "default"
+    assert routers.is_pinned() == pinned_before
+    with routers.use_primary():
+        assert router.db_for_read(User) == "default"
+    assert router.allow_migrate("replica_0", "friends") is False
+    assert router.allow_migrate("default", "friends") is True
+
+    def view(request):
+        return HttpResponse(router.db_for_read(User))
+
+    middleware = ReadYourWritesMiddleware(view)
+    factory = RequestFactory()
+    alice = {"HTTP_AUTHORIZATION": "Token alice-token"}
+    bob = {"HTTP_AUTHORIZATION": "Token bob-token"}
+    assert middleware(factory.get("/friends/", **alice)).content == b"replica_0"
+    assert middleware(factory.post("/send_request_to/", **alice)).content == b"default"
+    assert middleware(factory.get("/friends/", **alice)).content == b"default"
+    assert middleware(factory.get("/friends/", **bob)).content == b"replica_0"
+    cache.delete(_client_key(factory.get("/", **alice)))
+    assert middleware(factory.get("/friends/", **alice)).content == b"replica_0"
+
+    settings.FRIENDS_DB_REPLICAS = [f"replica_{number}" for number in range(8)]
+    chosen = set()
+    for _ in range(20):
+        with routers.request_scope():
+            aliases = {router.db_for_read(model) for model in (User, UserStats, Friendship) for _ in range(5)}
+        assert len(aliases) == 1
+        chosen |= aliases
+    assert len(chosen) > 1
+
+
+def test_user_stats_follow_friend_actions(api_client, create_user, create_second_user):
+    """
+    Тест проверяет, что счетчики UserStats обновляются при отправке, принятии и удалении.
+
+    Шаги:
+        1. Отправка заявки, проверка счетчиков заявок.
+        2. Принятие заявки, проверка счетчиков друзей.
+        3. Удаление из друзей, проверка обнуления счетчиков.
+    """
+    api_client.force_authenticate(create_user)
+    api_client.post("/send_request_to/", data={"username": "testuser2"})
+    assert UserStats.for_user(create_user).friend_requests_sent_count == 1
+    assert UserStats.for_user(create_second_user).friend_requests_received_count == 1
+
+    api_client.force_authenticate(create_second_user)
+    api_client.post("/accept_request_from/", data={"username": "testuser"})
+    for user in (create_user, create_second_user):
+        stats = UserStats.for_user(user)
+        assert stats.friends_count == 1
+        assert stats.friend_requests_sent_count == stats.friend_requests_received_count == 0
+
+    api_client.post("/delete_friend/", data={"username": "testuser"})
+    assert UserStats.for_user(create_user).friends_count == 0
+    assert UserStats.for_user(create_second_user).friends_count == 0
+
+
+@pytest.mark.django_db
+def test_recompute_user_stats_repairs_drift():
+    """
+    Тест проверяет, что команда recompute_user_stats исправляет расхождения и создает недостающие строки.
+
+    Шаги:
+        1. Создание графа в обход моделей и порча счетчиков.
+        2. Запуск команды пересчета.
+        3. Проверка фактических значений счетчиков.
+    """
+    user = User.objects.create(username="owner")
+    _seed_profile_graph(user, "p", friends=3, sent=2, received=1)
+    UserStats.objects.filter(user=user).update(friends_count=42)
+
+    call_command("recompute_user_stats", batch_size=2, stdout=StringIO())
+
+    stats = UserStats.objects.get(user=user)
+    assert (stats.friends_count, stats.friend_requests_sent_count, stats.friend_requests_received_count) == (3, 2, 1)
+    assert UserStats.objects.count() == User.objects.count()
+    assert UserStats.objects.get(user__username="p0").friends_count == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("hot_degree", [10**9, 1], ids=["sql", "adjacency-cache"])
+def test_mutual_friends(api_client, settings, hot_degree):
+    """
+    Тест проверяет список и количество общих друзей через SQL-запрос и через кэш множеств друзей.
+
+    Шаги:
+        1. Создание двух пользователей с частично общими друзьями.
+        2. Проверка количества и списка общих друзей.
+        3. Удаление одного общего друга и проверка, что результат обновился.
+    """
+    settings.FRIENDS_HOT_USER_DEGREE = hot_degree
+    settings.FRIENDS_GRAPH_CACHE = {"BACKEND": "friends.graph.LocalAdjacencyBackend"}
+    alice, bob, *others = User.objects.bulk_create([User(username=f"m{i}") for i in range(8)])
+    for other in others[:5]:
+        Friendship.make_friends(alice, other)
+    for other in others[2:]:
+        Friendship.make_friends(bob, other)
+    api_client.force_authenticate(alice)
+
+    response = api_client.get("/users/m1/mutual_friends/", {"count_only": "true"})
+    assert response.data == {"count": 3}
+    response = api_client.get("/users/m1/mutual_friends/")
+    assert [user["username"] for user in response.data["results"]] == ["m4", "m5", "m6"]
+
+    Friendship.lose_friend(bob, others[2])
+    response = api_client.get("/users/m1/mutual_friends/", {"count_only": "1"})
+    assert response.data == {"count": 2}
+    assert (graph.stats()["misses"] > 0) == (hot_degree == 1)
+    assert api_client.get("/users/m0/mutual_friends/").status_code == 400
+
+
+def _suggestion_rows():
+    """
+    Возвращает множество (user_id, candidate_id, mutual_count) всех рекомендаций.
+    """
+    return set(FriendSuggestion.objects.values_list("user_id", "candidate_id", "mutual_count"))
+
+
+@pytest.mark.django_db
+def test_incremental_suggestions_match_rebuild(django_capture_on_commit_callbacks):
+    """
+    Тест проверяет, что инкрементальное обновление рекомендаций совпадает с полной перестройкой.
+
+    Шаги:
+        1. Случайные добавления и удаления дружб между пользователями.
+        2. Сохранение инкрементально поддерживаемых рекомендаций.
+        3. Полная перестройка командой rebuild_suggestions и сравнение результатов.
+    """
+    rng = random.Random(7)
+    users = User.objects.bulk_create([User(username=f"g{i}") for i in range(12)])
+    for _ in range(60):
+        first, second = rng.sample(users, 2)
+        # Рекомендации обновляются после фиксации каждой транзакции
+        with django_capture_on_commit_callbacks(execute=True):
+            if rng.random() < 0.7:
+                Friendship.make_friends(first, second)
+            else:
+                Friendship.lose_friend(first, second)
+
+    incremental = _suggestion_rows()
+    assert incremental
+    assert all(count > 0 for _, _, count in incremental)
+
+    call_command("rebuild_suggestions", batch_size=5, stdout=StringIO())
+    assert _suggestion_rows() == incremental
+
+
+@pytest.mark.django_db
+def test_bulk_accept_suggestions_match_rebuild(django_capture_on_commit_callbacks):
+    """
+    Тест проверяет, что рекомендации после массового принятия заявок совпадают с полной перестройкой.
+
+    Шаги:
+        1. Создание пользователя с друзьями и заявок от пользователей, часть которых дружит между собой.
+        2. Массовое принятие заявок одной операцией.
+        3. Полная перестройка рекомендаций и сравнение результатов (общий друг считается один раз).
+    """
+    me, *others = User.objects.bulk_create([User(username=f"b{i}") for i in range(8)])
+    senders, friends = others[:4], others[4:]
+    with django_capture_on_commit_callbacks(execute=True):
+        for friend in friends:
+            Friendship.make_friends(me, friend)
+        Friendship.make_friends(senders[0], senders[1])
+        Friendship.make_friends(senders[2], friends[0])
+    FriendRequest.objects.bulk_create([FriendRequest(from_user=sender, to_user=me) for sender in senders])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        services.bulk_accept_requests(me, [sender.username for sender in senders])
+    incremental = _suggestion_rows()
+    assert (senders[0].pk, senders[2].pk, 1) in incremental
+
+    call_command("rebuild_suggestions", batch_size=5, stdout=StringIO())
+    assert _suggestion_rows() == incremental
+
+
+@pytest.mark.django_db
+def test_suggestions_of_user_with_many_friends(django_capture_on_commit_callbacks):
+    """
+    Тест проверяет, что рекомендации пользователя с большим числом друзей записываются после фиксации транзакции.
+
+    Шаги:
+        1. Создание пользователя со 150 друзьями (изменения рекомендаций больше пачки вставки) и заявки к нему.
+        2. Принятие заявки: в транзакции нет запросов к таблице рекомендаций, после фиксации
+           рекомендации совпадают с полной перестройкой.
+        3. То же для удаления из друзей.
+    """
+    hub, newcomer, *others = User.objects.bulk_create([User(username=f"h{i}") for i in range(152)])
+    Friendship.objects.bulk_create([Friendship(user_low=hub, user_high=other) for other in others])
+    Friendship.objects.bulk_create([Friendship(user_low=newcomer, user_high=other) for other in others[:3]])
+    FriendRequest.objects.create(from_user=newcomer, to_user=hub)
+    call_command("rebuild_suggestions", stdout=StringIO())
+    table = FriendSuggestion._meta.db_table
+
+    for operation in (services.accept_request, services.delete_friend):
+        with django_capture_on_commit_callbacks() as callbacks:
+            with CaptureQueriesContext(connection) as queries:
+                operation(hub, newcomer)
+        assert not [query for query in queries if table in query["sql"]]
+        for callback in callbacks:
+            callback()
+
+        incremental = _suggestion_rows()
+        call_command("rebuild_suggestions", stdout=StringIO())
+        assert _suggestion_rows() == incremental
+    assert (newcomer.pk, hub.pk, 3) in incremental
+
+
+@pytest.mark.django_db(transaction=True)
+def test_large_suggestion_changes_are_deferred(settings, monkeypatch):
+    """
+    Тест проверяет, что большие изменения рекомендаций записываются в фоновом потоке по порядку.
+
+    Шаги:
+        1. Изменения дружб при FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS = 6, пока фоновый поток занят: большие
+           изменения уходят в него, а маленькие после них - тоже, в порядке фиксации транзакций.
+        2. Ожидание фонового потока и сравнение рекомендаций с полной перестройкой.
+        3. Маленькие изменения при свободном фоновом потоке записываются в потоке запроса.
+    """
+    settings.FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS = 6
+    threads = []
+    apply = suggestions.apply
+    monkeypatch.setattr(
+        suggestions, "apply", lambda changes: (threads.append(threading.current_thread().name), apply(changes))
+    )
+    hub, first, second, *others = User.objects.bulk_create([User(username=f"d{i}") for i in range(8)])
+    Friendship.objects.bulk_create([Friendship(user_low=hub, user_high=other) for other in others])
+    call_command("rebuild_suggestions", stdout=StringIO())
+
+    # Фоновый поток занят, пока не записаны все изменения: тестовая база SQLite в памяти не ждет блокировок
+    blocker = threading.Event()
+    suggestions._get_executor().submit(blocker.wait)
+    try:
+        Friendship.make_friends(hub, first)
+        Friendship.make_friends(first, second)
+        Friendship.lose_friend(hub, others[0])
+    finally:
+        blocker.set()
+    suggestions.flush()
+    assert len(threads) == 3 and all(name.startswith("friend-suggestions") for name in threads)
+    incremental = _suggestion_rows()
+    assert (first.pk, others[1].pk, 1) in incremental
+    call_command("rebuild_suggestions", stdout=StringIO())
+    assert _suggestion_rows() == incremental
+
+    threads.clear()
+    Friendship.make_friends(second, others[1])
+    assert threads == [threading.current_thread().name]
+
+
+@pytest.mark.django_db
+def test_suggestions_endpoint(api_client, django_capture_on_commit_callbacks):
+    """
+    Тест проверяет выдачу рекомендаций по убыванию числа общих друзей без пользователей с заявками.
+
+    Шаги:
+        1. Создание графа, в котором у кандидатов разное число общих друзей с пользователем.
+        2. Проверка порядка рекомендаций.
+        3. Отправка заявки кандидату и проверка, что он исчез из рекомендаций.
+    """
+    me, a, b, c, x, y = User.objects.bulk_create([User(username=name) for name in "me a b c x y".split()])
+    with django_capture_on_commit_callbacks(execute=True):
+        for friend in (a, b, c):
+            Friendship.make_friends(me, friend)
+        for friend in (a, b, c):
+            Friendship.make_friends(x, friend)
+        Friendship.make_friends(y, a)
+    api_client.force_authenticate(me)
+
+    response = api_client.get("/suggestions/")
+    assert response.data["results"] == [
+        {"username": "x", "mutual_friends": 3},
+        {"username": "y", "mutual_friends": 1},
+    ]
+
+    FriendRequest.send(me, x)
+    response = api_client.get("/suggestions/")
+    assert [row["username"] for row in response.data["results"]] == ["y"]
+
+
+@pytest.mark.django_db
+def test_graph_export(api_client):
+    """
+    Тест проверяет потоковую выгрузку графа эндпоинтом /export/ и командой export_graph.
+
+    Шаги:
+        1. Создание пользователя с друзьями и заявками и постороннего пользователя с другом.
+        2. Выгрузка графа пользователя в NDJSON и CSV.
+        3. Проверка, что выгрузка всего графа доступна только администратору.
+        4. Выгрузка всего графа командой export_graph.
+    """
+    user = User.objects.create(username="owner", email="owner@example.com")
+    _seed_profile_graph(user, "p", friends=2, sent=1, received=1)
+    stranger, other = User.objects.bulk_create([User(username="stranger"), User(username="other")])
+    Friendship.make_friends(stranger, other)
+    api_client.force_authenticate(user)
+
+    response = api_client.get("/export/", {"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+    assert [record["type"] for record in records] == ["user"] * 5 + ["friendship"] * 2 + ["friend_request"] * 2
+    assert records[0] == {
+        "type": "user",
+        "username": "owner",
+        "email": "owner@example.com",
+        "created_at": records[0]["created_at"],
+    }
+    assert all("email" not in record for record in records[1:5])
+    assert {(r["from_user"], r["to_user"]) for r in records[5:]} == {
+        ("owner", "p0"),
+        ("owner", "p1"),
+        ("owner", "p2"),
+        ("p3", "owner"),
+    }
+
+    response = api_client.get("/export/", HTTP_ACCEPT="text/csv")
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+    assert [row["type"] for row in rows] == [record["type"] for record in records]
+
+    assert api_client.get("/export/", {"scope": "all"}).status_code == 403
+
+    output = StringIO()
+    call_command("export_graph", chunk_size=2, stdout=output, stderr=StringIO())
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sum(record["type"] == "user" for record in records) == User.objects.count()
+    assert sum(record["type"] == "friendship" for record in records) == 3
+    assert sum(record["type"] == "friend_request" for record in records) == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("input_format", ["ndjson", "csv"])
+def test_import_graph(tmp_path, input_format):
+    """
+    Тест проверяет загрузку выгрузки командой import_graph и продолжение с контрольной точки.
+
+    Шаги:
+        1. Выгрузка графа командой export_graph и удаление всех пользователей.
+        2. Загрузка первой половины записей (контрольная точка после прерывания) и остальных.
+        3. Проверка пользователей, токенов, дат дружб и заявок и счетчиков UserStats.
+        4. Проверка, что повторная загрузка ничего не дублирует.
+    """
+    user = User.objects.create(username="owner", email="owner@example.com")
+    _seed_profile_graph(user, "p", friends=3, sent=2, received=1)
+    expected_edges = sorted(
+        Friendship.objects.values_list("user_low__username", "user_high__username", "created_at")
+    ) + sorted(FriendRequest.objects.values_list("from_user__username", "to_user__username", "timestamp"))
+    dump = tmp_path / f"graph.{input_format}"
+    call_command("export_graph", format=input_format, output=str(dump), stdout=StringIO())
+    User.objects.all().delete()
+
+    lines = dump.read_text(encoding="utf-8").splitlines(keepends=True)
+    header, records = (lines[:1], lines[1:]) if input_format == "csv" else ([], lines)
+    half = tmp_path / f"half.{input_format}"
+    half.write_text("".join(header + records[:5]), encoding="utf-8")
+    call_command("import_graph", str(half), batch_size=2, checkpoint=str(tmp_path / "state"), stdout=StringIO())
+    assert User.objects.count() == 5
+    (tmp_path / "state").write_text(json.dumps({"records": 5}))
+
+    output = StringIO()
+    call_command("import_graph", str(dump), batch_size=2, checkpoint=str(tmp_path / "state"), stdout=output)
+    assert "Продолжение с контрольной точки" in output.getvalue()
+    assert not (tmp_path / "state").exists()
+    call_command("import_graph", str(dump), batch_size=4, stdout=StringIO())
+
+    owner = User.objects.get(username="owner")
+    assert owner.email == "owner@example.com"
+    assert not owner.has_usable_password()
+    assert User.objects.count() == 7
+    assert Token.objects.count() == 7
+    edges = sorted(Friendship.objects.values_list("user_low__username", "user_high__username", "created_at")) + sorted(
+        FriendRequest.objects.values_list("from_user__username", "to_user__username", "timestamp")
+    )
+    assert edges == expected_edges
+    stats = UserStats.objects.get(user=owner)
+    assert (stats.friends_count, stats.friend_requests_sent_count, stats.friend_requests_received_count) == (3, 2, 1)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "backend",
+    [
+        {"BACKEND": "friends.graph.LocalAdjacencyBackend", "OPTIONS": {"max_entries": 2}},
+        {"BACKEND": "friends.graph.DjangoCacheAdjacencyBackend", "OPTIONS": {"timeout": 60}},
+    ],
+    ids=["local-lru", "django-cache"],
+)
+def test_friend_graph_cache(api_client, settings, backend):
+    """
+    Тест проверяет кэш множеств друзей: попадания, вытеснение и сброс при изменении дружбы.
+
+    Шаги:
+        1. Повторное чтение множества друзей и подсчет попаданий и промахов.
+        2. Принятие заявки и проверка, что кэш не отдает устаревшее множество.
+        3. Проверка статистики кэша через эндпоинт администратора.
+    """
+    settings.FRIENDS_GRAPH_CACHE = backend
+    alice, bob, carol = User.objects.bulk_create([User(username=name) for name in ("alice", "bob", "carol")])
+
+    assert bob.pk not in graph.friend_id_set(alice.pk)
+    assert bob.pk not in graph.friend_id_set(alice.pk)
+    assert graph.stats()["hits"] == 1
+    assert graph.stats()["misses"] == 1
+
+    FriendRequest.send(bob, alice)
+    FriendRequest.objects.get().accept()
+    assert bob.pk in graph.friend_id_set(alice.pk)
+    assert alice.pk in graph.friend_id_set(bob.pk)
+    assert alice.pk not in graph.friend_id_set(carol.pk)
+
+    Friendship.lose_friend(bob, alice)
+    assert bob.pk not in graph.friend_id_set(alice.pk)
+
+    admin = User.objects.create_superuser("admin", "admin@example.com", "password123")
+    api_client.force_authenticate(admin)
+    response = api_client.get("/cache_stats/")
+    assert response.status_code == 200
+    assert response.data["friend_graph"]["misses"] >= 4
+    api_client.force_authenticate(alice)
+    assert api_client.get("/cache_stats/").status_code == 403
+
+
+@pytest.mark.django_db
+def test_local_friend_graph_cache_ttl(settings, monkeypatch):
+    """
+    Тест проверяет, что множество друзей в кэше процесса устаревает не дольше ttl.
+
+    Шаги:
+        1. Кэширование множества друзей пользователя.
+        2. Создание дружбы в обход сброса кэша (как в другом процессе).
+        3. Проверка, что до истечения ttl кэш отдает старое множество, а после - новое.
+    """
+    settings.FRIENDS_GRAPH_CACHE = {"BACKEND": "friends.graph.LocalAdjacencyBackend", "OPTIONS": {"ttl": 30}}
+    alice, bob = User.objects.bulk_create([User(username=name) for name in ("alice", "bob")])
+
+    assert bob.pk not in graph.friend_id_set(alice.pk)
+    Friendship.objects.create(user_low=alice, user_high=bob)
+    assert bob.pk not in graph.friend_id_set(alice.pk)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+    assert bob.pk in graph.friend_id_set(alice.pk)
+
+
+@pytest.mark.django_db
+def test_cached_token_authentication(api_client, create_user, settings):
+    """
+    Тест кэширования аутентификации по токену.
+
+    Шаги:
+        1. Повторный запрос с тем же токеном не обращается к таблице токенов.
+        2. Деактивация пользователя сразу запрещает доступ по закэшированному токену.
+        3. Замена токена сразу запрещает доступ по старому токену.
+        4. Проверка вытеснения по размеру и статистики кэша.
+    """
+    settings.FRIENDS_TOKEN_CACHE = {"MAX_ENTRIES": 1, "TTL": 60}
+    settings.FRIENDS_RESPONSE_CACHE = {"TIMEOUT": 0}
+    token = Token.objects.get(user=create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    with CaptureQueriesContext(connection) as cold:
+        assert api_client.get("/accounts/profile/?mode=summary").status_code == 200
+    with CaptureQueriesContext(connection) as warm:
+        response = api_client.get("/accounts/profile/?mode=summary")
+    assert response.status_code == 200
+    assert response.data["username"] == create_user.username
+    assert len(warm) == len(cold) - 1
+    assert authentication.stats()["hits"] == 1
+
+    create_user.is_active = False
+    create_user.save()
+    assert api_client.get("/accounts/profile/?mode=summary").status_code == 401
+    create_user.is_active = True
+    create_user.save()
+    assert api_client.get("/accounts/profile/?mode=summary").status_code == 200
+
+    token.delete()
+    new_token = Token.objects.create(user=create_user)
+    assert api_client.get("/accounts/profile/?mode=summary").status_code == 401
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {new_token.key}")
+    assert api_client.get("/accounts/profile/?mode=summary").status_code == 200
+
+    other = User.objects.create_user("other", "other@example.com", "password123")
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.get(user=other).key}")
+    assert api_client.get("/accounts/profile/?mode=summary").status_code == 200
+    assert authentication.stats()["size"] == 1
+
+    admin = User.objects.create_superuser("admin", "admin@example.com", "password123")
+    api_client.credentials()
+    api_client.force_authenticate(admin)
+    response = api_client.get("/cache_stats/")
+    assert response.status_code == 200
+    assert response.data["token_auth"]["hit_rate"] is not None
+
+
+def _statuses(response):
+    """
+    Возвращает словарь {имя пользователя: статус} из ответа массовой операции.
+    """
+    assert response.status_code == 200
+    return {row["username"]: row["status"] for row in response.data["results"]}
+
+
+@pytest.mark.django_db
+def test_bulk_friend_requests(api_client):
+    """
+    Тест проверяет массовую отправку, принятие и отклонение заявок в друзья.
+
+    Шаги:
+        1. Массовая отправка заявок с разными исходами для отдельных имен.
+        2. Массовое принятие и отклонение заявок получателями.
+        3. Проверка дружб, заявок и счетчиков.
+    """
+    me, friend, incoming, *targets = User.objects.bulk_create(
+        [User(username=name) for name in ("me", "friend", "incoming", "t1", "t2", "t3")]
+    )
+    Friendship.make_friends(me, friend)
+    FriendRequest.send(incoming, me)
+    FriendRequest.send(me, targets[0])
+    api_client.force_authenticate(me)
+
+    response = api_client.post(
+        "/bulk/send_requests/",
+        {"usernames": ["t1", "t2", "t3", "t2", "friend", "incoming", "me", "ghost"]},
+        format="json",
+    )
+    assert _statuses(response) == {
+        "t1": "already_sent",
+        "t2": "sent",
+        "t3": "sent",
+        "friend": "already_friends",
+        "incoming": "accepted",
+        "me": "self",
+        "ghost": "not_found",
+    }
+    assert Friendship.are_friends(me, incoming)
+    assert FriendRequest.objects.filter(from_user=me).count() == 3
+
+    api_client.force_authenticate(targets[1])
+    response = api_client.post("/bulk/accept_requests/", {"usernames": ["me", "t1"]}, format="json")
+    assert _statuses(response) == {"me": "accepted", "t1": "no_request"}
+    api_client.force_authenticate(targets[2])
+    response = api_client.post("/bulk/reject_requests/", {"usernames": ["me", "ghost"]}, format="json")
+    assert _statuses(response) == {"me": "rejected", "ghost": "not_found"}
+
+    stats = UserStats.for_user(me)
+    assert (stats.friends_count, stats.friend_requests_sent_count, stats.friend_requests_received_count) == (3, 1, 0)
+    assert UserStats.for_user(targets[1]).friends_count == 1
+    assert UserStats.for_user(targets[2]).friend_requests_received_count == 0
+    assert api_client.post("/bulk/send_requests/", {"usernames": []}, format="json").status_code == 400
+
+
+@pytest.mark.django_db
+def test_bulk_send_query_count_is_constant(api_client):
+    """
+    Тест проверяет, что число SQL-запросов массовой отправки не зависит от количества имен.
+    """
+    me = User.objects.create(username="me")
+    targets = User.objects.bulk_create([User(username=f"n{i}") for i in range(300)])
+    UserStats.recompute([target.pk for target in targets])
+    api_client.force_authenticate(me)
+
+    counts = []
+    for names in (["n0", "n1"], [f"n{i}" for i in range(2, 300)]):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.post("/bulk/send_requests/", {"usernames": names}, format="json")
+        assert set(_statuses(response).values()) == {"sent"}
+        counts.append(len(queries))
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_friend_request_transitions(settings):
+    """
+    Нагрузочный тест параллельных переходов состояний заявок в друзья из многих потоков.
+
+    Шаги:
+        1. Несколько потоков одновременно отправляют встречные заявки, принимают, отклоняют
+           и удаляют друзей для одних и тех же пар пользователей.
+        2. Проверка, что ни одна операция не упала.
+        3. Проверка инвариантов: нет повторных и встречных заявок, нет заявок между друзьями,
+           счетчики UserStats совпадают с пересчетом.
+    """
+    # Тестовая база SQLite в памяти блокирует таблицы целиком, поэтому конфликтов больше, чем в реальной базе
+    settings.FRIENDS_TRANSACTION_RETRIES = 50
+    users = [User.objects.create(username=f"c{i}") for i in range(6)]
+    pairs = [(a, b) for a in users for b in users if a.pk < b.pk]
+    operations = [
+        lambda a, b: services.send_request(a, b),
+        lambda a, b: services.send_request(b, a),
+        lambda a, b: services.accept_request(b, a),
+        lambda a, b: services.reject_request(a, b),
+        lambda a, b: services.delete_friend(a, b),
+    ]
+    errors = []
+    barrier = threading.Barrier(8)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        try:
+            barrier.wait()
+            for _ in range(40):
+                first, second = rng.choice(pairs)
+                rng.choice(operations)(first, second)
+        except Exception as error:  # noqa: BLE001 - ошибка потока проверяется в основном потоке
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    requests = list(FriendRequest.objects.values_list("from_user_id", "to_user_id"))
+    assert len(requests) == len(set(requests))
+    for from_id, to_id in requests:
+        assert (to_id, from_id) not in requests
+        assert not Friendship.are_friends(from_id, to_id)
+    expected = {
+        stats.pk: [getattr(stats, field) for field in UserStats.COUNTER_FIELDS] for stats in UserStats.objects.all()
+    }
+    UserStats.recompute([user.pk for user in users])
+    actual = {
+        stats.pk: [getattr(stats, field) for field in UserStats.COUNTER_FIELDS] for stats in UserStats.objects.all()
+    }
+    assert actual == expected
+
+
+@pytest.mark.django_db(transaction=True)
+def test_remove_duplicate_requests_migration():
+    """
+    Тест проверяет, что миграция ограничений заявок удаляет повторные заявки и заявки самому себе
+    и оставляет согласованные счетчики UserStats.
+
+    Шаги:
+        1. Откат миграций до 0009 и создание повторных заявок и заявки самому себе со счетчиками по ним.
+        2. Применение миграций.
+        3. Проверка, что осталась одна заявка, а счетчики совпадают с пересчетом.
+    """
+    executor = MigrationExecutor(connection)
+    latest = executor.loader.graph.leaf_nodes("friends")
+    executor.migrate([("friends", "0009_friendsuggestion")])
+    apps = executor.loader.project_state([("friends", "0009_friendsuggestion")]).apps
+    HistoricalUser = apps.get_model("auth", "User")
+    HistoricalRequest = apps.get_model("friends", "FriendRequest")
+    HistoricalStats = apps.get_model("friends", "UserStats")
+    alice, bob = [HistoricalUser.objects.create(username=name) for name in ("alice", "bob")]
+    HistoricalRequest.objects.bulk_create(
+        [
+            HistoricalRequest(from_user=alice, to_user=bob),
+            HistoricalRequest(from_user=alice, to_user=bob),
+            HistoricalRequest(from_user=alice, to_user=bob),
+            HistoricalRequest(from_user=bob, to_user=bob),
+        ]
+    )
+    HistoricalStats.objects.bulk_create(
+        [
+            HistoricalStats(user_id=alice.pk, friend_requests_sent_count=3),
+            HistoricalStats(user_id=bob.pk, friend_requests_sent_count=1, friend_requests_received_count=4),
+        ]
+    )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(latest)
+
+    assert list(FriendRequest.objects.values_list("from_user_id", "to_user_id")) == [(alice.pk, bob.pk)]
+    assert UserStats.recompute([alice.pk, bob.pk]) == (0, 0)
+    assert UserStats.objects.get(user_id=bob.pk).friend_requests_received_count == 1
+
+
+def _metric(text, line_prefix):
+    """
+    Возвращает значение метрики из текста Prometheus по началу строки (имя и метки).
+    """
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"Нет метрики {line_prefix}")
+
+
+@pytest.mark.django_db
+def test_metrics_middleware(api_client, create_user, create_second_user, settings):
+    """
+    Тест проверяет метрики запросов и заголовок Server-Timing.
+
+    Шаги:
+        1. Запросы к списку друзей и несуществующему адресу.
+        2. Проверка заголовка Server-Timing с числом SQL-запросов.
+        3. Проверка доступа к /metrics/ и значений метрик маршрутов.
+    """
+    metrics.reset()
+    Friendship.make_friends(create_user, create_second_user)
+    api_client.force_authenticate(create_user)
+    query_counts = []
+    for _ in range(3):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get("/friends/")
+        assert response.status_code == 200
+        query_counts.append(len(queries))
+    assert api_client.get("/no-such-page/").status_code == 404
+
+    timing = response.headers["Server-Timing"]
+    # Журнал запросов соединения очищается в начале каждого запроса, поэтому число берется из query_counts
+    assert f'desc="{query_counts[-1]} queries"' in timing
+    assert {part.split(";")[0] for part in timing.split(", ")} == {"db", "serialize", "render", "total"}
+
+    assert api_client.get("/metrics/").status_code == 403
+    settings.FRIENDS_METRICS_PUBLIC = True
+    settings.FRIENDS_SERVER_TIMING = False
+    api_client.force_authenticate(None)
+    response = api_client.get("/metrics/")
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert "Server-Timing" not in response.headers
+    text = response.content.decode()
+
+    assert _metric(text, 'friends_http_requests_total{route="friends",status="2xx"}') == 3
+    assert _metric(text, 'friends_http_requests_total{route="metrics",status="4xx"}') == 1
+    assert _metric(text, 'friends_http_requests_total{route="unmatched",status="4xx"}') == 1
+    assert _metric(text, 'friends_http_request_duration_seconds_count{route="friends"}') == 3
+    assert _metric(text, 'friends_http_request_duration_seconds_bucket{route="friends",le="+Inf"}') == 3
+    assert _metric(text, 'friends_db_queries_per_request_sum{route="friends"}') == sum(query_counts)
+    assert _metric(text, 'friends_http_response_size_bytes_count{route="friends"}') == 3
+    assert _metric(text, 'friends_db_query_seconds_total{route="friends"}') > 0
+    assert _metric(text, 'friends_serialize_seconds_total{route="friends"}') > 0
+    # Маршруты зарегистрированы заранее, в том числе без запросов
+    assert _metric(text, 'friends_http_requests_total{route="delete_friend",status="2xx"}') == 0
+
+
+@pytest.mark.django_db
+def test_profiling_middleware(api_client, create_user, create_second_user, settings, tmp_path):
+    """
+    Тест проверяет профилирование выборки запросов, включаемое через /profiling/.
+
+    Шаги:
+        1. Включение профилирования маршрута send_request администратором: настройки видит другой процесс.
+        2. Запросы к send_request и friends: профилируются только первые, хранятся последние MAX_PROFILES.
+        3. Проверка профиля: SQL-запросы с EXPLAIN, дерево вызовов, файл статистики cProfile.
+        4. Выключение профилирования и истечение времени настроек.
+    """
+    settings.FRIENDS_PROFILING = {
+        **settings.FRIENDS_PROFILING,
+        "DIRECTORY": tmp_path,
+        "MAX_PROFILES": 2,
+        "EXPLAIN_MS": 0,
+    }
+    admin = User.objects.create_user(username="admin", password="Admin-pass1", is_staff=True)
+    api_client.force_authenticate(create_user)
+    assert api_client.put("/profiling/", {"routes": {"send_request": 1}}, format="json").status_code == 403
+
+    api_client.force_authenticate(admin)
+    response = api_client.put("/profiling/", {"routes": {"no_such_route": 1}}, format="json")
+    assert response.status_code == 400
+    assert "no_such_route" in str(response.data["routes"])
+    response = api_client.put("/profiling/", {"routes": {"send_request": 1}, "timeout": 60}, format="json")
+    assert response.status_code == 200
+    assert response.data["config"]["routes"] == {"send_request": 1}
+    other_process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import json, django; django.setup(); "
+            "from friends import profiling; print(json.dumps(profiling.get_config()))",
+        ],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "drf.settings", "FRIENDS_PROFILING_DIR": str(tmp_path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(other_process.stdout) == response.data["config"]
+
+    api_client.force_authenticate(create_user)
+    for name in ("first", "second", "third"):
+        User.objects.create_user(username=name, password="Test-pass1")
+        assert api_client.post("/send_request_to/", {"username": name}, format="json").status_code == 201
+    assert api_client.get("/friends/").status_code == 200
+
+    api_client.force_authenticate(admin)
+    profiles = api_client.get("/profiling/").data["profiles"]
+    assert [(row["route"], row["status"]) for row in profiles] == [("send_request", 201)] * 2
+    assert profiles[0]["id"] > profiles[1]["id"]
+    assert len(list(tmp_path.glob("*.json"))) == len(list(tmp_path.glob("*.prof"))) == 2
+
+    record = api_client.get(f"/profiling/{profiles[0]['id']}/").data
+    assert record["path"] == "/send_request_to/"
+    assert record["query_count"] == len(record["queries"]) > 0
+    selects = [query for query in record["queries"] if query["sql"].startswith("SELECT")]
+    assert selects and all(query["explain"] for query in selects)
+    assert any("str" in query["params"] for query in selects)
+    assert not any("third" in json.dumps(query) for query in record["queries"])
+    assert any("views.py" in row["function"] and "(post)" in row["function"] for row in record["functions"])
+
+    def tree_functions(nodes):
+        for node in nodes:
+            yield node["function"]
+            yield from tree_functions(node["children"])
+
+    assert any("services.py" in function for function in tree_functions([record["call_tree"]]))
+
+    response = api_client.get(f"/profiling/{profiles[0]['id']}/?download=true")
+    assert response.status_code == 200
+    stats_file = tmp_path / "downloaded.prof"
+    stats_file.write_bytes(b"".join(response.streaming_content))
+    assert pstats.Stats(str(stats_file)).total_calls > 0
+    assert api_client.get("/profiling/../secret/").status_code == 404
+    assert api_client.get("/profiling/0000000000000-deadbeef/").status_code == 404
+
+    assert api_client.delete("/profiling/").status_code == 204
+    assert api_client.get("/profiling/").data["config"] == {}
+    api_client.force_authenticate(create_user)
+    api_client.post("/send_request_to/", {"username": create_second_user.username}, format="json")
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+    config = profiling.set_config({"send_request": 1})
+    config_file = tmp_path / profiling.CONFIG_FILE
+    config_file.write_text(json.dumps({**config, "expires_at": "2000-01-01T00:00:00+00:00"}), encoding="utf-8")
+    assert profiling.get_config(refresh=True) == {}
+
+
+@pytest.mark.django_db
+def test_profiling_redacts_secrets(settings, tmp_path):
+    """
+    Тест проверяет, что профили регистрации, входа и запросов с токеном не содержат секретов.
+
+    Шаги:
+        1. Профилирование всех маршрутов с EXPLAIN каждого SELECT.
+        2. Регистрация, вход по паролю и запрос профиля с токеном.
+        3. Проверка, что в файлах профилей нет ключа токена, хэша пароля и ключа сессии,
+           а параметры SQL записаны типами.
+        4. Проверка замены строковых литералов параметров в плане EXPLAIN PostgreSQL.
+    """
+    settings.FRIENDS_PROFILING = {**settings.FRIENDS_PROFILING, "DIRECTORY": tmp_path, "EXPLAIN_MS": 0}
+    profiling.set_config({profiling.ALL_ROUTES: 1})
+    client = APIClient()
+    registration = {"username": "secretive", "email": "secretive@example.com", "password": "Secret-pass1"}
+    assert client.post("/register/", registration, format="json").status_code == 201
+    assert client.post("/api-auth/login/", {"username": "secretive", "password": "Secret-pass1"}).status_code == 302
+    user = User.objects.get(username="secretive")
+    token = Token.objects.get(user=user).key
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+    assert client.get("/accounts/profile/").status_code == 200
+
+    profiles = list(tmp_path.glob("*.json"))
+    assert len(profiles) == 3
+    secrets = [token, user.password, client.cookies["sessionid"].value, "Secret-pass1"]
+    for path in tmp_path.iterdir():
+        content = path.read_bytes()
+        assert not [secret for secret in secrets if secret.encode() in content], path.name
+    queries = [query for path in profiles for query in json.loads(path.read_text())["queries"]]
+    assert any(query["params"] and "str" in query["params"] for query in queries)
+
+    explain = "Index Scan using authtoken_token_pkey on authtoken_token  (cond: ((key)::text = 'it''s'::text))"
+    assert profiling._redact(explain, ["it's"]) == (
+        "Index Scan using authtoken_token_pkey on authtoken_token  (cond: ((key)::text = '?'::text))"
+    )
+
+
+# Бюджеты эндпоинтов: имя URL -> (максимум SQL-запросов, максимум миллисекунд на запрос).
+# Число запросов проверяется всегда; время - только если задана переменная окружения
+# FRIENDS_LATENCY_BUDGET_SCALE (множитель бюджета, например 1 на рабочей машине и 3 в CI).
+ENDPOINT_BUDGETS = {
+    "greetings": (1, 100),
+    "cache_stats": (1, 100),
+    # Создание токена увеличивает версию данных пользователя (строки UserStats у нового пользователя еще нет)
+    "register": (11, 1500),
+    "profile": (6, 150),
+    "profile_summary": (7, 100),
+    "all_users": (2, 100),
+    "friends": (3, 100),
+    "incoming_requests": (3, 100),
+    "outgoing_requests": (3, 100),
+    "mutual_friends": (4, 100),
+    "suggestions": (2, 100),
+    "send_request": (13, 150),
+    "accept_request": (25, 200),
+    "reject_request": (11, 100),
+    "delete_friend": (17, 150),
+    "bulk_send_requests": (12, 200),
+    # Изменения рекомендаций больше FRIENDS_SUGGESTIONS_SYNC_MAX_ROWS строк (~480 тысяч на самом большом графе)
+    # записываются в фоновом потоке и в бюджет не входят
+    "bulk_accept_requests": (19, 200),
+    "bulk_reject_requests": (9, 150),
+    "export": (4, 150),
+    "metrics": (1, 100),
+    "profiling": (1, 100),
+    "profile_detail": (1, 100),
+}
+
+# Размеры графа пользователя (друзей, заявок, элементов массовой операции) для поиска N+1.
+# Самый большой размер больше пачки вставки SQLite (999 параметров), чтобы рост на число пачек был заметен
+BUDGET_SIZES = (3, 40, 400)
+
+# Допустимый рост числа SQL-запросов между размерами графа: один запрос на столько дополнительных элементов
+# (например, вторая пачка bulk_create на SQLite). Рост на запрос за элемент или за пачку в сотни строк - ошибка
+BUDGET_ELEMENTS_PER_QUERY = 100
+
+
+class QueryBudget(ContextDecorator):
+    """
+    Контекстный менеджер и декоратор, проверяющий число SQL-запросов и время выполнения блока.
+
+    Поля:
+        name: Имя замера для сообщений об ошибке.
+        max_queries: Максимальное число SQL-запросов.
+        max_ms: Максимальное время в миллисекундах (проверяется с множителем
+            FRIENDS_LATENCY_BUDGET_SCALE, без переменной - не проверяется).
+        queries: Выполненные SQL-запросы после выхода из блока.
+        elapsed_ms: Время выполнения блока после выхода из него.
+    """
+
+    def __init__(self, name, max_queries, max_ms):
+        self.name = name
+        self.max_queries = max_queries
+        self.max_ms = max_ms
+        self.queries = []
+        self.elapsed_ms = 0.0
+
+    def __enter__(self):
+        self._capture = CaptureQueriesContext(connection)
+        self._capture.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed_ms = (time.perf_counter() - self._started) * 1000
+        self._capture.__exit__(*exc_info)
+        self.queries = [query["sql"] for query in self._capture.captured_queries]
+        if exc_info[0] is None:
+            self.check()
+        return False
+
+    def check(self):
+        """
+        Проверяет замер: при превышении бюджета тест падает со списком выполненных запросов.
+        """
+        assert (
+            len(self.queries) <= self.max_queries
+        ), f"{self.name}: {len(self.queries)} SQL-запросов при бюджете {self.max_queries}:\n" + "\n".join(self.queries)
+        scale = float(os.getenv("FRIENDS_LATENCY_BUDGET_SCALE", "0"))
+        if scale:
+            limit = self.max_ms * scale
+            assert self.elapsed_ms <= limit, f"{self.name}: {self.elapsed_ms:.1f} мс при бюджете {limit:.0f} мс"
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Фикстура, возвращающая QueryBudget по имени эндпоинта из ENDPOINT_BUDGETS.
+
+    Пример: with query_budget("profile"): api_client.get("/accounts/profile/")
+    """
+
+    def make(name):
+        return QueryBudget(name, *ENDPOINT_BUDGETS[name])
+
+    return make
+
+
+def _budget_scenario(size):
+    """
+    Создает граф пользователя заданного размера и возвращает клиент с его токеном и запросы к эндпоинтам.
+
+    У пользователя size друзей (все они - друзья и пользователя target), size входящих
+    и исходящих заявок и size рекомендаций; массовые операции выполняются для size пользователей.
+    Сохраненный профиль содержит size SQL-запросов.
+
+    Возвращает:
+        (api_client, словарь {имя эндпоинта: (метод, путь, данные, ожидаемый код ответа)}).
+    """
+    prefix = f"n{size}_"
+    actor = User.objects.create(username=f"{prefix}actor", is_staff=True)
+    groups = ("friend", "incoming", "outgoing", "stranger", "candidate", "bulk_in")
+    names = {group: [f"{prefix}{group}{i}" for i in range(size)] for group in groups}
+    names["single"] = [f"{prefix}{name}" for name in ("target", "pending", "rejected", "exfriend", "newcomer")]
+    User.objects.bulk_create([User(username=name) for group in names.values() for name in group])
+    ids = dict(User.objects.filter(username__startswith=prefix).values_list("username", "id"))
+    target, pending, rejected, exfriend, newcomer = names["single"]
+
+    pairs = [(actor.pk, ids[name]) for name in names["friend"] + [exfriend]]
+    pairs += [(ids[target], ids[name]) for name in names["friend"]]
+    Friendship.objects.bulk_create([Friendship(user_low_id=min(pair), user_high_id=max(pair)) for pair in pairs])
+    incoming = names["incoming"] + names["bulk_in"] + [pending, rejected]
+    requests = [FriendRequest(from_user_id=ids[name], to_user=actor) for name in incoming]
+    requests += [FriendRequest(from_user=actor, to_user_id=ids[name]) for name in names["outgoing"]]
+    FriendRequest.objects.bulk_create(requests)
+    FriendSuggestion.objects.bulk_create(
+        [FriendSuggestion(user=actor, candidate_id=ids[name], mutual_count=1) for name in names["candidate"]]
+    )
+    UserStats.recount(ids.values())
+
+    query = {"sql": "SELECT 1", "params": [], "alias": "default", "ms": 1.0, "explain": None}
+    profile_id = profiling.save({"route": "friends", "status": 200, "queries": [query] * size, "call_tree": None})
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.get(user=actor).key}")
+    registration = {"username": f"{prefix}registered", "email": f"{prefix}r@example.com", "password": "Budget-pass1"}
+    return client, {
+        "greetings": ("get", "/", None, 200),
+        "cache_stats": ("get", "/cache_stats/", None, 200),
+        "register": ("post", "/register/", registration, 201),
+        "profile": ("get", "/accounts/profile/", None, 200),
+        "profile_summary": ("get", "/accounts/profile/?mode=summary", None, 200),
+        "all_users": ("get", "/all_users/", None, 200),
+        "friends": ("get", "/friends/", None, 200),
+        "incoming_requests": ("get", "/friend_requests/incoming/", None, 200),
+        "outgoing_requests": ("get", "/friend_requests/outgoing/", None, 200),
+        "mutual_friends": ("get", f"/users/{target}/mutual_friends/", None, 200),
+        "suggestions": ("get", "/suggestions/", None, 200),
+        "send_request": ("post", "/send_request_to/", {"username": newcomer}, 201),
+        "accept_request": ("post", "/accept_request_from/", {"username": pending}, 201),
+        "reject_request": ("post", "/reject_request_from/", {"username": rejected}, 201),
+        "delete_friend": ("post", "/delete_friend/", {"username": exfriend}, 201),
+        "bulk_send_requests": ("post", "/bulk/send_requests/", {"usernames": names["stranger"]}, 200),
+        "bulk_accept_requests": ("post", "/bulk/accept_requests/", {"usernames": names["bulk_in"]}, 200),
+        "bulk_reject_requests": ("post", "/bulk/reject_requests/", {"usernames": names["incoming"]}, 200),
+        "export": ("get", "/export/?format=ndjson", None, 200),
+        "metrics": ("get", "/metrics/", None, 200),
+        "profiling": ("get", "/profiling/", None, 200),
+        "profile_detail": ("get", f"/profiling/{profile_id}/", None, 200),
+    }
+
+
+@pytest.mark.budget
+@pytest.mark.django_db
+@pytest.mark.parametrize("endpoint", list(ENDPOINT_BUDGETS))
+def test_endpoint_budget(query_budget, endpoint, django_capture_on_commit_callbacks, settings, tmp_path, monkeypatch):
+    """
+    Тест проверяет бюджет SQL-запросов и времени эндпоинта и отсутствие N+1.
+
+    Шаги:
+        1. Запрос к эндпоинту на графах пользователя размеров BUDGET_SIZES, вместе с работой после
+           фиксации транзакции в потоке запроса (рекомендации друзей, события); изменения рекомендаций,
+           переданные фоновому потоку, не выполняются.
+        2. Проверка, что каждый запрос уложился в бюджет ENDPOINT_BUDGETS.
+        3. Проверка, что число SQL-запросов растет с размером графа заметно медленнее линейного.
+    """
+    settings.FRIENDS_PROFILING = {**settings.FRIENDS_PROFILING, "DIRECTORY": tmp_path}
+    # Фоновая запись рекомендаций не входит в бюджет и не выполняется
+    monkeypatch.setattr(suggestions, "_get_executor", lambda: SimpleNamespace(submit=lambda *args: None))
+    monkeypatch.setattr(suggestions, "_pending", 0)
+    measured = []
+    for size in BUDGET_SIZES:
+        client, scenarios = _budget_scenario(size)
+        method, path, data, expected = scenarios[endpoint]
+        with query_budget(endpoint) as budget, django_capture_on_commit_callbacks(execute=True):
+            response = getattr(client, method)(path, data, format="json") if data else client.get(path)
+            # Потоковый ответ выполняет запросы при чтении тела
+            if response.streaming:
+                b"".join(response.streaming_content)
+        assert response.status_code == expected, response.content
+        measured.append(len(budget.queries))
+        suggestions._pending = 0
+
+    for (size, count), (next_size, next_count) in zip(zip(BUDGET_SIZES, measured), zip(BUDGET_SIZES[1:], measured[1:])):
+        allowed = (next_size - size) // BUDGET_ELEMENTS_PER_QUERY
+        assert next_count - count <= allowed, (
+            f"{endpoint}: число SQL-запросов растет с размером графа ({dict(zip(BUDGET_SIZES, measured))}), "
+            "вероятно N+1 или запись маленькими пачками"
+        )
@@ -1,10 +1,28 @@
+import sys
+
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from friends.models import Friend, FriendRequest, User
+from friends import authentication, export, graph, metrics, profiling, response_cache, services
+from friends.conditional import user_conditional
+from friends.models import Friendship, FriendRequest, FriendSuggestion, User, UserStats
+from friends.pagination import (
+    FriendRequestCursorPagination,
+    FriendshipCursorPagination,
+    FriendSuggestionCursorPagination,
+    UsernameCursorPagination,
+    first_page,
+)
+from friends.renderers import CSVRenderer, NDJSONRenderer, PrometheusTextRenderer
+from friends.response_cache import cached_user_response
 from friends.serializers import (
-    AllUsersSerializer,
-    FriendSerializer,
+    FriendRequestValuesSerializer,
+    FriendshipValuesSerializer,
+    FriendSuggestionSerializer,
+    ProfilingConfigSerializer,
     UserProfileSerializer,
+    UsernameListSerializer,
+    UsernameValuesSerializer,
+    UserProfileSummarySerializer,
     UserSerializer,
 )
 from rest_framework import permissions, status
@@ -12,6 +30,8 @@ from rest_framework.authtoken.models import Token
 from rest_framework.renderers import StaticHTMLRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 # Create your views here.
@@ -47,6 +67,157 @@ class Greetings(APIView):
         return Response(body)
 
 
+class CacheStats(APIView):
+    """
+    Представление для просмотра счетчиков попаданий и промахов кэшей текущего процесса.
+    Доступ разрешен только администраторам.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(responses={200: "friend_graph, token_auth, responses", 403: "Forbidden"})
+    def get(self, request, format=None):
+        """
+        Возвращает статистику кэша множеств друзей, кэша аутентификации по токену и кэша ответов.
+
+        :param request: HTTP-запрос администратора.
+        :param format: Формат данных.
+        :return: Response со статистикой кэшей.
+        """
+        return Response(
+            {
+                "friend_graph": graph.stats(),
+                "token_auth": authentication.stats(),
+                "responses": response_cache.stats(),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class MetricsPermission(permissions.BasePermission):
+    """
+    Разрешение на чтение метрик: администраторам или всем при FRIENDS_METRICS_PUBLIC.
+    """
+
+    def has_permission(self, request, view):
+        return settings.FRIENDS_METRICS_PUBLIC or bool(request.user and request.user.is_staff)
+
+
+class Metrics(APIView):
+    """
+    Представление для выгрузки метрик запросов в текстовом формате Prometheus.
+    Доступ разрешен администраторам, а при FRIENDS_METRICS_PUBLIC - всем.
+    """
+
+    permission_classes = [MetricsPermission]
+    renderer_classes = [PrometheusTextRenderer]
+
+    @swagger_auto_schema(responses={200: "Метрики в формате Prometheus", 403: "Forbidden"})
+    def get(self, request, format=None):
+        """
+        Возвращает метрики всех маршрутов текущего процесса (см. friends.metrics).
+
+        :param request: HTTP-запрос.
+        :param format: Формат данных.
+        :return: Response с текстом метрик.
+        """
+        return Response(
+            metrics.exposition(),
+            status=status.HTTP_200_OK,
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+class Profiling(APIView):
+    """
+    Представление для включения и выключения профилирования запросов и просмотра списка профилей.
+    Доступ разрешен только администраторам.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(responses={200: "config, profiles", 403: "Forbidden"})
+    def get(self, request, format=None):
+        """
+        Возвращает текущие настройки профилирования и краткие записи сохраненных профилей от новых к старым.
+
+        :param request: HTTP-запрос администратора.
+        :param format: Формат данных.
+        :return: Response с настройками и списком профилей.
+        """
+        return Response(
+            {"config": profiling.get_config(refresh=True), "profiles": profiling.list_profiles()},
+            status=status.HTTP_200_OK,
+        )
+
+    @swagger_auto_schema(
+        request_body=ProfilingConfigSerializer, responses={200: "config", 400: "Некорректные настройки"}
+    )
+    def put(self, request, format=None):
+        """
+        Включает профилирование маршрутов во всех процессах без перезапуска сервера.
+
+        :param request: HTTP-запрос администратора с долями запросов routes и необязательными explain_ms и timeout.
+        :param format: Формат данных.
+        :return: Response с новыми настройками либо ошибки валидации.
+        """
+        serializer = ProfilingConfigSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        return Response({"config": profiling.set_config(**serializer.validated_data)}, status.HTTP_200_OK)
+
+    @swagger_auto_schema(responses={204: "Профилирование выключено", 403: "Forbidden"})
+    def delete(self, request, format=None):
+        """
+        Выключает профилирование. Сохраненные профили не удаляются.
+
+        :param request: HTTP-запрос администратора.
+        :param format: Формат данных.
+        :return: Пустой Response.
+        """
+        profiling.clear_config()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileDetail(APIView):
+    """
+    Представление для просмотра сохраненного профиля запроса.
+    Доступ разрешен только администраторам.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "download",
+                openapi.IN_QUERY,
+                description="true - скачать статистику cProfile (.prof) для pstats или snakeviz",
+                type=openapi.TYPE_BOOLEAN,
+            )
+        ],
+        responses={200: "Профиль: SQL-запросы с EXPLAIN, самые дорогие функции, дерево вызовов", 404: "Not found"},
+    )
+    def get(self, request, profile_id, format=None):
+        """
+        Возвращает профиль запроса или файл статистики cProfile при ?download=true.
+
+        :param request: HTTP-запрос администратора.
+        :param profile_id: Идентификатор профиля из списка /profiling/.
+        :param format: Формат данных.
+        :return: Response с профилем или FileResponse с файлом .prof.
+        """
+        if request.query_params.get("download") == "true":
+            path = profiling.stats_path(profile_id)
+            if path is None:
+                raise Http404
+            return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name)
+        record = profiling.load(profile_id)
+        if record is None:
+            raise Http404
+        return Response(record, status=status.HTTP_200_OK)
+
+
 class UserRegister(APIView):
     """
     Представление для регистрации нового пользователя.
@@ -79,9 +250,52 @@ class UserRegister(APIView):
         return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
 
+def prefix_upper_bound(prefix):
+    """
+    Возвращает наименьшую строку, большую всех строк с началом prefix, или None, если такой строки нет.
+
+    Строки с началом prefix образуют диапазон [prefix, prefix_upper_bound(prefix)), поэтому фильтр по префиксу
+    сводится к обходу диапазона индекса и, в отличие от startswith (LIKE), учитывает регистр на всех СУБД.
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def filter_username_prefix(users, prefix):
+    """
+    Оставляет в queryset пользователей только имена с началом prefix (без prefix возвращает queryset как есть).
+
+    Диапазон [prefix, prefix_upper_bound(prefix)) обходится по индексу username.
+    """
+    if not prefix:
+        return users
+    users = users.filter(username__gte=prefix)
+    upper_bound = prefix_upper_bound(prefix)
+    if upper_bound is not None:
+        users = users.filter(username__lt=upper_bound)
+    return users
+
+
+def incoming_requests_of(user):
+    """
+    Возвращает queryset входящих заявок в друзья пользователя.
+    """
+    return FriendRequest.objects.filter(to_user=user).select_related("from_user", "to_user")
+
+
+def outgoing_requests_of(user):
+    """
+    Возвращает queryset исходящих заявок в друзья пользователя.
+    """
+    return FriendRequest.objects.filter(from_user=user).select_related("from_user", "to_user")
+
+
 class UserProfile(APIView):
     """
     Представление для получения профиля текущего пользователя.
+    С параметром mode=summary вместо полных списков возвращаются их размеры и первые страницы.
     Доступ разрешен только аутентифицированным пользователям.
     """
 
@@ -94,33 +308,194 @@ class UserProfile(APIView):
                 openapi.IN_HEADER,
                 description="Токен пользователя (формат: Token <ключ>)",
                 type=openapi.TYPE_STRING,
-            )
+            ),
+            openapi.Parameter(
+                "mode",
+                openapi.IN_QUERY,
+                description="summary - только размеры списков и их первые страницы",
+                type=openapi.TYPE_STRING,
+                enum=["full", "summary"],
+            ),
         ],
         responses={
             200: "Username\nemail\ntoken",
             401: "Authentication credentials were not provided",
         },
     )
+    @cached_user_response
+    @user_conditional
     def get(self, request, format=None):
         """
         Возвращает данные профиля текущего аутентифицированного пользователя.
+        Ответ содержит ETag и Last-Modified; на условный запрос без изменений возвращается 304.
 
         :param request: HTTP-запрос с токеном в заголовке.
         :param format: Формат данных.
         :return: Response с информацией о профиле пользователя.
         """
-        user = request.user
+        if request.query_params.get("mode") == "summary":
+            return self.summary(request)
+        user = UserProfileSerializer.setup_eager_loading(User.objects.filter(pk=request.user.pk)).get()
         serializer = UserProfileSerializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def summary(self, request):
+        """
+        Возвращает краткий профиль: размеры списков друзей и заявок и первую страницу каждого списка.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :return: Response с кратким профилем пользователя.
+        """
+        user = User.objects.select_related("auth_token").get(pk=request.user.pk)
+        stats = UserStats.for_user(user)
+        data = UserProfileSummarySerializer(user).data
+        data["friends"] = first_page(
+            FriendshipCursorPagination,
+            FriendshipValuesSerializer.values(Friendship.friendships_of(user)),
+            request,
+            "friends",
+            lambda page: FriendshipValuesSerializer(page, context={"user": user}).data,
+            count=stats.friends_count,
+        )
+        data["friend_requests_sent"] = first_page(
+            FriendRequestCursorPagination,
+            FriendRequestValuesSerializer.values(outgoing_requests_of(user)),
+            request,
+            "outgoing_requests",
+            lambda page: FriendRequestValuesSerializer(page).data,
+            count=stats.friend_requests_sent_count,
+        )
+        data["friend_requests_received"] = first_page(
+            FriendRequestCursorPagination,
+            FriendRequestValuesSerializer.values(incoming_requests_of(user)),
+            request,
+            "incoming_requests",
+            lambda page: FriendRequestValuesSerializer(page).data,
+            count=stats.friend_requests_received_count,
+        )
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class FriendList(APIView):
+    """
+    Представление для постраничного получения списка друзей текущего пользователя.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FriendshipCursorPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                openapi.IN_HEADER,
+                description="Токен пользователя (формат: Token <ключ>)",
+                type=openapi.TYPE_STRING,
+            )
+        ],
+        responses={200: "next\nprevious\nresults", 401: "Authentication credentials were not provided"},
+    )
+    @cached_user_response
+    @user_conditional
+    def get(self, request, format=None):
+        """
+        Возвращает страницу друзей текущего пользователя, от новых дружб к старым.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :param format: Формат данных.
+        :return: Response со страницей друзей и курсорами next/previous.
+        """
+        paginator = self.pagination_class()
+        friendships = FriendshipValuesSerializer.values(Friendship.friendships_of(request.user))
+        page = paginator.paginate_queryset(friendships, request, view=self)
+        serializer = FriendshipValuesSerializer(page, context={"user": request.user})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class IncomingFriendRequests(APIView):
+    """
+    Представление для постраничного получения входящих заявок в друзья.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FriendRequestCursorPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                openapi.IN_HEADER,
+                description="Токен пользователя (формат: Token <ключ>)",
+                type=openapi.TYPE_STRING,
+            )
+        ],
+        responses={200: "next\nprevious\nresults", 401: "Authentication credentials were not provided"},
+    )
+    @cached_user_response
+    @user_conditional
+    def get(self, request, format=None):
+        """
+        Возвращает страницу входящих заявок в друзья, от новых к старым.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :param format: Формат данных.
+        :return: Response со страницей заявок и курсорами next/previous.
+        """
+        paginator = self.pagination_class()
+        requests = FriendRequestValuesSerializer.values(incoming_requests_of(request.user))
+        page = paginator.paginate_queryset(requests, request, view=self)
+        serializer = FriendRequestValuesSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class OutgoingFriendRequests(APIView):
+    """
+    Представление для постраничного получения исходящих заявок в друзья.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FriendRequestCursorPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                openapi.IN_HEADER,
+                description="Токен пользователя (формат: Token <ключ>)",
+                type=openapi.TYPE_STRING,
+            )
+        ],
+        responses={200: "next\nprevious\nresults", 401: "Authentication credentials were not provided"},
+    )
+    @cached_user_response
+    @user_conditional
+    def get(self, request, format=None):
+        """
+        Возвращает страницу исходящих заявок в друзья, от новых к старым.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :param format: Формат данных.
+        :return: Response со страницей заявок и курсорами next/previous.
+        """
+        paginator = self.pagination_class()
+        requests = FriendRequestValuesSerializer.values(outgoing_requests_of(request.user))
+        page = paginator.paginate_queryset(requests, request, view=self)
+        serializer = FriendRequestValuesSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
+
 
 class AllUsers(APIView):
     """
     Представление для получения списка всех пользователей, кроме текущего.
+    Список отдается постранично с курсорной пагинацией по имени пользователя.
     Доступ разрешен только аутентифицированным пользователям.
     """
 
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UsernameCursorPagination
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -129,22 +504,149 @@ class AllUsers(APIView):
                 openapi.IN_HEADER,
                 description="Токен пользователя (формат: Token <ключ>)",
                 type=openapi.TYPE_STRING,
-            )
+            ),
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="Курсор страницы из полей next/previous",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="Размер страницы",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "prefix",
+                openapi.IN_QUERY,
+                description="Начало имени пользователя",
+                type=openapi.TYPE_STRING,
+            ),
         ],
-        responses={200: "Success", 401: "Authentication credentials were not provided"},
+        responses={200: "next\nprevious\nresults", 401: "Authentication credentials were not provided"},
     )
     def get(self, request, format=None):
         """
-        Возвращает список всех пользователей, кроме текущего пользователя.
+        Возвращает страницу списка всех пользователей, кроме текущего пользователя.
 
         :param request: HTTP-запрос с токеном в заголовке.
         :param format: Формат данных.
-        :return: Response с информацией о пользователях.
+        :return: Response со страницей пользователей и курсорами next/previous.
         """
         current_user = request.user
-        users = User.objects.exclude(id=current_user.id)
-        serializer = AllUsersSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        users = UsernameValuesSerializer.values(User.objects.exclude(id=current_user.id))
+        users = filter_username_prefix(users, request.query_params.get("prefix"))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = UsernameValuesSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class MutualFriends(APIView):
+    """
+    Представление для получения общих друзей текущего пользователя и указанного пользователя.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UsernameCursorPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                openapi.IN_HEADER,
+                description="Токен пользователя (формат: Token <ключ>)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "count_only",
+                openapi.IN_QUERY,
+                description="Вернуть только количество общих друзей",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+        ],
+        responses={
+            200: "next\nprevious\nresults или count",
+            400: "Нельзя запросить общих друзей с самим собой",
+            404: "Not found",
+        },
+    )
+    def get(self, request, username, format=None):
+        """
+        Возвращает страницу общих друзей или только их количество (count_only=true).
+
+        Для пользователей с большим числом друзей общие друзья считаются пересечением
+        закэшированных множеств смежности, для остальных - одним SQL-запросом.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :param username: Имя пользователя, с которым ищутся общие друзья.
+        :param format: Формат данных.
+        :return: Response со страницей общих друзей или их количеством.
+        """
+        other = get_object_or_404(User, username=username)
+        if other == request.user:
+            return Response("Нельзя запросить общих друзей с самим собой", status.HTTP_400_BAD_REQUEST)
+
+        count_only = request.query_params.get("count_only", "").lower() in ("1", "true")
+        if graph.are_hot(request.user.pk, other.pk):
+            mutual_ids = graph.mutual_friend_ids(request.user.pk, other.pk)
+            if count_only:
+                return Response({"count": len(mutual_ids)}, status=status.HTTP_200_OK)
+            users = User.objects.filter(id__in=mutual_ids)
+        else:
+            users = Friendship.mutual_friends_of(request.user, other)
+            if count_only:
+                return Response({"count": users.count()}, status=status.HTTP_200_OK)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(UsernameValuesSerializer.values(users), request, view=self)
+        serializer = UsernameValuesSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class FriendSuggestions(APIView):
+    """
+    Представление для получения рекомендаций друзей (друзей друзей) по числу общих друзей.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FriendSuggestionCursorPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                openapi.IN_HEADER,
+                description="Токен пользователя (формат: Token <ключ>)",
+                type=openapi.TYPE_STRING,
+            )
+        ],
+        responses={200: "next\nprevious\nresults", 401: "Authentication credentials were not provided"},
+    )
+    def get(self, request, format=None):
+        """
+        Возвращает страницу рекомендаций из предрассчитанной таблицы, исключая пользователей,
+        с которыми уже есть заявка в друзья.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :param format: Формат данных.
+        :return: Response со страницей рекомендаций и курсорами next/previous.
+        """
+        user = request.user
+        suggestions = (
+            FriendSuggestion.objects.filter(user=user)
+            .exclude(candidate_id__in=FriendRequest.objects.filter(from_user=user).values("to_user_id"))
+            .exclude(candidate_id__in=FriendRequest.objects.filter(to_user=user).values("from_user_id"))
+            .select_related("candidate")
+            .only("mutual_count", "candidate__username")
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(suggestions, request, view=self)
+        serializer = FriendSuggestionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class SendRequestToUser(APIView):
@@ -187,35 +689,26 @@ class SendRequestToUser(APIView):
 
         friend = get_object_or_404(User, username=username)
 
-        friend_request = FriendRequest.objects.filter(from_user=request.user, to_user=friend).first()
         if request.user == friend:
             return Response(
                 "Нельзя отправить заявку в друзья самому себе",
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        is_friend = Friend.objects.filter(current_user=request.user, users=friend)
-
-        if is_friend:
+        result = services.send_request(request.user, friend)
+        if result == services.ALREADY_FRIENDS:
             return Response(f"{username} уже у вас в друзьях", status.HTTP_400_BAD_REQUEST)
-
-        if not friend_request:
-            reverse_request = FriendRequest.objects.filter(from_user=friend, to_user=request.user).first()
-            if reverse_request:
-                reverse_request.accept()
-                reverse_request.delete()
-                return Response(
-                    f"Вы добавили в друзья пользователя {friend}",
-                    status.HTTP_201_CREATED,
-                )
-            else:
-                FriendRequest.objects.create(from_user=request.user, to_user=friend)
-                return Response(
-                    f"Вы отправили заявку в друзья пользователю {friend}",
-                    status.HTTP_201_CREATED,
-                )
-        else:
+        if result == services.ALREADY_SENT:
             return Response("Такая заявка уже существует", status.HTTP_200_OK)
+        if result == services.ACCEPTED:
+            return Response(
+                f"Вы добавили в друзья пользователя {friend}",
+                status.HTTP_201_CREATED,
+            )
+        return Response(
+            f"Вы отправили заявку в друзья пользователю {friend}",
+            status.HTTP_201_CREATED,
+        )
 
 
 class AcceptRequestFromUser(APIView):
@@ -255,10 +748,7 @@ class AcceptRequestFromUser(APIView):
 
         friend = get_object_or_404(User, username=username)
 
-        friend_request = FriendRequest.objects.filter(from_user=friend, to_user=request.user).first()
-        if friend_request:
-            friend_request.accept()
-            friend_request.delete()
+        if services.accept_request(request.user, friend) == services.ACCEPTED:
             return Response(f"Вы добавили {friend} в друзья", status.HTTP_201_CREATED)
         return Response(
             f"Не удалось принять запрос в друзья от {username}",
@@ -306,9 +796,7 @@ class RejectRequestFromUser(APIView):
 
         friend = get_object_or_404(User, username=username)
 
-        friend_request = FriendRequest.objects.filter(from_user=friend, to_user=request.user).first()
-        if friend_request:
-            friend_request.delete()
+        if services.reject_request(request.user, friend) == services.REJECTED:
             return Response(f"Вы отклонили заявку в друзья от {friend}", status.HTTP_201_CREATED)
         return Response(f"Не удалось отклонить запрос от {username}", status.HTTP_400_BAD_REQUEST)
 
@@ -359,11 +847,154 @@ class DeleteFriend(APIView):
         if username == str(current_user):
             return Response(f'{"Нельзя удалить самого себя из друзей"}', status.HTTP_400_BAD_REQUEST)
 
-        friend_relation = Friend.objects.filter(current_user=current_user, users=friend_to_lose)
-        if not friend_relation.exists():
+        if services.delete_friend(current_user, friend_to_lose) == services.NOT_FRIENDS:
             return Response(f"{username} не является вашим другом", status.HTTP_400_BAD_REQUEST)
 
-        if friend_to_lose:
-            Friend.lose_friend(current_user, friend_to_lose)
-            Friend.lose_friend(friend_to_lose, current_user)
-            return Response(f"Вы удалили {friend_to_lose} из друзей", status.HTTP_201_CREATED)
+        return Response(f"Вы удалили {friend_to_lose} из друзей", status.HTTP_201_CREATED)
+
+
+class BulkFriendRequestView(APIView):
+    """
+    Базовое представление для массовых операций с заявками в друзья по списку имен пользователей.
+    Подклассы задают операцию в атрибуте action.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    action = None
+
+    def post(self, request):
+        """
+        Выполняет операцию для всех пользователей из списка в одной транзакции.
+
+        :param request: HTTP-запрос с токеном и списком usernames.
+        :return: Response с результатом для каждого имени пользователя либо ошибки валидации.
+        """
+        serializer = UsernameListSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        results = self.action(request.user, serializer.validated_data["usernames"])
+        return Response({"results": results}, status.HTTP_200_OK)
+
+
+BULK_SCHEMA = dict(
+    request_body=UsernameListSerializer,
+    manual_parameters=[
+        openapi.Parameter(
+            "Authorization",
+            openapi.IN_HEADER,
+            description="Токен пользователя (формат: Token <ключ>)",
+            type=openapi.TYPE_STRING,
+        )
+    ],
+    responses={200: "results: [{username, status}]", 400: "Некорректный список usernames"},
+)
+
+
+class BulkSendRequests(BulkFriendRequestView):
+    """
+    Представление для отправки заявок в друзья списку пользователей.
+
+    Статусы: sent, accepted (была встречная заявка), already_sent, already_friends, self, not_found.
+    """
+
+    action = staticmethod(services.bulk_send_requests)
+
+    @swagger_auto_schema(**BULK_SCHEMA)
+    def post(self, request):
+        return super().post(request)
+
+
+class BulkAcceptRequests(BulkFriendRequestView):
+    """
+    Представление для принятия заявок в друзья от списка пользователей.
+
+    Статусы: accepted, no_request, not_found.
+    """
+
+    action = staticmethod(services.bulk_accept_requests)
+
+    @swagger_auto_schema(**BULK_SCHEMA)
+    def post(self, request):
+        return super().post(request)
+
+
+class BulkRejectRequests(BulkFriendRequestView):
+    """
+    Представление для отклонения заявок в друзья от списка пользователей.
+
+    Статусы: rejected, no_request, not_found.
+    """
+
+    action = staticmethod(services.bulk_reject_requests)
+
+    @swagger_auto_schema(**BULK_SCHEMA)
+    def post(self, request):
+        return super().post(request)
+
+
+class GraphExport(APIView):
+    """
+    Представление для потоковой выгрузки графа друзей текущего пользователя в NDJSON или CSV.
+    Администратор может выгрузить весь граф параметром scope=all.
+    Доступ разрешен только аутентифицированным пользователям.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Authorization",
+                openapi.IN_HEADER,
+                description="Токен пользователя (формат: Token <ключ>)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "format",
+                openapi.IN_QUERY,
+                description="Формат выгрузки",
+                type=openapi.TYPE_STRING,
+                enum=list(export.FORMATS),
+            ),
+            openapi.Parameter(
+                "scope",
+                openapi.IN_QUERY,
+                description="all - весь граф (только для администраторов)",
+                type=openapi.TYPE_STRING,
+                enum=["user", "all"],
+            ),
+        ],
+        responses={
+            200: "Записи user, friendship и friend_request",
+            401: "Authentication credentials were not provided",
+            403: "Выгрузка всего графа доступна только администраторам",
+        },
+    )
+    def get(self, request, format=None):
+        """
+        Возвращает потоковый ответ с записями пользователей, дружб и заявок в друзья.
+
+        Строки читаются из базы пачками по мере отправки ответа, поэтому память процесса
+        не зависит от размера графа.
+
+        :param request: HTTP-запрос с токеном в заголовке.
+        :param format: Формат выгрузки (ndjson или csv), также выбирается заголовком Accept.
+        :return: StreamingHttpResponse с выгрузкой.
+        """
+        user = request.user
+        if request.query_params.get("scope") == "all":
+            if not user.is_staff:
+                return Response(
+                    {"detail": "Выгрузка всего графа доступна только администраторам"}, status.HTTP_403_FORBIDDEN
+                )
+            user = None
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            export.iter_export(renderer.format, user=user),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        filename = f"friends-{user.username if user else 'all'}.{renderer.format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response